@@ -1,9 +1,10 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from config.config import Config
+from app.services.db_routing import RoutingSession
 
-# 创建数据库实例
-db = SQLAlchemy()
+# 创建数据库实例（会话按请求把查询路由到主库或只读引擎，见 app/services/db_routing.py）
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def create_app():
     # 创建Flask应用实例
@@ -12,18 +13,46 @@ def create_app():
     # 加载配置
     app.config.from_object(Config)
     
-    # 初始化数据库
+    # 初始化数据库：连接池参数须在创建引擎之前设置，连接时执行的 PRAGMA 在创建引擎之后注册
+    from app.services import database_profile
+    database_profile.configure(app)
     db.init_app(app)
+    database_profile.init_app(app)
+    
+    # 读写分离（配置 DATABASE_READ_ROUTING 时）
+    from app.services import db_routing
+    db_routing.init_app(app)
     
     # 导入并注册蓝图
     from app.views.main import main_bp
     from app.views.admin import admin_bp
     from app.views.student import student_bp
     from app.views.dorm_manager import dorm_manager_bp
+    from app.views.repair_queue import repair_queue_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(student_bp, url_prefix='/student')
     app.register_blueprint(dorm_manager_bp, url_prefix='/dorm_manager')
+    app.register_blueprint(repair_queue_bp, url_prefix='/repair_queue')
+    
+    # 注册数据维护事件
+    from app.services import utility_rollups, dashboard_stats, vacancy, identity, live_feed, repair_search
+    utility_rollups.register_events()
+    dashboard_stats.register_events()
+    vacancy.register_events()
+    identity.register_events()
+    live_feed.register_events()
+    repair_search.register_events()
+    
+    # SQL语句计数（配置上限时检查 N+1 查询）、请求性能指标与慢查询记录
+    from app.services import query_budget, metrics, slow_queries
+    query_budget.init_app(app)
+    metrics.init_app(app)
+    slow_queries.init_app(app)
+    
+    # 注册命令行命令
+    from app.commands import register_commands
+    register_commands(app)
     
     return app
\ No newline at end of file
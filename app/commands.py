@@ -0,0 +1,134 @@
+# 命令行命令，使用方式：flask --app run <命令>
+import os
+
+import click
+
+from app import db
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_db_command():
+        """建表（部署时执行一次，可重复执行）；之后须执行 create-admin 创建超级管理员"""
+        from app.services.bootstrap import init_database
+        from app.services.repair_search import ensure_index
+        init_database()
+        click.echo(f'数据库表已创建：{db.engine.url.render_as_string(hide_password=True)}')
+        if ensure_index():
+            click.echo('已为现有报修建立全文索引')
+
+    @app.cli.command('ensure-db')
+    def ensure_db_command():
+        """gunicorn 启动时执行：建出缺失的表，设置了环境变量 ADMIN_PASSWORD 时创建超级管理员
+        （用户名 ADMIN_USERNAME，默认 123）；没有任何管理员且未设置 ADMIN_PASSWORD 时报错退出"""
+        from app.services.bootstrap import ensure_database, has_admin
+        created, admin_created = ensure_database()
+        if created:
+            click.echo('数据库表已创建')
+        if admin_created:
+            click.echo('超级管理员已创建')
+        if not has_admin():
+            raise click.ClickException('数据库中没有超级管理员：请设置环境变量 ADMIN_PASSWORD（可选 ADMIN_USERNAME）'
+                                       '后重新启动，或执行 flask --app run create-admin')
+
+    @app.cli.command('create-admin')
+    @click.option('--username', default='123', show_default=True, help='管理员用户名')
+    @click.option('--password', envvar='ADMIN_PASSWORD', prompt=True, hide_input=True,
+                  confirmation_prompt=True, help='管理员密码，也可用环境变量 ADMIN_PASSWORD 指定')
+    def create_admin_command(username, password):
+        """创建超级管理员（用户名已存在时不修改）"""
+        from app.services.bootstrap import create_admin
+        if create_admin(username, password):
+            click.echo(f'超级管理员创建成功：账号{username}')
+        else:
+            click.echo(f'用户 {username} 已存在，未修改')
+
+    @app.cli.command('rebuild-utility-rollups')
+    def rebuild_utility_rollups():
+        """用 GROUP BY 重新计算水电费汇总表"""
+        from app.services.utility_rollups import rebuild_rollups
+        count = rebuild_rollups()
+        db.session.commit()
+        click.echo(f'水电费汇总表已重建，共 {count} 个楼栋/月份')
+
+    @app.cli.command('rebuild-repair-search')
+    def rebuild_repair_search():
+        """重建报修全文索引（直接用 SQL 批量写入报修后执行）"""
+        from app.services.repair_search import rebuild_index
+        count = rebuild_index()
+        if count is None:
+            raise click.ClickException('全文索引仅支持 SQLite，其他数据库按 LIKE 搜索，无需重建')
+        db.session.commit()
+        click.echo(f'报修全文索引已重建，共 {count} 条报修')
+
+    @app.cli.command('upgrade-indexes')
+    def upgrade_indexes_command():
+        """为已有数据库补建模型中声明的索引（可重复执行）"""
+        from app.services.index_migration import upgrade_indexes
+        result = upgrade_indexes(progress=lambda name: click.echo(f'正在创建索引 {name} ...'))
+        for name, reason in result.skipped:
+            click.echo(f'跳过 {name}：{reason}', err=True)
+        click.echo(f'索引补建完成：新建 {len(result.created)} 个，已存在 {len(result.existing)} 个，'
+                   f'跳过 {len(result.skipped)} 个')
+
+    @app.cli.command('reconcile-occupancy')
+    @click.option('--dry-run', is_flag=True, help='只报告人数不符的宿舍，不修改')
+    def reconcile_occupancy_command(dry_run):
+        """按实际住着的未删除学生数核对并修正宿舍入住人数（可每晚定时执行）"""
+        from app.services.occupancy import reconcile_occupancy
+        result = reconcile_occupancy(apply=not dry_run)
+        for _dorm_id, dorm_number, stored, actual, capacity in result.mismatches:
+            over = '，已超员' if actual > (capacity or 0) else ''
+            click.echo(f'{dorm_number}：记录 {stored}，实际 {actual}，容量 {capacity}{over}')
+        summary = f'核对 {result.checked} 间宿舍，不符 {len(result.mismatches)} 间，累计偏差 {result.drift} 人'
+        if not dry_run:
+            summary += f'，已修正 {result.fixed} 间'
+            if result.skipped:
+                summary += f'，{result.skipped} 间在核对期间被改动，未修正'
+        click.echo(summary)
+
+    @app.cli.command('import-students')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--workers', type=int, default=None, help='计算密码哈希的进程数，默认为CPU核数')
+    def import_students_command(path, workers):
+        """从 CSV / XLSX 文件批量导入学生"""
+        from app.services.student_import import read_rows, import_students, StudentImportError
+        with open(path, 'rb') as stream:
+            try:
+                result = import_students(read_rows(stream, path), workers=workers or os.cpu_count() or 1)
+            except StudentImportError as e:
+                raise click.ClickException(str(e))
+        for row_number, error in result.errors:
+            click.echo(f'第 {row_number} 行：{error}', err=True)
+        click.echo(f'导入完成：成功 {result.imported} 人，失败 {len(result.errors)} 行')
+
+    @app.cli.command('run-utility-bills')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--month', required=True, help='出账月份，格式 YYYY-MM')
+    def run_utility_bills(path, month):
+        """按整月抄表CSV批量生成或更新水电费账单"""
+        from app.services.bill_runs import run_bill_batch, BillRunError
+        with open(path, 'rb') as stream:
+            try:
+                result = run_bill_batch(stream, month,
+                                        progress=lambda done, total: click.echo(f'已写入 {done}/{total}'))
+            except BillRunError as e:
+                raise click.ClickException(str(e))
+        for row_number, message in result.errors + result.skipped:
+            click.echo(f'第 {row_number} 行：{message}', err=True)
+        click.echo(f'{month} 出账完成：新建 {result.inserted}，更新 {result.updated}，'
+                   f'跳过 {len(result.skipped)}，错误 {len(result.errors)}')
+
+    @app.cli.command('reprice-utility-bills')
+    @click.option('--from', 'month_from', required=True, help='起始月份，格式 YYYY-MM')
+    @click.option('--to', 'month_to', required=True, help='截止月份，格式 YYYY-MM')
+    @click.option('--building', default=None, help='只重算该楼栋')
+    def reprice_utility_bills(month_from, month_to, building):
+        """按当前价目表批量重算一段时间内未缴费的水电费账单"""
+        from app.services.tariffs import reprice_bills, TariffError
+        try:
+            result = reprice_bills(month_from, month_to, building=building,
+                                   progress=lambda done, total: click.echo(f'已写入 {done}/{total}'))
+        except TariffError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'重算完成：更新 {result.updated} 张，已缴费未改动 {result.skipped_paid} 张')
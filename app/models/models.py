@@ -1,6 +1,11 @@
 from app import db
 from datetime import datetime
 
+# 索引（见各模型的 __table_args__）：新库由 db.create_all() 创建，
+# 已有数据库用 flask --app run upgrade-indexes 补建（见 app/services/index_migration.py）。
+# 带软删除标记的表，列表只查未删除的记录，在 SQLite 上建为部分索引；MySQL 不支持部分索引，建为普通索引。
+LIVE_ROWS = db.text('is_deleted = 0')
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -53,6 +58,13 @@ class Student(db.Model):
     repairs = db.relationship('Repair', backref='student', lazy=True)
     visitors = db.relationship('Visitor', backref='student', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_students_user_id', 'user_id'),
+        db.Index('ix_students_dorm_id', 'dorm_id'),
+        # 学生列表按姓名排序的游标分页（见 app/services/listing.py）
+        db.Index('ix_students_live_name', 'name', 'id', sqlite_where=LIVE_ROWS),
+    )
+    
     def __repr__(self):
         return f'<Student {self.name}>'
 
@@ -66,6 +78,10 @@ class DormManager(db.Model):
     responsible_building = db.Column(db.String(20), nullable=False)  # 负责的楼栋
     is_deleted = db.Column(db.Boolean, default=False)  # 软删除标记
     
+    __table_args__ = (
+        db.Index('ix_dorm_managers_user_id', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<DormManager {self.name}>'
 
@@ -84,6 +100,10 @@ class Dormitory(db.Model):
     students = db.relationship('Student', backref='dormitory', lazy=True)
     repairs = db.relationship('Repair', backref='dormitory', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_dormitories_building', 'building'),
+    )
+    
     def __repr__(self):
         return f'<Dormitory {self.dorm_number}>'
 
@@ -105,9 +125,38 @@ class Repair(db.Model):
     urgent_level = db.Column(db.String(20), default='normal')  # normal, urgent, very_urgent
     is_deleted = db.Column(db.Boolean, default=False)  # 软删除标记
     
+    # 列表按提交时间倒序、可按状态筛选，只看未删除的记录
+    __table_args__ = (
+        db.Index('ix_repairs_live_created_at', 'created_at', 'id', sqlite_where=LIVE_ROWS),
+        db.Index('ix_repairs_live_status', 'status', 'created_at', 'id', sqlite_where=LIVE_ROWS),
+        # 派单队列：每个紧急程度内按提交时间取最早的待处理报修
+        db.Index('ix_repairs_live_dispatch', 'status', 'urgent_level', 'created_at', 'id', sqlite_where=LIVE_ROWS),
+        db.Index('ix_repairs_student_id', 'student_id'),
+        db.Index('ix_repairs_dorm_id', 'dorm_id'),
+    )
+    
     def __repr__(self):
         return f'<Repair {self.title}>'
 
+class RepairClaim(db.Model):
+    __tablename__ = 'repair_claims'
+    
+    # 报修当前由谁处理：领取时创建，退回时删除，完成时记录完成时间
+    repair_id = db.Column(db.Integer, db.ForeignKey('repairs.id'), primary_key=True)
+    claimed_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    claimed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    repair = db.relationship('Repair', backref=db.backref('claim', uselist=False))
+    claimer = db.relationship('User')
+    
+    __table_args__ = (
+        db.Index('ix_repair_claims_claimed_by', 'claimed_by'),
+    )
+    
+    def __repr__(self):
+        return f'<RepairClaim {self.repair_id} by {self.claimed_by}>'
+
 class Visitor(db.Model):
     __tablename__ = 'visitors'
     
@@ -125,6 +174,14 @@ class Visitor(db.Model):
     is_deleted = db.Column(db.Boolean, default=False)  # 软删除标记
     qr_code = db.Column(db.String(200), nullable=True)  # 访客二维码路径
     
+    # 列表按来访时间倒序、可按状态筛选，只看未删除的记录；楼栋筛选按宿舍号关联
+    __table_args__ = (
+        db.Index('ix_visitors_live_visit_date', 'visit_date', 'id', sqlite_where=LIVE_ROWS),
+        db.Index('ix_visitors_live_status', 'status', 'visit_date', 'id', sqlite_where=LIVE_ROWS),
+        db.Index('ix_visitors_student_id', 'student_id'),
+        db.Index('ix_visitors_dorm_number', 'dorm_number'),
+    )
+    
     def __repr__(self):
         return f'<Visitor {self.name}>'
 
@@ -149,9 +206,70 @@ class UtilityBill(db.Model):
     dormitory = db.relationship('Dormitory', backref='utility_bills')
     payments = db.relationship('Payment', backref='utility_bill', lazy=True)
     
+    # 每间宿舍每月只有一张账单
+    __table_args__ = (
+        db.Index('uq_utility_bills_dorm_month', 'dorm_id', 'month', unique=True),
+        db.Index('ix_utility_bills_month', 'month', 'dorm_id'),
+        db.Index('ix_utility_bills_status_month', 'status', 'month'),
+    )
+    
     def __repr__(self):
         return f'<UtilityBill {self.dorm_id}-{self.month}>'
 
+# 水电费按楼栋、月份的汇总表，随账单增删改增量维护（见 app/services/utility_rollups.py）
+class UtilityRollup(db.Model):
+    __tablename__ = 'utility_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    building = db.Column(db.String(20), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # 格式：YYYY-MM
+    bill_count = db.Column(db.Integer, default=0)  # 账单数
+    electricity = db.Column(db.Float, default=0)  # 用电量
+    water = db.Column(db.Float, default=0)  # 用水量
+    electricity_cost = db.Column(db.Float, default=0)  # 电费
+    water_cost = db.Column(db.Float, default=0)  # 水费
+    total_cost = db.Column(db.Float, default=0)  # 总费用
+    
+    __table_args__ = (
+        db.UniqueConstraint('building', 'month', name='uq_utility_rollups_building_month'),
+    )
+    
+    def __repr__(self):
+        return f'<UtilityRollup {self.building}-{self.month}>'
+
+# 水电费价目表（见 app/services/tariffs.py）
+# 按楼栋（为空表示全校默认）和生效月份区间配置，不在原记录上修改：
+# 调价时新增一个版本，同一楼栋、月份有多个版本时以最新的为准。
+class Tariff(db.Model):
+    __tablename__ = 'tariffs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    building = db.Column(db.String(20), nullable=True)  # 为空表示全校默认
+    month_from = db.Column(db.String(7), nullable=False)  # 生效起始月份（含），格式：YYYY-MM
+    month_to = db.Column(db.String(7), nullable=True)  # 生效截止月份（含），为空表示长期有效
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 关系
+    tiers = db.relationship('TariffTier', backref='tariff', lazy=True, cascade='all, delete-orphan',
+                            order_by='TariffTier.utility, TariffTier.lower_bound')
+    
+    def __repr__(self):
+        return f'<Tariff {self.name}>'
+
+# 阶梯价格：用量超过 lower_bound 的部分按 price 计价，直到下一档的起点
+class TariffTier(db.Model):
+    __tablename__ = 'tariff_tiers'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tariff_id = db.Column(db.Integer, db.ForeignKey('tariffs.id'), nullable=False)
+    utility = db.Column(db.String(20), nullable=False)  # electricity, water
+    lower_bound = db.Column(db.Float, nullable=False, default=0)  # 本档起始用量
+    price = db.Column(db.Float, nullable=False)  # 单价（元/度、元/吨）
+    
+    def __repr__(self):
+        return f'<TariffTier {self.utility} {self.lower_bound}+ {self.price}>'
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     
@@ -166,6 +284,12 @@ class Payment(db.Model):
     # 关系
     student = db.relationship('Student', backref='payments')
     
+    __table_args__ = (
+        db.Index('ix_payments_payment_date', 'payment_date', 'id'),
+        db.Index('ix_payments_bill_id', 'bill_id'),
+        db.Index('ix_payments_student_id', 'student_id'),
+    )
+    
     def __repr__(self):
         return f'<Payment {self.id}>'
 
@@ -189,5 +313,34 @@ class DormChangeRequest(db.Model):
     target_dorm = db.relationship('Dormitory', foreign_keys=[target_dorm_id], backref='target_dorm_change_requests')
     approver = db.relationship('User', backref='approved_dorm_changes')
     
+    __table_args__ = (
+        db.Index('ix_dorm_change_requests_created_at', 'created_at', 'id'),
+        db.Index('ix_dorm_change_requests_status', 'status', 'created_at', 'id'),
+        db.Index('ix_dorm_change_requests_student_id', 'student_id'),
+    )
+    
+    def __repr__(self):
+        return f'<DormChangeRequest {self.id}>'
+
+# 进程内缓存的版本号：数据变化时在同一事务内加一，各进程据此判断本地缓存是否过期（见 app/services/vacancy.py）
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+# 智能分配的预览方案（见 app/services/allocation.py）：存在数据库中，确认或下载时任一 worker 都能取回
+class AllocationPlanRecord(db.Model):
+    __tablename__ = 'allocation_plans'
+    
+    plan_id = db.Column(db.String(32), primary_key=True)
+    strategy = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # 过期后不能再应用，下次预览时清理
+    data = db.Column(db.Text(2 ** 32 - 1), nullable=False)  # JSON：学生、宿舍、分配结果、数据指纹和统计；MySQL 上为 LONGTEXT
+    
     def __repr__(self):
-        return f'<DormChangeRequest {self.id}>'
\ No newline at end of file
+        return f'<AllocationPlanRecord {self.plan_id}>'
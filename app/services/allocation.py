@@ -0,0 +1,359 @@
+# 宿舍分配引擎
+# 一次性加载候选宿舍和已入住学生画像，在内存中建立按 (性别, 专业, 年级) 的索引，
+# 单次遍历完成分配，最后一次性批量写回数据库。
+# 也可以只预览：方案按 plan_id 存入 allocation_plans 表（JSON），确认后原样写入。
+# 预览、确认和下载CSV可能落在不同的 worker 上，所以不能放在进程内缓存中。
+import csv
+import heapq
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models.models import AllocationPlanRecord, Student, Dormitory
+from app.services.occupancy import OccupancyError, assign_students
+from app.services.vacancy import get_index
+
+# 预览方案30分钟内有效
+PLAN_TTL = 30 * 60
+_plan_rows = AllocationPlanRecord.__table__
+
+
+class AllocationPlanError(Exception):
+    """分配方案不存在、已过期或与当前数据不一致"""
+
+
+class AllocationContext:
+    """分配所需的全部数据快照（纯Python元组，不持有ORM对象）"""
+
+    def __init__(self, students, dorms, occupants):
+        # students: [(id, gender, major, grade, student_no, name)]，按学生ID排序
+        self.students = students
+        # dorms: [(id, building, gender, capacity, current_occupancy, dorm_number)]
+        self.dorms = dorms
+        # occupants: [(dorm_id, major, grade)]，已入住学生的画像
+        self.occupants = occupants
+
+
+def load_allocation_context():
+    """用三条查询加载分配所需数据（宿舍未变化时宿舍部分直接用缓存）"""
+    students = db.session.query(
+        Student.id, Student.gender, Student.major, Student.grade,
+        Student.student_id, Student.name
+    ).filter(Student.dorm_id.is_(None), Student.is_deleted == False).order_by(Student.id).all()
+
+    # 宿舍取自空床位索引的快照，宿舍数据未变化时不再查询
+    dorms = [(room.id, room.building, room.gender, room.capacity, room.current_occupancy, room.dorm_number)
+             for room in get_index().rooms.values()]
+
+    occupants = db.session.query(
+        Student.dorm_id, Student.major, Student.grade
+    ).filter(Student.dorm_id.isnot(None), Student.is_deleted == False).all()
+
+    return AllocationContext(
+        [tuple(row) for row in students],
+        [tuple(row) for row in dorms],
+        [tuple(row) for row in occupants],
+    )
+
+
+def _profile_keys(gender, major, grade):
+    # 与原分配规则的优先级一一对应：同专业同年级 > 同专业 > 同年级
+    return (
+        ('major_grade', gender, major, grade),
+        ('major', gender, major),
+        ('grade', gender, grade),
+    )
+
+
+def plan_tiered(context):
+    """按原有的分层优先级规则计算分配方案，返回 [(student_id, dorm_id)]
+
+    规则：同性别、未满员；优先同专业同年级，其次同专业，再次同年级，
+    最后任意同性别宿舍；同一层级内选择当前人数最多的宿舍（人数相同取ID最小）。
+    """
+    occupancy = {}
+    capacity = {}
+    dorm_gender = {}
+    dorm_keys = {}
+    # 每个索引键对应一个最大堆 (-当前人数, 宿舍ID)，过期条目在弹出时惰性丢弃
+    heaps = {}
+
+    def push(key, dorm_id):
+        heapq.heappush(heaps.setdefault(key, []), (-occupancy[dorm_id], dorm_id))
+
+    def join_key(dorm_id, key):
+        if key not in dorm_keys[dorm_id]:
+            dorm_keys[dorm_id].add(key)
+            if occupancy[dorm_id] < capacity[dorm_id]:
+                push(key, dorm_id)
+
+    for dorm_id, _building, gender, cap, occ, *_labels in context.dorms:
+        occupancy[dorm_id] = occ or 0
+        capacity[dorm_id] = cap or 0
+        dorm_gender[dorm_id] = gender
+        dorm_keys[dorm_id] = set()
+        join_key(dorm_id, ('any', gender))
+
+    for dorm_id, major, grade in context.occupants:
+        if dorm_id not in dorm_keys:
+            continue
+        for key in _profile_keys(dorm_gender[dorm_id], major, grade):
+            join_key(dorm_id, key)
+
+    def best(key):
+        heap = heaps.get(key)
+        while heap:
+            neg_occ, dorm_id = heap[0]
+            if -neg_occ == occupancy[dorm_id] and occupancy[dorm_id] < capacity[dorm_id]:
+                return dorm_id
+            heapq.heappop(heap)
+        return None
+
+    assignments = []
+    for student_id, gender, major, grade, *_labels in context.students:
+        keys = _profile_keys(gender, major, grade) + (('any', gender),)
+        selected = None
+        for key in keys:
+            selected = best(key)
+            if selected is not None:
+                break
+        if selected is None:
+            continue
+
+        assignments.append((student_id, selected))
+        occupancy[selected] += 1
+        # 新入住的学生成为后续学生的室友画像
+        for key in _profile_keys(gender, major, grade):
+            dorm_keys[selected].add(key)
+        if occupancy[selected] < capacity[selected]:
+            for key in dorm_keys[selected]:
+                push(key, selected)
+
+    return assignments
+
+
+def plan_global(context):
+    """全局匹配度分配（依赖 NumPy，按需导入）"""
+    from app.services.cohesion import plan_global as _plan_global
+    return _plan_global(context)
+
+
+# 分配策略：tiered 为原有分层优先规则，global 为按匹配度矩阵的全局分配
+STRATEGIES = {
+    'tiered': plan_tiered,
+    'global': plan_global,
+}
+DEFAULT_STRATEGY = 'tiered'
+
+
+def make_plan(context, strategy=DEFAULT_STRATEGY):
+    planner = STRATEGIES.get(strategy, STRATEGIES[DEFAULT_STRATEGY])
+    return planner(context)
+
+
+def apply_assignments(assignments):
+    """把分配方案批量写回数据库（学生宿舍与宿舍人数各一次 executemany），不提交事务
+
+    人数在数据库端带容量条件累加（见 occupancy.assign_students），与其他入住操作并发时
+    宿舍住满或学生已被分配则抛出 OccupancyError。
+    """
+    if not assignments:
+        return 0
+    assign_students(assignments)
+    return len(assignments)
+
+
+def smart_allocate(strategy=DEFAULT_STRATEGY):
+    """为所有未分配宿舍的学生分配宿舍并提交，返回分配人数"""
+    context = load_allocation_context()
+    assignments = make_plan(context, strategy)
+    try:
+        allocated_count = apply_assignments(assignments)
+    except OccupancyError as e:
+        db.session.rollback()
+        raise AllocationPlanError(str(e))
+    db.session.commit()
+    return allocated_count
+
+
+class AllocationPlan:
+    """一次预览得到的分配方案（只保留应用和导出CSV所需的数据）"""
+
+    def __init__(self, plan_id, created_at, strategy, students, dorms, assignments, snapshot, stats):
+        self.plan_id = plan_id
+        self.created_at = created_at
+        self.strategy = strategy
+        # students: 待分配学生，格式同 AllocationContext.students；dorms: {宿舍ID: (楼栋, 宿舍号)}，只含方案用到的宿舍
+        self.students = students
+        self.dorms = dorms
+        self.assignments = assignments
+        # 计算方案时的数据指纹，应用前用来判断数据是否已变化
+        self.snapshot = snapshot
+        self.stats = stats
+
+    def to_json(self):
+        return json.dumps({
+            'students': self.students,
+            'dorms': [[dorm_id, building, dorm_number] for dorm_id, (building, dorm_number) in self.dorms.items()],
+            'assignments': self.assignments,
+            'snapshot': self.snapshot,
+            'stats': self.stats,
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_row(cls, row):
+        data = json.loads(row.data)
+        return cls(row.plan_id, row.created_at, row.strategy,
+                   [tuple(student) for student in data['students']],
+                   {dorm_id: (building, dorm_number) for dorm_id, building, dorm_number in data['dorms']},
+                   [tuple(assignment) for assignment in data['assignments']],
+                   tuple(data['snapshot']), data['stats'])
+
+
+def _snapshot():
+    """一条聚合查询得到当前未分配人数和宿舍入住情况的指纹"""
+    # MySQL 上 SUM 返回 Decimal，统一转为整数以便存成 JSON 后比较
+    return tuple(int(value) for value in db.session.execute(select(
+        select(func.count(Student.id)).where(Student.dorm_id.is_(None)).scalar_subquery(),
+        select(func.coalesce(func.max(Student.id), 0)).scalar_subquery(),
+        select(func.count(Dormitory.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(Dormitory.capacity), 0)).scalar_subquery(),
+        select(func.coalesce(func.sum(Dormitory.current_occupancy), 0)).scalar_subquery(),
+    )).one())
+
+
+def summarize_plan(context, assignments):
+    """统计方案效果：各楼栋入住率、同专业/同年级聚集度、未能分配的人数"""
+    dorm_info = {dorm_id: (building, cap or 0, occ or 0)
+                 for dorm_id, building, _gender, cap, occ, *_labels in context.dorms}
+    profiles = {student_id: (major, grade)
+                for student_id, _gender, major, grade, *_labels in context.students}
+
+    # 每间宿舍最终的住户画像：原有住户 + 本次分配
+    members = {}
+    for dorm_id, major, grade in context.occupants:
+        members.setdefault(dorm_id, []).append((major, grade))
+    for student_id, dorm_id in assignments:
+        members.setdefault(dorm_id, []).append(profiles[student_id])
+
+    buildings = {}
+    for dorm_id, (building, cap, occ) in dorm_info.items():
+        stat = buildings.setdefault(building, {'capacity': 0, 'before': 0, 'added': 0})
+        stat['capacity'] += cap
+        stat['before'] += occ
+    for _student_id, dorm_id in assignments:
+        buildings[dorm_info[dorm_id][0]]['added'] += 1
+    for stat in buildings.values():
+        after = stat['before'] + stat['added']
+        stat['after'] = after
+        stat['fill_rate'] = round(after * 100.0 / stat['capacity'], 1) if stat['capacity'] else 0.0
+
+    # 聚集度：新分配的学生中，至少有一名室友与其同专业同年级/同专业/同年级的比例
+    same_major_grade = same_major = same_grade = 0
+    for student_id, dorm_id in assignments:
+        major, grade = profiles[student_id]
+        roommates = list(members[dorm_id])
+        roommates.remove((major, grade))
+        if (major, grade) in roommates:
+            same_major_grade += 1
+        if any(m == major for m, _g in roommates):
+            same_major += 1
+        if any(g == grade for _m, g in roommates):
+            same_grade += 1
+
+    total = len(assignments)
+
+    def percent(count):
+        return round(count * 100.0 / total, 1) if total else 0.0
+
+    return {
+        'total_students': len(context.students),
+        'allocated': total,
+        'unplaced': len(context.students) - total,
+        'major_grade_cohesion': percent(same_major_grade),
+        'major_cohesion': percent(same_major),
+        'grade_cohesion': percent(same_grade),
+        'buildings': dict(sorted(buildings.items())),
+    }
+
+
+def preview_allocation(strategy=DEFAULT_STRATEGY):
+    """计算分配方案并存入 allocation_plans 表（不改动学生和宿舍），同时清理已过期的方案"""
+    if strategy not in STRATEGIES:
+        strategy = DEFAULT_STRATEGY
+    snapshot = _snapshot()
+    context = load_allocation_context()
+    assignments = make_plan(context, strategy)
+    used = {dorm_id for _student_id, dorm_id in assignments}
+    plan = AllocationPlan(
+        uuid.uuid4().hex, datetime.utcnow(), strategy, context.students,
+        {dorm_id: (building, dorm_number)
+         for dorm_id, building, _gender, _cap, _occ, dorm_number in context.dorms if dorm_id in used},
+        assignments, snapshot, summarize_plan(context, assignments))
+
+    db.session.execute(_plan_rows.delete().where(_plan_rows.c.expires_at < plan.created_at))
+    db.session.execute(_plan_rows.insert().values(
+        plan_id=plan.plan_id, strategy=plan.strategy, created_at=plan.created_at,
+        expires_at=plan.created_at + timedelta(seconds=PLAN_TTL), data=plan.to_json()))
+    db.session.commit()
+    return plan
+
+
+def get_plan(plan_id):
+    row = db.session.execute(
+        select(_plan_rows).where(_plan_rows.c.plan_id == plan_id, _plan_rows.c.expires_at >= datetime.utcnow())
+    ).first()
+    if row is None:
+        raise AllocationPlanError('分配方案不存在或已过期，请重新预览！')
+    return AllocationPlan.from_row(row)
+
+
+def _discard_plan(plan_id):
+    db.session.execute(_plan_rows.delete().where(_plan_rows.c.plan_id == plan_id))
+    db.session.commit()
+
+
+def apply_plan(plan_id):
+    """在一个事务内原样写入已预览的方案并删除方案，返回分配人数"""
+    plan = get_plan(plan_id)
+    if _snapshot() != plan.snapshot:
+        _discard_plan(plan_id)
+        raise AllocationPlanError('预览后学生或宿舍数据已变化，请重新预览！')
+
+    # 删除方案与写入分配在同一事务中：同一方案被重复提交（可能在不同 worker 上）时只有一次能删到
+    claimed = db.session.execute(_plan_rows.delete().where(_plan_rows.c.plan_id == plan_id))
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        raise AllocationPlanError('该分配方案已被应用，请重新预览！')
+    try:
+        allocated_count = apply_assignments(plan.assignments)
+    except OccupancyError as e:
+        db.session.rollback()
+        _discard_plan(plan_id)
+        raise AllocationPlanError(str(e))
+    db.session.commit()
+    return allocated_count
+
+
+def export_plan_csv(plan):
+    """把方案导出为CSV文本（带BOM，Excel可直接打开）"""
+    students = {row[0]: row for row in plan.students}
+
+    output = io.StringIO()
+    output.write('\ufeff')
+    writer = csv.writer(output)
+    writer.writerow(['学号', '姓名', '性别', '专业', '年级', '楼栋', '宿舍号'])
+    assigned = set()
+    for student_id, dorm_id in plan.assignments:
+        _id, gender, major, grade, student_no, name = students[student_id]
+        building, dorm_number = plan.dorms[dorm_id]
+        writer.writerow([student_no, name, gender, major, grade, building, dorm_number])
+        assigned.add(student_id)
+    for _id, gender, major, grade, student_no, name in plan.students:
+        if _id not in assigned:
+            writer.writerow([student_no, name, gender, major, grade, '', '未分配'])
+    return output.getvalue()
@@ -0,0 +1,175 @@
+# 月末批量出账：读入整月的抄表CSV，按价目表向量化计算费用，一次性写入
+# 抄表文件每行一个宿舍：宿舍号、用电量（度）、用水量（吨）。
+# 同月已有账单用一条查询找出；未缴费的更新、已缴费的跳过，其余新建，
+# 全部在同一个事务中完成。批量写入绕过了会话事件，涉及楼栋的汇总表在事务内重算。
+import csv
+import io
+import re
+from datetime import datetime
+
+from sqlalchemy import bindparam, select
+
+from app import db
+from app.models.models import Dormitory, UtilityBill
+from app.services.tariffs import compute_costs
+from app.services.utility_rollups import AMOUNT_FIELDS, rebuild_rollups
+
+# 与单张录入账单一致：每月28号到期
+DUE_DAY = 28
+CHUNK_SIZE = 500
+
+COLUMNS = {
+    '宿舍号': 'dorm_number',
+    '用电量': 'electricity',
+    '用水量': 'water',
+}
+FIELDS = tuple(COLUMNS.values())
+LABELS = {field: label for label, field in COLUMNS.items()}
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+class BillRunError(Exception):
+    """整批无法执行（月份格式错误、文件无法解析等）"""
+
+
+class BillRunResult:
+    """出账结果：新建、更新、跳过（已缴费）的账单数与逐行错误 [(行号, 原因)]"""
+
+    def __init__(self, month):
+        self.month = month
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = []
+        self.errors = []
+
+
+def parse_readings(stream, result):
+    """解析抄表CSV，返回 [(行号, 宿舍号, 用电量, 用水量)]，格式错误的行记入 result.errors"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if header is None:
+            raise BillRunError('文件为空')
+        columns = [COLUMNS.get(name.strip(), name.strip() if name.strip() in FIELDS else None) for name in header]
+        missing = [LABELS[field] for field in FIELDS if field not in columns]
+        if missing:
+            raise BillRunError('缺少表头：' + '、'.join(missing))
+
+        readings = []
+        seen = {}
+        for row_number, values in enumerate(reader, start=2):
+            record = {field: value.strip() for field, value in zip(columns, values) if field}
+            if not any(record.values()):
+                continue
+            dorm_number = record.get('dorm_number')
+            if not dorm_number:
+                result.errors.append((row_number, '缺少宿舍号'))
+                continue
+            if dorm_number in seen:
+                result.errors.append((row_number, f'宿舍 {dorm_number} 与第 {seen[dorm_number]} 行重复'))
+                continue
+            try:
+                electricity, water = float(record.get('electricity') or 0), float(record.get('water') or 0)
+            except ValueError:
+                result.errors.append((row_number, '用电量或用水量不是数字'))
+                continue
+            if not (0 <= electricity < float('inf') and 0 <= water < float('inf')):
+                result.errors.append((row_number, '用电量和用水量须为非负数'))
+                continue
+            seen[dorm_number] = row_number
+            readings.append((row_number, dorm_number, electricity, water))
+        return readings
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise BillRunError(f'CSV 文件无法解析（需要 UTF-8 编码）：{exc}')
+    finally:
+        text.detach()
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        yield rows[start:start + CHUNK_SIZE]
+
+
+def run_bill_batch(stream, month, progress=None):
+    """按抄表文件为 month（YYYY-MM）出账并提交，返回 BillRunResult
+
+    progress(已写入, 总数) 在每写完一批后调用。
+    """
+    if not MONTH_PATTERN.match(month or ''):
+        raise BillRunError('月份格式应为 YYYY-MM')
+    result = BillRunResult(month)
+    readings = parse_readings(stream, result)
+
+    numbers = {reading[1] for reading in readings}
+    dorms = {number: (dorm_id, building) for dorm_id, number, building in db.session.execute(
+        select(Dormitory.id, Dormitory.dorm_number, Dormitory.building).where(Dormitory.dorm_number.in_(numbers))
+    )} if numbers else {}
+    existing = {dorm_id: (bill_id, status) for bill_id, dorm_id, status in db.session.execute(
+        select(UtilityBill.id, UtilityBill.dorm_id, UtilityBill.status).where(UtilityBill.month == month)
+    )}
+
+    known = []
+    for reading in readings:
+        if reading[1] in dorms:
+            known.append(reading)
+        else:
+            result.errors.append((reading[0], f'宿舍 {reading[1]} 不存在'))
+    electricity_cost, water_cost, total_cost = compute_costs(
+        [dorms[reading[1]][1] for reading in known], [month] * len(known),
+        [reading[2] for reading in known], [reading[3] for reading in known])
+
+    due_date = datetime.strptime(f'{month}-{DUE_DAY}', '%Y-%m-%d')
+    inserts, updates, buildings = [], [], set()
+    for i, (row_number, dorm_number, electricity, water) in enumerate(known):
+        dorm_id, building = dorms[dorm_number]
+        values = {
+            'b_electricity': electricity,
+            'b_water': water,
+            'b_electricity_cost': float(electricity_cost[i]),
+            'b_water_cost': float(water_cost[i]),
+            'b_total_cost': float(total_cost[i]),
+        }
+        bill = existing.get(dorm_id)
+        if bill is None:
+            inserts.append({'b_dorm_id': dorm_id, **values})
+        elif bill[1] == 'paid':
+            result.skipped.append((row_number, f'宿舍 {dorm_number} {month} 的账单已缴费，未覆盖'))
+            continue
+        else:
+            updates.append({'b_id': bill[0], **values})
+        buildings.add(building)
+
+    bills = UtilityBill.__table__
+    amounts = {f: bindparam('b_' + f) for f in AMOUNT_FIELDS}
+    insert = bills.insert().values(dorm_id=bindparam('b_dorm_id'), month=month, due_date=due_date,
+                                   status='unpaid', **amounts)
+    update = bills.update().where(bills.c.id == bindparam('b_id')).values(**amounts)
+
+    total = len(inserts) + len(updates)
+    done = 0
+    try:
+        for statement, rows in ((insert, inserts), (update, updates)):
+            for chunk in _chunks(rows):
+                db.session.execute(statement, chunk)
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+        if buildings:
+            rebuild_rollups(buildings=buildings)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    result.inserted, result.updated = len(inserts), len(updates)
+    return result
+
+
+def template_csv():
+    """抄表文件模板（带 BOM，Excel 可直接打开）"""
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(list(COLUMNS))
+    writer.writerow(['A101', '120.5', '8.2'])
+    return buffer.getvalue()
@@ -0,0 +1,55 @@
+# 数据库初始化与默认管理员
+# 原先在导入 run.py 时执行，每个 worker 启动（以及 max_requests 触发重启）都要重复一遍；
+# 现在只在部署时执行一次：flask --app run init-db、flask --app run create-admin。
+# SQLite 文件只存在于运行 web 进程的主机上，Procfile 平台的 release 阶段在另一个临时容器中执行，
+# 建的表到不了 web 进程；所以 gunicorn 主进程启动时（每台主机一次，见 gunicorn.conf.py 的 on_starting）
+# 在子进程中执行 flask --app run ensure-db，即 ensure_database()：建出缺失的表（新库全部建表，
+# 旧库补上后来新增的表，如 allocation_plans），设置了 ADMIN_PASSWORD 时创建管理员。
+# 数据库中没有任何管理员且未设置 ADMIN_PASSWORD 时 ensure-db 报错退出，gunicorn 不会启动
+# （原先导入时会创建默认管理员 123/123，现在部署时必须指定密码）。
+import os
+
+from sqlalchemy import inspect
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models.models import User
+
+DEFAULT_ADMIN_USERNAME = '123'
+DEFAULT_ADMIN_PASSWORD = '123'
+
+
+def init_database():
+    """创建 SQLite 文件所在目录并建表（已存在的表不受影响，可重复执行）"""
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        directory = os.path.dirname(os.path.abspath(url.database))
+        os.makedirs(directory, exist_ok=True)
+    db.create_all()
+
+
+def create_admin(username=DEFAULT_ADMIN_USERNAME, password=DEFAULT_ADMIN_PASSWORD):
+    """创建超级管理员，用户名已存在时不做修改；返回是否新建"""
+    if User.query.filter_by(username=username).first():
+        return False
+    db.session.add(User(username=username, password=generate_password_hash(password), role='admin'))
+    db.session.commit()
+    return True
+
+
+def has_admin():
+    return db.session.query(User.query.filter_by(role='admin').exists()).scalar()
+
+
+def ensure_database():
+    """建出缺失的表（已有的表不改动）；环境变量 ADMIN_PASSWORD 存在时创建管理员
+    （用户名 ADMIN_USERNAME，默认 123；已存在时不修改）。返回 (是否新库, 是否新建管理员)"""
+    from app.services.repair_search import ensure_index
+    created = not inspect(db.engine).has_table(User.__tablename__)
+    init_database()
+    if not created:
+        ensure_index()
+    password = os.environ.get('ADMIN_PASSWORD')
+    admin_created = bool(password) and create_admin(
+        os.environ.get('ADMIN_USERNAME') or DEFAULT_ADMIN_USERNAME, password)
+    return created, admin_created
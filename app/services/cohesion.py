@@ -0,0 +1,130 @@
+# 基于室友匹配度矩阵的全局分配（NumPy向量化）
+# 同画像（性别、专业、年级相同）的学生可以互换，因此按画像分组批量分配，
+# 不再逐个学生贪心，先处理匹配度最高的宿舍，避免先到先得。
+import numpy as np
+
+# 每名已入住室友带来的匹配分：同专业同年级 > 同专业 > 同年级，与分层规则的优先级一致
+WEIGHT_MAJOR_GRADE = 4
+WEIGHT_MAJOR = 2
+WEIGHT_GRADE = 1
+
+
+def _plan_gender(students, dorms, occupants):
+    """为同一性别的学生和宿舍计算分配方案
+
+    students: [(id, major, grade)]；dorms: [(id, capacity, occupancy)]；
+    occupants: [(dorm_id, major, grade)]
+    """
+    if not students or not dorms:
+        return []
+
+    # 编码：画像、专业、年级都映射为整数下标
+    profile_index = {}
+    members = []
+    for student_id, major, grade in students:
+        p = profile_index.setdefault((major, grade), len(profile_index))
+        if p == len(members):
+            members.append([])
+        members[p].append(student_id)
+    profiles = list(profile_index)
+    major_index = {}
+    grade_index = {}
+    for major, grade in profiles:
+        major_index.setdefault(major, len(major_index))
+        grade_index.setdefault(grade, len(grade_index))
+    profile_major = np.array([major_index[m] for m, _g in profiles], dtype=np.int64)
+    profile_grade = np.array([grade_index[g] for _m, g in profiles], dtype=np.int64)
+
+    dorm_ids = np.array([d[0] for d in dorms], dtype=np.int64)
+    occupancy = np.array([d[2] for d in dorms], dtype=np.int64)
+    free = np.array([d[1] for d in dorms], dtype=np.int64) - occupancy
+    dorm_pos = {dorm_id: i for i, dorm_id in enumerate(dorm_ids.tolist())}
+
+    # 宿舍现有住户构成：按画像、专业、年级计数
+    n_dorms, n_profiles = len(dorms), len(profiles)
+    count_profile = np.zeros((n_dorms, n_profiles), dtype=np.int16)
+    count_major = np.zeros((n_dorms, len(major_index)), dtype=np.int16)
+    count_grade = np.zeros((n_dorms, len(grade_index)), dtype=np.int16)
+    rows, p_cols, m_rows, m_cols, g_rows, g_cols = [], [], [], [], [], []
+    for dorm_id, major, grade in occupants:
+        d = dorm_pos.get(dorm_id)
+        if d is None:
+            continue
+        p = profile_index.get((major, grade))
+        if p is not None:
+            rows.append(d)
+            p_cols.append(p)
+        if major in major_index:
+            m_rows.append(d)
+            m_cols.append(major_index[major])
+        if grade in grade_index:
+            g_rows.append(d)
+            g_cols.append(grade_index[grade])
+    for matrix, r, c in ((count_profile, rows, p_cols), (count_major, m_rows, m_cols), (count_grade, g_rows, g_cols)):
+        np.add.at(matrix, (np.array(r, dtype=np.int64), np.array(c, dtype=np.int64)), 1)
+
+    remaining = np.array([len(m) for m in members], dtype=np.int64)
+    cursor = [0] * n_profiles
+
+    # 得分矩阵 (宿舍 x 画像)，决定宿舍的处理顺序：匹配度越高越先处理，其次人数越多越先填满
+    scores = (WEIGHT_MAJOR_GRADE * count_profile.astype(np.int64)
+              + WEIGHT_MAJOR * count_major[:, profile_major]
+              + WEIGHT_GRADE * count_grade[:, profile_grade])
+    best = scores.max(axis=1)
+    order = np.lexsort((dorm_ids, -occupancy, -best))
+
+    assignments = []
+    left = int(remaining.sum())
+    for d in order.tolist():
+        while free[d] > 0 and left > 0:
+            col = (WEIGHT_MAJOR_GRADE * count_profile[d].astype(np.int64)
+                   + WEIGHT_MAJOR * count_major[d, profile_major]
+                   + WEIGHT_GRADE * count_grade[d, profile_grade])
+            # 同分时优先能整批住进来的画像，让同画像学生尽量同住
+            key = col * (free[d] + 1) + np.minimum(remaining, free[d])
+            key[remaining == 0] = -1
+            p = int(key.argmax())
+            batch = int(min(free[d], remaining[p]))
+
+            start = cursor[p]
+            dorm_id = int(dorm_ids[d])
+            assignments.extend((student_id, dorm_id) for student_id in members[p][start:start + batch])
+            cursor[p] = start + batch
+
+            remaining[p] -= batch
+            left -= batch
+            free[d] -= batch
+            count_profile[d, p] += batch
+            count_major[d, profile_major[p]] += batch
+            count_grade[d, profile_grade[p]] += batch
+        if left == 0:
+            break
+
+    return assignments
+
+
+def plan_global(context):
+    """按匹配度矩阵计算全局分配方案，返回 [(student_id, dorm_id)]"""
+    students_by_gender = {}
+    for student_id, gender, major, grade, *_labels in context.students:
+        students_by_gender.setdefault(gender, []).append((student_id, major, grade))
+
+    dorms_by_gender = {}
+    dorm_gender = {}
+    for dorm_id, _building, gender, cap, occ, *_labels in context.dorms:
+        dorm_gender[dorm_id] = gender
+        if (occ or 0) < (cap or 0):
+            dorms_by_gender.setdefault(gender, []).append((dorm_id, cap or 0, occ or 0))
+
+    occupants_by_gender = {}
+    for dorm_id, major, grade in context.occupants:
+        gender = dorm_gender.get(dorm_id)
+        if gender is not None:
+            occupants_by_gender.setdefault(gender, []).append((dorm_id, major, grade))
+
+    assignments = []
+    for gender, students in students_by_gender.items():
+        assignments.extend(_plan_gender(
+            students, dorms_by_gender.get(gender, []), occupants_by_gender.get(gender, [])
+        ))
+    return assignments
@@ -0,0 +1,123 @@
+# 管理员仪表板统计
+# 计数器用一条聚合查询得到，最新活动用一条 UNION ALL ... ORDER BY ... LIMIT 合并；
+# 结果在进程内短暂缓存，报修、访客、学生、宿舍有写入并提交后立即失效。
+from sqlalchemy import event, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import Student, Dormitory, Repair, Visitor
+from app.services.cache import TTLCache
+
+DASHBOARD_CACHE_TTL = 10  # 秒
+ACTIVITY_LIMIT = 8
+
+# 写入这些模型会影响仪表板数据
+WATCHED_MODELS = (Repair, Visitor, Student, Dormitory)
+
+_cache = TTLCache(DASHBOARD_CACHE_TTL)
+_CACHE_KEY = 'admin_dashboard'
+
+
+def _counters():
+    """一次往返取回全部计数"""
+    row = db.session.execute(select(
+        select(func.count(Student.id)).scalar_subquery(),
+        select(func.count(Dormitory.id)).scalar_subquery(),
+        select(func.count(Repair.id)).scalar_subquery(),
+        select(func.count(Repair.id)).where(Repair.status == 'pending').scalar_subquery(),
+    )).one()
+    return {
+        'total_students': row[0],
+        'total_dorms': row[1],
+        'total_repairs': row[2],
+        'pending_repairs': row[3],
+    }
+
+
+def _activities(limit=ACTIVITY_LIMIT):
+    """报修与访客合并为一个按时间倒序的活动流"""
+    repairs = select(
+        literal('repair').label('type'),
+        Repair.title.label('name'),
+        Student.name.label('student_name'),
+        null().label('dorm_number'),
+        Repair.created_at.label('time'),
+        Repair.status.label('status'),
+    ).select_from(Repair).outerjoin(Student, Repair.student_id == Student.id)
+    visitors = select(
+        literal('visitor'),
+        Visitor.name,
+        null(),
+        Visitor.dorm_number,
+        Visitor.visit_date,
+        Visitor.status,
+    )
+    feed = union_all(repairs, visitors).subquery()
+    rows = db.session.execute(
+        select(feed).order_by(feed.c.time.desc()).limit(limit)
+    ).all()
+
+    activities = []
+    for row in rows:
+        if row.type == 'repair':
+            activities.append({
+                'type': 'repair',
+                'title': f'新报修：{row.name}',
+                'description': f'学生 {row.student_name if row.student_name else "未知"} 提交了报修申请',
+                'time': row.time,
+                'status': row.status
+            })
+        else:
+            activities.append({
+                'type': 'visitor',
+                'title': f'访客登记：{row.name}',
+                'description': f'访客 {row.name} 访问了宿舍 {row.dorm_number}',
+                'time': row.time,
+                'status': row.status
+            })
+    return activities
+
+
+def compute_dashboard_stats():
+    stats = _counters()
+    stats['activities'] = _activities()
+    return stats
+
+
+def get_dashboard_stats():
+    """仪表板数据（带缓存）"""
+    return _cache.get_or_set(_CACHE_KEY, compute_dashboard_stats)
+
+
+def invalidate():
+    _cache.pop(_CACHE_KEY)
+
+
+def mark_dirty(session=None):
+    """用 UPDATE 语句（不经过 flush）写入相关数据时调用，提交后照常使缓存失效"""
+    (session or db.session).info['dashboard_dirty'] = True
+
+
+def _after_flush(session, flush_context):
+    # flush 后 new/dirty/deleted 仍保留 flush 前的内容
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, WATCHED_MODELS):
+            session.info['dashboard_dirty'] = True
+            break
+
+
+def _after_commit(session):
+    if session.info.pop('dashboard_dirty', False):
+        invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop('dashboard_dirty', None)
+
+
+def register_events():
+    """注册会话事件：相关数据提交后使缓存失效"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
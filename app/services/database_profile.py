@@ -0,0 +1,90 @@
+# 数据库连接配置（DATABASE_PROFILE）
+# default：SQLAlchemy / SQLite 的默认设置（回滚日志，读写互相阻塞）。
+# production：SQLite 上每个新连接执行一组 PRAGMA——WAL 日志（读不阻塞写）、synchronous=NORMAL
+# （WAL 下只在检查点时 fsync）、busy_timeout（写锁被占用时等待而不是立即报 database is locked）、
+# mmap、页缓存大小和外键约束；同时设置连接池参数。MySQL 等服务端数据库只设置连接池参数，
+# 并开启 pool_pre_ping / pool_recycle，避免使用被服务端断开的连接。
+from sqlalchemy import event
+
+from app import db
+
+PROFILES = ('default', 'production')
+
+
+def _profile(app):
+    name = app.config.get('DATABASE_PROFILE') or 'default'
+    if name not in PROFILES:
+        raise ValueError(f'未知的数据库配置 DATABASE_PROFILE={name}，可选：{"、".join(PROFILES)}')
+    return name
+
+
+def _is_sqlite(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+
+
+def sqlite_pragmas(config):
+    """production 配置下每个 SQLite 连接执行的 PRAGMA，按执行顺序"""
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        # 负数表示以 KiB 为单位
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),
+        ('temp_store', 'MEMORY'),
+        ('foreign_keys', 'ON'),
+    ]
+
+
+def engine_options(app):
+    """production 配置的引擎参数（default 配置返回空字典）"""
+    if _profile(app) != 'production':
+        return {}
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if uri in ('sqlite://', 'sqlite:///:memory:'):
+        # 内存数据库只有一个连接，不使用连接池参数
+        return {}
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+    }
+    if _is_sqlite(app):
+        # 驱动自带的等待时间（秒），与 busy_timeout 一致
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = config['DATABASE_POOL_RECYCLE']
+    return options
+
+
+def configure(app):
+    """在 db.init_app 之前调用：把所选配置的引擎参数合并到 SQLALCHEMY_ENGINE_OPTIONS（已显式配置的项优先）"""
+    options = engine_options(app)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def register_pragmas(app, engine, read_only=False):
+    """production 配置下为 SQLite 引擎注册连接时执行的 PRAGMA；只读连接不设置日志模式（WAL 由主库设置）"""
+    if _profile(app) != 'production' or engine.url.get_backend_name() != 'sqlite':
+        return
+    pragmas = [(name, value) for name, value in sqlite_pragmas(app.config)
+               if not (read_only and name == 'journal_mode')]
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', apply_pragmas)
+
+
+def init_app(app):
+    """在 db.init_app 之后调用：为主库引擎注册连接时执行的 PRAGMA"""
+    with app.app_context():
+        register_pragmas(app, db.engine)
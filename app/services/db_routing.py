@@ -0,0 +1,115 @@
+# 读写分离
+# 配置 DATABASE_READ_ROUTING 后，只读请求（GET / HEAD / OPTIONS）中的 SELECT 走只读引擎，其余一律走主库：
+# - 只读引擎：READ_DATABASE_URL 指定的只读副本；未指定且主库是 SQLite 文件时，以只读方式（mode=ro）打开同一文件。
+# - 按请求方法自动判断；视图可用 use_primary 强制走主库（例如用 GET 执行删除的链接），
+#   或用 use_replica 让只读的 POST 请求（如预览）也走只读引擎。
+# - 会话中一旦出现写操作（flush、UPDATE/INSERT/DELETE），本会话之后的查询都走主库；
+#   不带语句的 session.connection() 返回主库连接但不算写操作（经它写入的代码都在 flush 中或写语句之后），
+#   只读的辅助查询可用 read_connection() 取得与 SELECT 相同路由的连接。
+#   事务提交后在用户的 Flask 会话里记下时间，READ_AFTER_WRITE_SECONDS 秒内该用户的请求都走主库，
+#   避免副本延迟时重定向后的页面读不到刚写入的数据。
+# 命令行、后台任务没有请求上下文，始终走主库。
+import time
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+_PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+def use_primary(view):
+    """视图中的查询一律走主库"""
+    view._db_route = 'primary'
+    return view
+
+
+def use_replica(view):
+    """只读的非 GET 视图也走只读引擎（视图中出现写操作时自动切回主库）"""
+    view._db_route = 'replica'
+    return view
+
+
+class RoutingSession(Session):
+    """按请求把 SELECT 路由到只读引擎的会话"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            reading = clause is not None and getattr(clause, 'is_select', False) and not self._flushing
+            if self._flushing or (clause is not None and not reading):
+                # flush 和写语句（以及无法判断的语句）走主库，本会话之后的查询也走主库；
+                # 没有语句时（session.connection()、按模型查找引擎）返回主库，但不算写操作
+                self.info['db_wrote'] = True
+            elif reading and g.get('db_read_only') and not self.info.get('db_wrote'):
+                return current_app.extensions['db_read_engine']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_connection(session=None):
+    """只做查询时使用的连接：与 SELECT 语句的路由相同，只读请求中走只读引擎，也不会把会话标记为写过"""
+    from app import db
+    return (session or db.session).connection(bind_arguments={'clause': sa.select(1)})
+
+
+def _route(view):
+    if view is not None and getattr(view, '_db_route', None):
+        return view._db_route
+    return 'replica' if request.method in READ_METHODS else 'primary'
+
+
+def _before_request():
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    if _route(view) != 'replica':
+        return
+    if cookie_session.get(_PRIMARY_UNTIL_KEY, 0) > time.time():
+        # 刚写入过，仍读主库
+        return
+    g.db_read_only = True
+
+
+def _after_commit(session):
+    if session.info.pop('db_wrote', False) and has_request_context():
+        g.db_committed_write = True
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('db_wrote', None)
+
+
+def _after_request(response):
+    if g.get('db_committed_write'):
+        cookie_session[_PRIMARY_UNTIL_KEY] = time.time() + current_app.config['READ_AFTER_WRITE_SECONDS']
+    return response
+
+
+def read_database_uri(app):
+    """只读引擎的地址：READ_DATABASE_URL，或以只读方式打开的主库 SQLite 文件"""
+    uri = app.config.get('SQLALCHEMY_READ_DATABASE_URI')
+    if uri:
+        return uri
+    with app.app_context():
+        from app import db
+        url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        raise ValueError('开启 DATABASE_READ_ROUTING 时，非 SQLite 文件数据库须配置 READ_DATABASE_URL')
+    return f'sqlite:///file:{url.database}?mode=ro&uri=true'
+
+
+def init_app(app):
+    """配置 DATABASE_READ_ROUTING 时创建只读引擎并注册请求钩子（须在 db.init_app 之后调用）"""
+    if not app.config.get('DATABASE_READ_ROUTING'):
+        return
+    from app.services import database_profile
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    engine = sa.create_engine(read_database_uri(app), **options)
+    database_profile.register_pragmas(app, engine, read_only=True)
+    app.extensions['db_read_engine'] = engine
+
+    if not event.contains(RoutingSession, 'after_commit', _after_commit):
+        event.listen(RoutingSession, 'after_commit', _after_commit)
+        event.listen(RoutingSession, 'after_transaction_end', _after_transaction_end)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
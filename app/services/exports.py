@@ -0,0 +1,159 @@
+# 列表数据导出（CSV / XLSX）
+# 导出与列表页共用 listing 中的查询和筛选参数，只是不分页：结果用 yield_per 分批从游标读取，
+# 每写满一段就交给响应发送，已发送的行不再保留，内存占用与导出行数无关。
+# CSV 可选 gzip 压缩（边写边压缩）；XLSX 由 openpyxl 的只写模式写入临时文件后分块发送。
+import csv
+import io
+import tempfile
+import zlib
+from datetime import datetime
+
+from app.services.listing import (resolve_sort, repair_query, visitor_query, payment_query,
+                                  utility_bill_query)
+
+YIELD_PER = 1000
+# CSV 缓冲区超过此大小（字符数）即发送一段
+FLUSH_SIZE = 64 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+FORMATS = ('csv', 'xlsx')
+
+BILL_STATUS = {'unpaid': '未缴费', 'paid': '已缴费'}
+PAYMENT_STATUS = {'pending': '待支付', 'completed': '已完成', 'failed': '失败'}
+VISITOR_STATUS = {'in': '在访', 'out': '已离开'}
+REPAIR_STATUS = {'pending': '待处理', 'processing': '处理中', 'completed': '已完成'}
+
+
+class ExportError(Exception):
+    """导出格式不可用（如未安装 openpyxl）"""
+
+
+def _time(value, fmt='%Y-%m-%d %H:%M:%S'):
+    return value.strftime(fmt) if value else ''
+
+
+def _dorm_number(dorm):
+    return dorm.dorm_number if dorm else ''
+
+
+# 导出名 -> (查询, [(表头, 取值)])；导出名同时作为文件名
+EXPORTS = {
+    'utility_bills': (utility_bill_query, [
+        ('楼栋', lambda b: b.dormitory.building if b.dormitory else ''),
+        ('宿舍号', lambda b: _dorm_number(b.dormitory)),
+        ('月份', lambda b: b.month),
+        ('用电量(度)', lambda b: b.electricity),
+        ('电费(元)', lambda b: b.electricity_cost),
+        ('用水量(吨)', lambda b: b.water),
+        ('水费(元)', lambda b: b.water_cost),
+        ('总费用(元)', lambda b: b.total_cost),
+        ('状态', lambda b: BILL_STATUS.get(b.status, b.status)),
+        ('到期日', lambda b: _time(b.due_date, '%Y-%m-%d')),
+    ]),
+    'payments': (payment_query, [
+        ('学生姓名', lambda p: p.student.name if p.student else ''),
+        ('学号', lambda p: p.student.student_id if p.student else ''),
+        ('宿舍', lambda p: _dorm_number(p.utility_bill.dormitory) if p.utility_bill else ''),
+        ('账单月份', lambda p: p.utility_bill.month if p.utility_bill else ''),
+        ('支付金额(元)', lambda p: p.amount),
+        ('支付方式', lambda p: p.payment_method),
+        ('支付状态', lambda p: PAYMENT_STATUS.get(p.payment_status, p.payment_status)),
+        ('支付时间', lambda p: _time(p.payment_date)),
+    ]),
+    'visitors': (visitor_query, [
+        ('访客姓名', lambda v: v.name),
+        ('身份证号', lambda v: v.id_card),
+        ('电话', lambda v: v.phone),
+        ('访问时间', lambda v: _time(v.visit_date)),
+        ('离开时间', lambda v: _time(v.leave_date)),
+        ('访问目的', lambda v: v.purpose),
+        ('访问宿舍', lambda v: v.dorm_number),
+        ('被访学生', lambda v: v.student_name),
+        ('状态', lambda v: VISITOR_STATUS.get(v.status, v.status)),
+    ]),
+    'repairs': (repair_query, [
+        ('标题', lambda r: r.title),
+        ('宿舍号', lambda r: _dorm_number(r.dormitory)),
+        ('学生', lambda r: r.student.name if r.student else ''),
+        ('报修类型', lambda r: r.repair_type),
+        ('位置', lambda r: r.location_detail),
+        ('紧急程度', lambda r: r.urgent_level),
+        ('联系电话', lambda r: r.contact_phone),
+        ('状态', lambda r: REPAIR_STATUS.get(r.status, r.status)),
+        ('提交时间', lambda r: _time(r.created_at)),
+        ('内容', lambda r: r.content),
+    ]),
+}
+
+
+def iter_rows(name, args):
+    """按列表页的筛选和排序逐行产出导出数据，第一行为表头"""
+    build_query, columns = EXPORTS[name]
+    _sort, order = resolve_sort(name, args)
+    query = build_query(args).order_by(*[column.desc() if desc else column.asc() for column, desc in order])
+    yield [header for header, _getter in columns]
+    # yield_per 分批取回并释放已处理的对象；预加载的多对一关联随每批一起 JOIN
+    for item in query.yield_per(YIELD_PER):
+        yield [getter(item) for _header, getter in columns]
+
+
+def stream_csv(rows, compress=False):
+    """把行写成 CSV（带 BOM，Excel 可直接打开）并分段产出字节；compress 时产出 gzip 数据"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31：gzip 格式
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= FLUSH_SIZE:
+            chunk = drain()
+            if chunk:
+                yield chunk
+    chunk = drain()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise ExportError('导出 Excel 需要安装 openpyxl，可先导出为 CSV')
+    return openpyxl
+
+
+def stream_xlsx(rows):
+    """把行写入只写模式的工作簿（落在临时文件上），再分块产出文件内容"""
+    workbook = _openpyxl().Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        yield from iter(lambda: output.read(FILE_CHUNK_SIZE), b'')
+
+
+def export_file(name, fmt, args, compress=False):
+    """返回 (文件名, MIME类型, 字节块生成器)
+
+    生成器在响应发送时才开始查询；缺少依赖等错误在此之前以 ExportError 抛出。
+    """
+    filename = f'{name}_{datetime.now():%Y%m%d}'
+    rows = iter_rows(name, args)
+    if fmt == 'xlsx':
+        _openpyxl()
+        # xlsx 本身是 zip 压缩包，不再 gzip
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return f'{filename}.xlsx', mimetype, stream_xlsx(rows)
+    if compress:
+        return f'{filename}.csv.gz', 'application/gzip', stream_csv(rows, compress=True)
+    return f'{filename}.csv', 'text/csv; charset=utf-8', stream_csv(rows)
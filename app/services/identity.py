@@ -0,0 +1,132 @@
+# 当前登录用户及其角色档案（学生 / 宿管）
+# Flask-Login 每个请求调用一次 load_user：一条 LEFT JOIN 同时查出用户、学生档案和宿管档案，记在 g 上，
+# 视图用 current_student() / current_dorm_manager() 取档案，不再各自按 user_id 查询。
+# 查询结果另存一份脱离会话的副本在进程内 TTL 缓存中（按用户ID），命中时用 session.merge(load=False)
+# 放回当前会话，只需按主键读一次版本号（见下）；放回的对象与查询得到的一样，可以修改后提交。
+# 缓存失效：多个 worker 之间用 cache_versions 表中的 identity 版本号同步（与空床位索引相同的做法）。
+# 通过 ORM 修改用户、学生、宿管（资料编辑、软删除），以及 occupancy 直接用 UPDATE 调整学生宿舍
+# （forget_students）时，在同一事务内把版本号加一；缓存条目记下查询时的版本号，
+# load_user 每次按主键读一次版本号，不一致就重新查询（版本号随身份查询一起读出），
+# 所以每个请求最多一条身份相关的查询，任何 worker 都不会在改动提交后继续使用旧档案。
+from flask import g
+from flask_login import current_user
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app import db
+from app.models.models import CacheVersion, User, Student, DormManager
+from app.services.cache import TTLCache
+
+VERSION_NAME = 'identity'
+# 版本号保证一致性，TTL 只用于回收不再登录的用户占用的内存
+IDENTITY_TTL = 600
+# 键为 ('user', 引擎, 用户ID) -> (版本号, (用户, 学生档案, 宿管档案) 的脱离会话副本)；
+# 键中带上引擎，同一进程内指向不同数据库的应用互不影响
+_cache = TTLCache(IDENTITY_TTL, maxsize=20000)
+_versions = CacheVersion.__table__
+
+
+def _key(kind, key_id):
+    return kind, db.engine, key_id
+
+
+def _detached_copy(obj):
+    """复制已加载对象的全部列，得到不属于任何会话、可被 merge(load=False) 放回会话的对象"""
+    if obj is None:
+        return None
+    mapper = inspect(obj).mapper
+    copy = mapper.class_(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def _version_query():
+    return select(_versions.c.version).where(_versions.c.name == VERSION_NAME)
+
+
+def _query(user_id):
+    """(版本号, (用户, 学生档案, 宿管档案))，版本号与档案在同一条查询中读出"""
+    row = db.session.execute(
+        select(User, Student, DormManager, _version_query().scalar_subquery())
+        .outerjoin(Student, Student.user_id == User.id)
+        .outerjoin(DormManager, DormManager.user_id == User.id)
+        .where(User.id == user_id)
+        .order_by(Student.id, DormManager.id)
+        .limit(1)
+    ).first()
+    return (row[3] or 0, tuple(row[:3])) if row is not None else (None, None)
+
+
+def load_user(user_id):
+    """Flask-Login 的 user_loader：返回用户对象，并把 (用户, 学生档案, 宿管档案) 记在 g 上"""
+    user_id = int(user_id)
+    cached = _cache.get(_key('user', user_id))
+    if cached is not None and cached[0] == (db.session.execute(_version_query()).scalar() or 0):
+        identity = tuple(db.session.merge(obj, load=False) if obj is not None else None for obj in cached[1])
+    else:
+        version, identity = _query(user_id)
+        if identity is None:
+            return None
+        _cache.set(_key('user', user_id), (version, tuple(_detached_copy(obj) for obj in identity)))
+    g.identity = identity
+    return identity[0]
+
+
+def _current_identity():
+    if 'identity' not in g:
+        # 应用配置了其他 user_loader 时补查一次
+        if not current_user.is_authenticated:
+            return None, None, None
+        load_user(current_user.id)
+    return g.identity
+
+
+def current_student():
+    """当前登录学生的档案，当前用户不是学生时为 None"""
+    return _current_identity()[1]
+
+
+def current_dorm_manager():
+    """当前登录宿管的档案，当前用户不是宿管时为 None"""
+    return _current_identity()[2]
+
+
+def bump_version(session=None):
+    """在当前事务内把 identity 版本号加一（行不存在则插入），随事务提交生效；同一事务内只加一次"""
+    session = session or db.session
+    if session.info.get('identity_bumped'):
+        return
+    connection = session.connection()
+    result = connection.execute(
+        _versions.update()
+        .where(_versions.c.name == VERSION_NAME)
+        .values(version=_versions.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(_versions.insert().values(name=VERSION_NAME, version=1))
+    session.info['identity_bumped'] = True
+
+
+def forget_students(student_ids, session=None):
+    """直接用 UPDATE 修改了学生档案时调用：事务提交后所有 worker 中的身份缓存失效"""
+    bump_version(session)
+
+
+def _after_flush(session, flush_context):
+    models = (User, Student, DormManager)
+    if any(isinstance(obj, models) for obj in list(session.new) + list(session.deleted)) or any(
+            isinstance(obj, models) and session.is_modified(obj, include_collections=False)
+            for obj in session.dirty):
+        bump_version(session)
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('identity_bumped', None)
+
+
+def register_events():
+    """注册会话事件：用户、学生、宿管有改动时在同一事务内更新版本号"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_transaction_end', _after_transaction_end)
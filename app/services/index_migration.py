@@ -0,0 +1,69 @@
+# 为已有数据库补建索引
+# db.create_all() 只建缺失的表，不会给已存在的表加索引。这里对照模型中声明的索引
+# 和数据库中实际存在的索引（按名称），只创建缺失的，可重复执行（SQLite / MySQL 均适用）。
+# 唯一索引创建前先检查重复数据：有重复时跳过并报告，不擅自删改数据。
+from sqlalchemy import func, inspect, select
+
+from app import db
+
+
+class IndexMigrationResult:
+    """补建结果：新建、已存在的索引名，以及跳过的 [(索引名, 原因)]"""
+
+    def __init__(self):
+        self.created = []
+        self.existing = []
+        self.skipped = []
+
+
+def declared_indexes():
+    """模型中声明的全部索引，按表的依赖顺序"""
+    return [index for table in db.metadata.sorted_tables
+            for index in sorted(table.indexes, key=lambda index: index.name)]
+
+
+def _duplicate(connection, index):
+    """唯一索引的列上已有的一组重复值，没有则为 None"""
+    columns = list(index.columns)
+    return connection.execute(
+        select(*columns).group_by(*columns).having(func.count() > 1).limit(1)
+    ).first()
+
+
+def upgrade_indexes(progress=None):
+    """补建缺失的索引，返回 IndexMigrationResult；progress(索引名) 在开始创建每个索引前调用"""
+    result = IndexMigrationResult()
+    engine = db.engine
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    existing = {table: {index['name'] for index in inspector.get_indexes(table)} for table in tables}
+
+    analyzed = set()
+    for index in declared_indexes():
+        table = index.table.name
+        if table not in tables:
+            result.skipped.append((index.name, f'表 {table} 不存在，请先建表'))
+            continue
+        if index.name in existing[table]:
+            result.existing.append(index.name)
+            continue
+        # 每个索引单独一个事务，失败时已建好的索引保留
+        with engine.begin() as connection:
+            if index.unique:
+                duplicate = _duplicate(connection, index)
+                if duplicate is not None:
+                    values = ', '.join(str(value) for value in duplicate)
+                    result.skipped.append((index.name, f'存在重复数据（如 {values}），清理后重新执行'))
+                    continue
+            if progress:
+                progress(index.name)
+            index.create(connection)
+        result.created.append(index.name)
+        analyzed.add(table)
+
+    # 更新新建索引所在表的统计信息，让查询规划器尽快选用新索引
+    if analyzed and engine.dialect.name == 'sqlite':
+        with engine.begin() as connection:
+            for table in sorted(analyzed):
+                connection.exec_driver_sql(f'ANALYZE "{table}"')
+    return result
@@ -0,0 +1,205 @@
+# 各列表页的服务端筛选与排序定义
+# 列表页和导出共用这里的查询，筛选参数来自请求参数：
+#   q（姓名/标题/学号前缀）、status（状态）、building（楼栋）、month（YYYY-MM）、sort（排序方式）、
+#   text（报修全文搜索，见 repair_search）
+from sqlalchemy import or_, select
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models.models import Student, Dormitory, Repair, Visitor, UtilityBill, Payment, DormChangeRequest
+from app.services import repair_search
+from app.services.pagination import paginate, prefix_filter
+
+# 排序方式：名称 -> [(列, 是否降序)]，最后一列为主键保证顺序唯一
+SORTS = {
+    'students': {
+        'default': [(Student.id, False)],
+        'name': [(Student.name, False), (Student.id, False)],
+    },
+    'repairs': {
+        'default': [(Repair.created_at, True), (Repair.id, True)],
+        'oldest': [(Repair.created_at, False), (Repair.id, False)],
+    },
+    'visitors': {
+        'default': [(Visitor.visit_date, True), (Visitor.id, True)],
+        'oldest': [(Visitor.visit_date, False), (Visitor.id, False)],
+    },
+    'payments': {
+        'default': [(Payment.payment_date, True), (Payment.id, True)],
+        'oldest': [(Payment.payment_date, False), (Payment.id, False)],
+    },
+    'utility_bills': {
+        'default': [(UtilityBill.month, True), (UtilityBill.dorm_id, False), (UtilityBill.id, False)],
+        'oldest': [(UtilityBill.month, False), (UtilityBill.dorm_id, False), (UtilityBill.id, False)],
+    },
+    'dorm_change_requests': {
+        'default': [(DormChangeRequest.created_at, True), (DormChangeRequest.id, True)],
+        'oldest': [(DormChangeRequest.created_at, False), (DormChangeRequest.id, False)],
+    },
+}
+
+
+# 预加载策略：列表模板会访问的关联对象随主查询一次 JOIN 取回，
+# 每页的SQL语句数固定，不随行数增长（默认的 lazy=True 会每行再查一次）。
+# backref 在映射配置完成后才存在，所以调用时再构造。
+def eager_options(name):
+    loaders = {
+        'students': lambda: [joinedload(Student.dormitory)],
+        'repairs': lambda: [joinedload(Repair.dormitory), joinedload(Repair.student)],
+        'visitors': lambda: [],
+        'payments': lambda: [joinedload(Payment.student),
+                             joinedload(Payment.utility_bill).joinedload(UtilityBill.dormitory)],
+        'utility_bills': lambda: [joinedload(UtilityBill.dormitory)],
+        'dorm_change_requests': lambda: [joinedload(DormChangeRequest.student),
+                                         joinedload(DormChangeRequest.current_dorm),
+                                         joinedload(DormChangeRequest.target_dorm)],
+    }
+    return loaders[name]()
+
+
+def resolve_sort(name, args):
+    """返回 (排序名, 排序键)，未知的排序名回退到默认"""
+    sort = args.get('sort') or 'default'
+    if sort not in SORTS[name]:
+        sort = 'default'
+    return sort, SORTS[name][sort]
+
+
+def _arg(args, key):
+    return (args.get(key) or '').strip()
+
+
+def _dorm_ids_in(building):
+    return select(Dormitory.id).where(Dormitory.building == building)
+
+
+def student_query(args, building=None):
+    query = Student.query.options(*eager_options('students')).filter(Student.is_deleted == False)
+    building = building or _arg(args, 'building')
+    if building:
+        query = query.filter(Student.dorm_id.in_(_dorm_ids_in(building)))
+    q = _arg(args, 'q')
+    if q:
+        query = query.filter(or_(prefix_filter(Student.name, q), prefix_filter(Student.student_id, q)))
+    return query
+
+
+def _repair_conditions(args, building=None):
+    """报修列表除全文搜索以外的筛选条件"""
+    conditions = [Repair.is_deleted == False]
+    building = building or _arg(args, 'building')
+    if building:
+        conditions.append(Repair.dorm_id.in_(_dorm_ids_in(building)))
+    status = _arg(args, 'status')
+    if status:
+        conditions.append(Repair.status == status)
+    q = _arg(args, 'q')
+    if q:
+        conditions.append(prefix_filter(Repair.title, q))
+    return conditions
+
+
+def repair_query(args, building=None):
+    query = Repair.query.options(*eager_options('repairs')).filter(*_repair_conditions(args, building))
+    search = _arg(args, 'text')
+    if search:
+        match = repair_search.match_condition(search)
+        if match is not None:
+            query = query.filter(match)
+    return query
+
+
+def repair_page(args, building=None):
+    """报修列表的一页：有全文搜索词且为默认排序时按相关度排序，否则按所选排序"""
+    sort, order = resolve_sort('repairs', args)
+    search = _arg(args, 'text')
+    ranked = repair_search.ranked_query(search, _repair_conditions(args, building)) \
+        if search and sort == 'default' else None
+    if ranked is None:
+        return paginate(repair_query(args, building), order, sort)
+
+    # 先按相关度取一页报修ID，再带关联对象一次查回
+    query, order = ranked
+    page = paginate(query, order, 'relevance')
+    ids = [row.id for row in page.items]
+    repairs = {repair.id: repair for repair in Repair.query.options(*eager_options('repairs'))
+               .filter(Repair.id.in_(ids))} if ids else {}
+    page.items = [repairs[repair_id] for repair_id in ids if repair_id in repairs]
+    return page
+
+
+def visitor_query(args, building=None):
+    query = Visitor.query.options(*eager_options('visitors')).filter(Visitor.is_deleted == False)
+    building = building or _arg(args, 'building')
+    if building:
+        # 访客表只记录宿舍号，按宿舍号关联楼栋
+        query = query.filter(Visitor.dorm_number.in_(
+            select(Dormitory.dorm_number).where(Dormitory.building == building)
+        ))
+    status = _arg(args, 'status')
+    if status:
+        query = query.filter(Visitor.status == status)
+    q = _arg(args, 'q')
+    if q:
+        query = query.filter(prefix_filter(Visitor.name, q))
+    return query
+
+
+def payment_query(args):
+    query = Payment.query.options(*eager_options('payments'))
+    status = _arg(args, 'status')
+    if status:
+        query = query.filter(Payment.payment_status == status)
+    month = _arg(args, 'month')
+    building = _arg(args, 'building')
+    if month or building:
+        bills = select(UtilityBill.id)
+        if month:
+            bills = bills.where(UtilityBill.month == month)
+        if building:
+            bills = bills.where(UtilityBill.dorm_id.in_(_dorm_ids_in(building)))
+        query = query.filter(Payment.bill_id.in_(bills))
+    q = _arg(args, 'q')
+    if q:
+        query = query.filter(Payment.student_id.in_(
+            select(Student.id).where(or_(prefix_filter(Student.name, q), prefix_filter(Student.student_id, q)))
+        ))
+    return query
+
+
+def utility_bill_query(args):
+    query = UtilityBill.query.options(*eager_options('utility_bills'))
+    status = _arg(args, 'status')
+    if status:
+        query = query.filter(UtilityBill.status == status)
+    month = _arg(args, 'month')
+    if month:
+        query = query.filter(UtilityBill.month == month)
+    building = _arg(args, 'building')
+    if building:
+        query = query.filter(UtilityBill.dorm_id.in_(_dorm_ids_in(building)))
+    return query
+
+
+def dorm_change_request_query(args, building=None):
+    query = DormChangeRequest.query.options(*eager_options('dorm_change_requests'))
+    building = building or _arg(args, 'building')
+    if building:
+        # 按申请学生当前所住宿舍的楼栋归属
+        query = query.filter(DormChangeRequest.student_id.in_(
+            select(Student.id).where(Student.dorm_id.in_(_dorm_ids_in(building)))
+        ))
+    status = _arg(args, 'status')
+    if status:
+        query = query.filter(DormChangeRequest.status == status)
+    q = _arg(args, 'q')
+    if q:
+        query = query.filter(DormChangeRequest.student_id.in_(
+            select(Student.id).where(or_(prefix_filter(Student.name, q), prefix_filter(Student.student_id, q)))
+        ))
+    return query
+
+
+def building_options():
+    """筛选下拉框用的楼栋列表"""
+    return [row[0] for row in db.session.query(Dormitory.building).distinct().order_by(Dormitory.building)]
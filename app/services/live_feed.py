@@ -0,0 +1,271 @@
+# 宿管仪表板实时推送（Server-Sent Events）
+# 报修、访客、宿舍调换申请新建或状态变化并提交后，按楼栋发布到进程内的发布/订阅总线；
+# 宿管仪表板只在打开时查询一次，之后通过 /dorm_manager/dashboard/events 接收本楼栋的事件，
+# 增量更新计数和最新活动，不再反复刷新查询。
+# - 每个楼栋保留最近 REPLAY_SIZE 条事件，浏览器断线重连时按 Last-Event-ID 补发；
+#   补不上（断开太久或订阅队列积压溢出）时发送 reset，页面重新加载一次。
+# - 每条推送连接最长保持 LIVE_FEED_STREAM_SECONDS 秒（低于 gunicorn 的超时时间），之后浏览器自动重连。
+# - 总线在进程内，只能推送同一进程中提交的写入，推送连接又要一直占着 worker 的一个连接（gthread 下是一个线程），
+#   所以只在单个 gevent worker 时开启（配置项 LIVE_FEED_ENABLED）；其他部署方式下推送接口返回 204，
+#   浏览器不再重连，仪表板需手动刷新。要在多 worker 下推送，须把 EventBus 换成 Redis 等跨进程实现
+#   （publish / subscribe 接口不变）。
+# - 每个 worker 同时最多 LIVE_FEED_MAX_STREAMS 条推送连接，超出时同样返回 204。
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from flask import current_app
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import Dormitory, Student, Repair, Visitor, DormChangeRequest
+
+REPLAY_SIZE = 200
+QUEUE_SIZE = 100
+RETRY_MS = 1000
+
+# 推送这些模型的新建和状态变化
+FEED_MODELS = (Repair, Visitor, DormChangeRequest)
+
+FeedEvent = namedtuple('FeedEvent', 'id seq name data')
+
+
+class Subscription:
+    """一个推送连接的事件队列；消费太慢、队列满时标记溢出"""
+
+    def __init__(self, bus, topic):
+        self.bus = bus
+        self.topic = topic
+        self.overflowed = False
+        self._queue = queue.Queue(QUEUE_SIZE)
+
+    def put(self, feed_event):
+        try:
+            self._queue.put_nowait(feed_event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """进程内按主题（楼栋）发布/订阅，事件ID为“进程标识-序号”"""
+
+    def __init__(self, replay_size=REPLAY_SIZE):
+        self.replay_size = replay_size
+        self._reset()
+
+    def _reset(self):
+        self.token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._subscribers = {}
+        self._count = 0
+        # 主题 -> 最近的事件；以及已被挤出缓冲区的最大序号
+        self._recent = {}
+        self._evicted = {}
+
+    def last_event_id(self):
+        """当前最新的事件ID，页面渲染时记下，推送连接从这里接着发"""
+        return f'{self.token}-{self._last_seq}'
+
+    def publish(self, topic, name, data):
+        with self._lock:
+            seq = next(self._seq)
+            self._last_seq = seq
+            feed_event = FeedEvent(f'{self.token}-{seq}', seq, name, data)
+            recent = self._recent.setdefault(topic, deque())
+            recent.append(feed_event)
+            if len(recent) > self.replay_size:
+                self._evicted[topic] = recent.popleft().seq
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(feed_event)
+        return feed_event
+
+    def subscribe(self, topic, last_event_id=None, limit=None):
+        """返回 (订阅, 需要补发的事件)；无法补全缺口时补发部分为 None。
+        已有 limit 个订阅时返回 (None, None)"""
+        subscription = Subscription(self, topic)
+        with self._lock:
+            if limit is not None and self._count >= limit:
+                return None, None
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            self._count += 1
+            return subscription, self._backlog(topic, last_event_id)
+
+    def _backlog(self, topic, last_event_id):
+        if not last_event_id:
+            return []
+        token, _sep, seq = last_event_id.rpartition('-')
+        if token != self.token or not seq.isdigit():
+            # ID 来自其他进程（worker 重启前）：中间的事件补发不了
+            return None
+        seq = int(seq)
+        if seq > self._last_seq or seq < self._evicted.get(topic, 0):
+            return None
+        return [feed_event for feed_event in self._recent.get(topic, ()) if feed_event.seq > seq]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers and subscription in subscribers:
+                subscribers.remove(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+
+bus = EventBus()
+# 预加载应用时总线在主进程中创建，fork 后每个 worker 重新初始化（锁、序号和进程标识）
+os.register_at_fork(after_in_child=bus._reset)
+
+
+def format_event(feed_event):
+    data = json.dumps(feed_event.data, ensure_ascii=False)
+    return f'id: {feed_event.id}\nevent: {feed_event.name}\ndata: {data}\n\n'
+
+
+def enabled():
+    return current_app.config['LIVE_FEED_ENABLED']
+
+
+def stream(building, last_event_id=None):
+    """某楼栋的 SSE 响应内容（生成器不访问数据库，也不需要应用上下文）；
+    未开启实时推送或本 worker 的推送连接已满时返回 None"""
+    if not enabled():
+        return None
+    max_seconds = current_app.config['LIVE_FEED_STREAM_SECONDS']
+    heartbeat = current_app.config['LIVE_FEED_HEARTBEAT_SECONDS']
+    subscription, backlog = bus.subscribe(building, last_event_id, current_app.config['LIVE_FEED_MAX_STREAMS'])
+    if subscription is None:
+        return None
+
+    def generate():
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            if backlog is None:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            for feed_event in backlog:
+                yield format_event(feed_event)
+            deadline = time.monotonic() + max_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                feed_event = subscription.get(min(heartbeat, remaining))
+                if subscription.overflowed:
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                # 心跳注释行，保持代理和浏览器的连接
+                yield format_event(feed_event) if feed_event else ': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    return generate()
+
+
+def _status_change(obj):
+    history = inspect(obj).attrs.status.history
+    if history.deleted and history.added and history.deleted[0] != history.added[0]:
+        return history.deleted[0]
+    return None
+
+
+def _describe(obj, student_names):
+    """与仪表板模板中最新活动的文字一致"""
+    if isinstance(obj, Repair):
+        name = student_names.get(obj.student_id) or '未知'
+        return 'repair', f'新报修：{obj.title}', f'学生 {name} 提交了报修申请', obj.created_at
+    if isinstance(obj, Visitor):
+        return 'visitor', f'访客登记：{obj.name}', f'访客 {obj.name} 访问了宿舍 {obj.dorm_number}', obj.visit_date
+    name = student_names.get(obj.student_id)
+    return 'dorm_change', f'宿舍调换申请：{name}', f'学生 {name} 提交了宿舍调换申请', obj.created_at
+
+
+def _after_flush(session, flush_context):
+    # flush 后 new/dirty 和属性的修改历史仍保留 flush 前的内容
+    changes = [(obj, 'created', None) for obj in session.new if isinstance(obj, FEED_MODELS)]
+    for obj in session.dirty:
+        if isinstance(obj, FEED_MODELS):
+            old_status = _status_change(obj)
+            if old_status is not None:
+                changes.append((obj, 'updated', old_status))
+    if changes:
+        _queue_events(session, changes)
+
+
+def record_status_change(obj, old_status, session=None):
+    """用 UPDATE 语句（不经过 flush）改了状态时调用，提交后照常推送；obj.status 须已是新状态"""
+    _queue_events(session or db.session, [(obj, 'updated', old_status)])
+
+
+def _queue_events(session, changes):
+    """changes: [(对象, 'created' / 'updated', 原状态)]，整理成事件，提交后发布"""
+    # 一次查出涉及的宿舍所在楼栋和学生姓名
+    dorm_ids = {obj.dorm_id if isinstance(obj, Repair) else obj.current_dorm_id
+                for obj, _action, _old in changes if not isinstance(obj, Visitor)}
+    dorm_numbers = {obj.dorm_number for obj, _action, _old in changes if isinstance(obj, Visitor)}
+    buildings_by_id, buildings_by_number = {}, {}
+    for dorm_id, dorm_number, building in session.execute(
+            select(Dormitory.id, Dormitory.dorm_number, Dormitory.building)
+            .where(or_(Dormitory.id.in_(dorm_ids - {None}), Dormitory.dorm_number.in_(dorm_numbers)))):
+        buildings_by_id[dorm_id] = building
+        buildings_by_number[dorm_number] = building
+    student_ids = {obj.student_id for obj, _action, _old in changes if not isinstance(obj, Visitor)}
+    student_names = dict(session.execute(select(Student.id, Student.name).where(Student.id.in_(student_ids)))
+                         .all()) if student_ids else {}
+
+    pending = session.info.setdefault('live_feed_events', [])
+    for obj, action, old_status in changes:
+        if isinstance(obj, Visitor):
+            building = buildings_by_number.get(obj.dorm_number)
+        else:
+            building = buildings_by_id.get(obj.dorm_id if isinstance(obj, Repair) else obj.current_dorm_id)
+        if building is None:
+            continue
+        kind, title, description, when = _describe(obj, student_names)
+        pending.append((building, kind, {
+            'type': kind,
+            'id': obj.id,
+            'action': action,
+            'status': obj.status,
+            'old_status': old_status,
+            'title': title,
+            'description': description,
+            'time': when.strftime('%Y-%m-%d %H:%M') if when else '',
+        }))
+
+
+def _after_commit(session):
+    for building, kind, data in session.info.pop('live_feed_events', ()):
+        bus.publish(building, kind, data)
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('live_feed_events', None)
+
+
+def register_events():
+    """注册会话事件：相关写入提交后发布到总线"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_transaction_end', _after_transaction_end)
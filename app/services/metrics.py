@@ -0,0 +1,291 @@
+# 请求性能指标：按端点统计耗时、SQL语句数、SQL耗时和模板渲染耗时
+# 数据放在进程内的固定桶直方图里（每次观测只是一次二分查找和几次加法），
+# 管理员页面查看汇总，/admin/metrics/prometheus 输出 Prometheus 文本格式。
+# 多 worker 汇总：配置了 METRICS_DIR（gunicorn.conf.py 会自动创建）时，每个 worker 最多每 DUMP_INTERVAL 秒
+# 把自己的直方图写到该目录下的 <pid>.json，查看和抓取时合并目录中全部文件，Prometheus 随机抓到哪个 worker
+# 都是全部 worker 的累计值；已退出的 worker 的文件保留，计数不会因 worker 重启而倒退。
+# 其他 worker 最近不到 DUMP_INTERVAL 秒的观测可能还没写出（间隔内的观测由一次性定时器补写）。未配置时只统计当前进程。
+import json
+import os
+import threading
+from bisect import bisect_left
+from time import monotonic, perf_counter
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.services.query_budget import statement_count
+
+# 秒
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+# 指标名 -> (桶, 说明)
+METRICS = {
+    'request_duration_seconds': (TIME_BUCKETS, '请求总耗时'),
+    'request_sql_statements': (COUNT_BUCKETS, '每个请求执行的SQL语句数'),
+    'request_sql_duration_seconds': (TIME_BUCKETS, '每个请求的SQL执行耗时'),
+    'request_template_duration_seconds': (TIME_BUCKETS, '每个请求的模板渲染耗时'),
+}
+PROMETHEUS_PREFIX = 'dorm_'
+# 没有匹配到路由的请求（404等）归为一类，避免端点数量无限增长
+UNMATCHED_ENDPOINT = '<unmatched>'
+# 秒，worker 写出直方图的最短间隔
+DUMP_INTERVAL = 1.0
+# METRICS_DIR 中记录“清空”次数的文件，worker 发现它变化后丢弃自己的数据
+GENERATION_FILE = 'generation'
+
+
+class Histogram:
+    """固定桶直方图：各桶计数（非累计）、总和、次数"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        for i, value in enumerate(counts):
+            self.counts[i] += value
+        self.sum += total
+        self.count += count
+
+    def cumulative(self):
+        """[(上界, 累计次数)]，最后一项上界为 +Inf"""
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """按桶估算分位数（返回所在桶的上界）"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0
+
+
+def _new_histograms():
+    return {name: Histogram(buckets) for name, (buckets, _help) in METRICS.items()}
+
+
+class MetricsRegistry:
+    """端点 -> {指标名: 直方图}，线程安全；设置 directory 后与其他 worker 经文件汇总"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._generation = None
+        self._dumped_at = None
+        self._timer = None
+
+    def observe(self, endpoint, values):
+        with self._lock:
+            histograms = self._endpoints.get(endpoint)
+            if histograms is None:
+                histograms = self._endpoints[endpoint] = _new_histograms()
+            for name, value in values.items():
+                histograms[name].observe(value)
+            if not self.directory:
+                return
+            wait = 0 if self._dumped_at is None else DUMP_INTERVAL - (monotonic() - self._dumped_at)
+            if 0 < wait and self._timer is None:
+                # 间隔内的观测由定时器补写，请求停下来后数据也会在 DUMP_INTERVAL 秒内写出
+                self._timer = threading.Timer(wait, self.dump)
+                self._timer.daemon = True
+                self._timer.start()
+        if wait <= 0:
+            self.dump()
+
+    # ---- 多 worker 汇总 ----
+
+    def _read_generation(self):
+        try:
+            with open(os.path.join(self.directory, GENERATION_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ''
+
+    def dump(self):
+        """把本进程的直方图写到 METRICS_DIR/<pid>.json（先写临时文件再改名，读的一方不会读到半个文件）"""
+        if not self.directory:
+            return
+        generation = self._read_generation()
+        with self._lock:
+            if self._generation is not None and generation != self._generation:
+                # 其他 worker 清空过指标
+                self._endpoints.clear()
+            self._generation = generation
+            self._dumped_at = monotonic()
+            self._timer = None
+            data = {endpoint: {name: [histogram.counts, histogram.sum, histogram.count]
+                               for name, histogram in histograms.items()}
+                    for endpoint, histograms in self._endpoints.items()}
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def _collect(self):
+        """全部 worker 合并后的 {端点: {指标名: 直方图}}；未配置目录时为本进程数据"""
+        if not self.directory:
+            return self._endpoints
+        self.dump()
+        merged = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for endpoint, values in data.items():
+                histograms = merged.setdefault(endpoint, _new_histograms())
+                for name, (counts, total, count) in values.items():
+                    if name in histograms:
+                        histograms[name].merge(counts, total, count)
+        return merged
+
+    def snapshot(self):
+        """各端点汇总（均值/分位数），按总耗时降序"""
+        endpoints = self._collect()
+        with self._lock:
+            rows = []
+            for endpoint, histograms in endpoints.items():
+                duration = histograms['request_duration_seconds']
+                rows.append({
+                    'endpoint': endpoint,
+                    'requests': duration.count,
+                    'total_time': duration.sum,
+                    'mean_time': duration.mean,
+                    'p50_time': duration.quantile(0.5),
+                    'p95_time': duration.quantile(0.95),
+                    'mean_sql_statements': histograms['request_sql_statements'].mean,
+                    'p95_sql_statements': histograms['request_sql_statements'].quantile(0.95),
+                    'mean_sql_time': histograms['request_sql_duration_seconds'].mean,
+                    'mean_template_time': histograms['request_template_duration_seconds'].mean,
+                })
+        rows.sort(key=lambda row: row['total_time'], reverse=True)
+        return rows
+
+    def prometheus(self):
+        """Prometheus 文本格式"""
+        endpoints = self._collect()
+        with self._lock:
+            lines = []
+            for name, (_buckets, help_text) in METRICS.items():
+                full_name = PROMETHEUS_PREFIX + name
+                lines.append(f'# HELP {full_name} {help_text}')
+                lines.append(f'# TYPE {full_name} histogram')
+                for endpoint in sorted(endpoints):
+                    histogram = endpoints[endpoint][name]
+                    label = _escape_label(endpoint)
+                    for bound, total in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{full_name}_bucket{{endpoint="{label}",le="{le}"}} {total}')
+                    lines.append(f'{full_name}_sum{{endpoint="{label}"}} {histogram.sum:.6f}')
+                    lines.append(f'{full_name}_count{{endpoint="{label}"}} {histogram.count}')
+            return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """清空指标；配置了目录时同时清空所有 worker 的数据"""
+        with self._lock:
+            self._endpoints.clear()
+        if not self.directory:
+            return
+        generation = str(int(self._read_generation() or 0) + 1)
+        with open(os.path.join(self.directory, GENERATION_FILE), 'w') as f:
+            f.write(generation)
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._generation = generation
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+# ---- SQL 耗时：计时放在本次执行的上下文对象上，出错时也不会残留 ----
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None and has_app_context():
+        g.sql_time = g.get('sql_time', 0.0) + perf_counter() - started
+
+
+# ---- 模板渲染耗时 ----
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('template_started', []).append(perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    started = g.get('template_started')
+    if started:
+        elapsed = perf_counter() - started.pop()
+        # 嵌套渲染只计最外层，避免重复计时
+        if not started:
+            g.template_time = g.get('template_time', 0.0) + elapsed
+
+
+# ---- 请求钩子 ----
+
+def _before_request():
+    g.request_started = perf_counter()
+
+
+def _teardown_request(exc):
+    started = g.get('request_started')
+    if started is None:
+        return
+    registry.observe(request.endpoint or UNMATCHED_ENDPOINT, {
+        'request_duration_seconds': perf_counter() - started,
+        'request_sql_statements': statement_count(),
+        'request_sql_duration_seconds': g.get('sql_time', 0.0),
+        'request_template_duration_seconds': g.get('template_time', 0.0),
+    })
+
+
+def init_app(app):
+    """配置 METRICS_ENABLED 为真时注册指标采集"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    registry.directory = app.config.get('METRICS_DIR')
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
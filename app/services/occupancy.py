@@ -0,0 +1,157 @@
+# 宿舍入住人数的原子更新
+# 人数一律在数据库端用带条件的 UPDATE 增减，不在 Python 中读出、加减再写回：
+#   UPDATE dormitories SET current_occupancy = current_occupancy + n
+#   WHERE id = ? AND current_occupancy + n <= capacity
+# 受影响行数为 0 说明宿舍已满（或不存在），调用方回滚整个事务。多个进程并发入住同一宿舍时，
+# 数据库逐条执行这些 UPDATE，既不会丢失更新，也不会超员。学生换宿舍同样以原宿舍为条件更新，
+# 同一学生被并发重复调换时只有一次生效。人数有变化时同时更新空床位索引的版本号（见 vacancy.py），
+# 学生宿舍有变化时使登录身份缓存失效（见 identity.py）。
+# 以下函数都不提交事务。
+from sqlalchemy import and_, bindparam, case, func, select
+
+from app import db
+from app.models.models import Dormitory, Student
+from app.services.identity import forget_students
+from app.services.vacancy import bump_version
+
+_dorms = Dormitory.__table__
+_students = Student.__table__
+_occupancy = func.coalesce(_dorms.c.current_occupancy, 0)
+
+
+class OccupancyError(Exception):
+    """宿舍已满，或学生所在宿舍已被其他操作改变"""
+
+
+def check_in(dorm_id, count=1):
+    """宿舍人数加 count，超出容量时抛出 OccupancyError"""
+    result = db.session.execute(
+        _dorms.update()
+        .where(_dorms.c.id == dorm_id, _occupancy + count <= _dorms.c.capacity)
+        .values(current_occupancy=_occupancy + count)
+    )
+    if result.rowcount != 1:
+        raise OccupancyError('目标宿舍已住满！')
+    bump_version([dorm_id])
+
+
+def check_out(dorm_id, count=1):
+    """宿舍人数减 count，最少减到 0（人数已失准时交给对账修正）；人数原本为 0 时返回 False"""
+    result = db.session.execute(
+        _dorms.update()
+        .where(_dorms.c.id == dorm_id, _occupancy > 0)
+        .values(current_occupancy=case((_occupancy > count, _occupancy - count), else_=0))
+    )
+    if result.rowcount != 1:
+        return False
+    bump_version([dorm_id])
+    return True
+
+
+def move_student(student_id, from_dorm_id, to_dorm_id):
+    """把学生从 from_dorm_id 调到 to_dorm_id（均可为 None），同时维护两边的人数
+
+    学生当前不在 from_dorm_id（已被其他操作调走）或目标宿舍已满时抛出 OccupancyError。
+    """
+    if from_dorm_id == to_dorm_id:
+        return
+    result = db.session.execute(
+        _students.update()
+        .where(_students.c.id == student_id, _students.c.dorm_id.is_not_distinct_from(from_dorm_id))
+        .values(dorm_id=to_dorm_id)
+    )
+    if result.rowcount != 1:
+        raise OccupancyError('该学生的宿舍已被其他操作调整，请刷新后重试！')
+    forget_students([student_id])
+    if to_dorm_id is not None:
+        check_in(to_dorm_id)
+    if from_dorm_id is not None:
+        check_out(from_dorm_id)
+
+
+def assign_students(assignments):
+    """批量入住 [(学生ID, 宿舍ID)]：学生须仍未分配宿舍，各宿舍加上入住人数后不超过容量
+
+    学生和宿舍各一次 executemany；任何一行条件不满足都抛出 OccupancyError，由调用方回滚。
+    """
+    added = {}
+    for _student_id, dorm_id in assignments:
+        added[dorm_id] = added.get(dorm_id, 0) + 1
+
+    result = db.session.execute(
+        _students.update()
+        .where(_students.c.id == bindparam('b_student_id'), _students.c.dorm_id.is_(None))
+        .values(dorm_id=bindparam('b_dorm_id')),
+        [{'b_student_id': student_id, 'b_dorm_id': dorm_id} for student_id, dorm_id in assignments]
+    )
+    if result.rowcount != len(assignments):
+        raise OccupancyError('部分学生已被其他操作分配宿舍，请重新分配！')
+    forget_students(student_id for student_id, _dorm_id in assignments)
+
+    result = db.session.execute(
+        _dorms.update()
+        .where(_dorms.c.id == bindparam('b_dorm_id'), _occupancy + bindparam('b_added') <= _dorms.c.capacity)
+        .values(current_occupancy=_occupancy + bindparam('b_added')),
+        [{'b_dorm_id': dorm_id, 'b_added': count} for dorm_id, count in added.items()]
+    )
+    if result.rowcount != len(added):
+        raise OccupancyError('部分宿舍已被其他操作住满，请重新分配！')
+    bump_version(added)
+
+
+class ReconcileResult:
+    """对账结果：核对的宿舍数，人数不符的 [(宿舍ID, 宿舍号, 记录人数, 实际人数, 容量)]，
+    以及核对期间被其他操作改动、本次未修正的宿舍数"""
+
+    def __init__(self, checked, mismatches, fixed=0, skipped=0):
+        self.checked = checked
+        self.mismatches = mismatches
+        self.fixed = fixed
+        self.skipped = skipped
+
+    @property
+    def drift(self):
+        """记录人数与实际人数之差的绝对值之和"""
+        return sum(abs((stored or 0) - actual) for _id, _number, stored, actual, _capacity in self.mismatches)
+
+    @property
+    def over_capacity(self):
+        return [row for row in self.mismatches if row[3] > (row[4] or 0)]
+
+
+def reconcile_occupancy(apply=True):
+    """用一条 GROUP BY 统计每间宿舍实际住着的未删除学生数，与 current_occupancy 对比
+
+    apply 时用一次 executemany 修正全部不符的宿舍并提交。每行以对账时读到的人数为条件更新，
+    期间被其他入住操作改动过的宿舍跳过（下次对账再修正），不会覆盖并发写入。
+    """
+    actual = func.count(_students.c.id)
+    rows = db.session.execute(
+        select(_dorms.c.id, _dorms.c.dorm_number, _dorms.c.current_occupancy, actual, _dorms.c.capacity)
+        .select_from(_dorms.outerjoin(_students, and_(_students.c.dorm_id == _dorms.c.id,
+                                                      _students.c.is_deleted == False)))
+        .group_by(_dorms.c.id)
+        .order_by(_dorms.c.id)
+    ).all()
+    mismatches = [tuple(row) for row in rows if row[2] != row[3]]
+    result = ReconcileResult(len(rows), mismatches)
+    if not apply or not mismatches:
+        return result
+
+    try:
+        result.fixed = db.session.execute(
+            _dorms.update()
+            .where(_dorms.c.id == bindparam('b_id'),
+                   _dorms.c.current_occupancy.is_not_distinct_from(bindparam('b_stored')))
+            .values(current_occupancy=bindparam('b_actual')),
+            [{'b_id': dorm_id, 'b_stored': stored, 'b_actual': count}
+             for dorm_id, _number, stored, count, _capacity in mismatches]
+        ).rowcount
+        result.skipped = len(mismatches) - result.fixed
+        if result.fixed:
+            bump_version([row[0] for row in mismatches])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
@@ -0,0 +1,155 @@
+# 列表页的键集（seek）分页
+# 不用 OFFSET：按排序键记住上一页最后一行，下一页从它之后继续查，
+# 翻到多深每页都只读 per_page+1 行，取页耗时与表大小无关。
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request, url_for
+from sqlalchemy import and_, false, or_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+class Page:
+    """一页数据及前后翻页链接"""
+
+    def __init__(self, items, per_page, next_url=None, prev_url=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_url = next_url
+        self.prev_url = prev_url
+
+    @property
+    def has_next(self):
+        return self.next_url is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_url is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(sort, values):
+    payload = json.dumps([sort, [_encode_value(v) for v in values]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort):
+    """解析游标；格式错误或排序方式不一致时返回 None（回到第一页）"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort, values = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+        if cursor_sort != sort or not isinstance(values, list):
+            return None
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+
+
+def _beyond(column, value, descending):
+    """按扫描方向（descending 为从大到小）严格位于 value 之后的条件。
+    SQLite 和 MySQL 中 NULL 排在最小：从大到小扫描时 NULL 在最后，从小到大时在最前"""
+    if descending:
+        return false() if value is None else or_(column < value, column.is_(None))
+    return column.is_not(None) if value is None else column > value
+
+
+def _seek(order, values, forward):
+    """排序键严格位于游标之后（forward）或之前的条件，支持升降序混合；排序列可以为 NULL"""
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        beyond = _beyond(column, values[i], descending == forward)
+        # c == None 生成 IS NULL
+        clauses.append(and_(*[c == v for (c, _d), v in zip(order[:i], values[:i])], beyond))
+    return or_(*clauses)
+
+
+def _order_by(order, forward):
+    return [column.desc() if descending == forward else column.asc() for column, descending in order]
+
+
+def _row_key(item, order):
+    return [getattr(item, column.key) for column, _descending in order]
+
+
+def _page_url(**cursor):
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def per_page_arg():
+    try:
+        per_page = int(request.args.get('per_page', DEFAULT_PER_PAGE))
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def paginate(query, order, sort='default', per_page=None):
+    """按 order（[(列, 是否降序)]，最后一列必须唯一，如主键）对 query 做键集分页
+
+    翻页位置来自请求参数 after / before，其余请求参数（筛选条件）原样保留在翻页链接中。
+    """
+    if per_page is None:
+        per_page = per_page_arg()
+    after = decode_cursor(request.args.get('after'), sort)
+    before = decode_cursor(request.args.get('before'), sort) if after is None else None
+
+    forward = before is None
+    cursor = after if forward else before
+    if cursor is not None and len(cursor) == len(order):
+        query = query.filter(_seek(order, cursor, forward))
+    else:
+        cursor = None
+    rows = query.order_by(*_order_by(order, forward)).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_url = prev_url = None
+    if rows:
+        first, last = encode_cursor(sort, _row_key(rows[0], order)), encode_cursor(sort, _row_key(rows[-1], order))
+        if (more if forward else cursor is not None):
+            next_url = _page_url(after=last)
+        if (cursor is not None if forward else more):
+            prev_url = _page_url(before=first)
+    elif cursor is not None:
+        # 越过了末尾（如数据被删除），提供回到第一页的链接
+        prev_url = _page_url()
+    return Page(rows, per_page, next_url, prev_url)
+
+
+def prefix_filter(column, prefix):
+    """前缀匹配写成范围条件，可以使用列上的索引（LIKE 'x%' 在SQLite中默认用不上）"""
+    return and_(column >= prefix, column < prefix + '\U0010ffff')
@@ -0,0 +1,35 @@
+# 登录密码校验与初始密码
+# 批量导入时未填初始密码的学生，password 列存入标记 UNSET_PASSWORD 而不是默认密码的哈希：
+# 所有人共用一个哈希的话，破解一个就等于知道了全部账号的密码；每人单独加盐计算又要约 0.2 秒，
+# 上千人的导入会超时。这类账号只能用默认密码 DEFAULT_PASSWORD 登录，登录后必须先修改密码
+# （见 student.change_password），修改前不能使用其他功能。
+import hmac
+
+from werkzeug.security import check_password_hash
+
+DEFAULT_PASSWORD = '123456'
+# 不是合法的哈希格式，check_password_hash 对它总是返回 False
+UNSET_PASSWORD = '!unset'
+MIN_LENGTH = 6
+
+
+def must_change_password(user):
+    return user.password == UNSET_PASSWORD
+
+
+def check_password(user, password):
+    """校验登录密码；尚未设置密码的账号只接受默认密码"""
+    if must_change_password(user):
+        return hmac.compare_digest(password.encode('utf-8'), DEFAULT_PASSWORD.encode('utf-8'))
+    return check_password_hash(user.password, password)
+
+
+def validate_new_password(password, confirm_password):
+    """返回错误原因，合格时返回 None"""
+    if len(password) < MIN_LENGTH:
+        return f'密码至少 {MIN_LENGTH} 位'
+    if password == DEFAULT_PASSWORD:
+        return '不能使用默认密码'
+    if password != confirm_password:
+        return '两次输入的密码不一致'
+    return None
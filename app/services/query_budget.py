@@ -0,0 +1,37 @@
+# 每个请求的SQL语句计数与上限检查
+# 所有引擎执行语句前计数到 g.sql_statements；配置了 SQL_STATEMENT_BUDGET 时，
+# 请求结束发现超出上限即抛出 QueryBudgetExceeded，用于测试中发现 N+1 查询。
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """单个请求执行的SQL语句数超过上限"""
+
+
+def statement_count():
+    """当前请求（应用上下文）内已执行的SQL语句数"""
+    return g.get('sql_statements', 0)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def _check_budget(response):
+    budget = current_app.config.get('SQL_STATEMENT_BUDGET')
+    count = statement_count()
+    if budget is not None and count > budget:
+        raise QueryBudgetExceeded(
+            f'{request.method} {request.path} 执行了 {count} 条SQL语句，超过上限 {budget}'
+        )
+    return response
+
+
+def init_app(app):
+    """注册语句计数监听器和请求结束时的上限检查"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    app.after_request(_check_budget)
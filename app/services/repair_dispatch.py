@@ -0,0 +1,161 @@
+# 报修派单队列
+# 待处理的报修按优先级排序：紧急程度折算的小时数 + 已等待的小时数，分数高的先处理
+# （默认“紧急”相当于多等了一天，“非常紧急”相当于多等了三天，普通报修等得够久也会排到前面）。
+# 同一紧急程度内分数只取决于提交时间，因此队列前 N 条一定在“每个紧急程度最早的 N 条”和
+# “全部待处理中最早的 N 条”（覆盖普通及未填写紧急程度的报修）之中：用索引各取 N 条，
+# 一条 UNION ALL 查回后在内存中算分合并，不需要扫描全部待处理报修。
+# 领取（pending → processing）、完成（processing → completed）和退回（processing → pending）
+# 都以原状态为条件更新，多人同时领取时每条报修只有一人成功，失败的人自动领取下一条。
+from datetime import datetime
+
+from sqlalchemy import delete, select, union_all, update
+from sqlalchemy.orm import contains_eager, joinedload
+
+from app import db
+from app.models.models import Dormitory, Repair, RepairClaim
+from app.services import dashboard_stats, live_feed
+
+# 紧急程度折算的小时数，未列出的按 0 计
+URGENCY_HOURS = {'normal': 0, 'urgent': 24, 'very_urgent': 72}
+QUEUE_LIMIT = 50
+# 每轮取多少条候选依次尝试领取，以及最多重取几轮
+CLAIM_BATCH = 10
+CLAIM_ROUNDS = 3
+
+
+class DispatchError(Exception):
+    """报修不存在、状态已变化或无权操作"""
+
+
+def priority_score(urgent_level, created_at, now):
+    """优先级分数（小时）"""
+    waited = (now - created_at).total_seconds() / 3600 if created_at else 0
+    return URGENCY_HOURS.get(urgent_level, 0) + max(waited, 0)
+
+
+def _open_repairs(columns, building=None):
+    query = select(*columns).where(Repair.status == 'pending', Repair.is_deleted == False)
+    if building:
+        query = query.where(Repair.dorm_id.in_(select(Dormitory.id).where(Dormitory.building == building)))
+    return query
+
+
+def _ranked_ids(limit, building=None, now=None, exclude=()):
+    """按优先级排好的 [(分数, 报修ID)]，最多 limit 条"""
+    now = now or datetime.utcnow()
+    columns = (Repair.id, Repair.urgent_level, Repair.created_at)
+    order = (Repair.created_at, Repair.id)
+    streams = [_open_repairs(columns, building).order_by(*order).limit(limit)]
+    for level, hours in URGENCY_HOURS.items():
+        if hours > 0:
+            streams.append(_open_repairs(columns, building).where(Repair.urgent_level == level)
+                           .order_by(*order).limit(limit))
+    # SQLite 的复合查询中每个带 LIMIT 的分支须包成子查询
+    rows = db.session.execute(union_all(*[select(stream.subquery()) for stream in streams])).all()
+    ranked = {}
+    for repair_id, urgent_level, created_at in rows:
+        if repair_id not in exclude:
+            ranked[repair_id] = (priority_score(urgent_level, created_at, now), created_at or now, repair_id)
+    ordered = sorted(ranked.values(), key=lambda item: (-item[0], item[1], item[2]))
+    return [(score, repair_id) for score, _created_at, repair_id in ordered[:limit]]
+
+
+def dispatch_queue(limit=QUEUE_LIMIT, building=None, now=None):
+    """队列前 limit 条：[(分数, 报修)]"""
+    ranked = _ranked_ids(limit, building, now)
+    repairs = {repair.id: repair for repair in Repair.query.options(
+        joinedload(Repair.dormitory), joinedload(Repair.student)
+    ).filter(Repair.id.in_([repair_id for _score, repair_id in ranked]))} if ranked else {}
+    return [(score, repairs[repair_id]) for score, repair_id in ranked if repair_id in repairs]
+
+
+def claimed_repairs(user_id):
+    """某用户领取后尚未完成的报修，先领的在前"""
+    return Repair.query.join(RepairClaim).options(
+        contains_eager(Repair.claim), joinedload(Repair.dormitory), joinedload(Repair.student)
+    ).filter(
+        RepairClaim.claimed_by == user_id,
+        Repair.status == 'processing',
+        Repair.is_deleted == False
+    ).order_by(RepairClaim.claimed_at).all()
+
+
+def _transition(repair_id, from_status, to_status):
+    """以原状态为条件修改报修状态，状态已被别人改掉时返回 False"""
+    result = db.session.execute(
+        update(Repair)
+        .where(Repair.id == repair_id, Repair.status == from_status, Repair.is_deleted == False)
+        .values(status=to_status, updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        return False
+    repair = db.session.get(Repair, repair_id)
+    live_feed.record_status_change(repair, from_status)
+    # UPDATE 语句不经过 flush，手动标记，提交后管理员仪表板的待处理计数随之失效
+    dashboard_stats.mark_dirty()
+    return True
+
+
+def claim_next(user_id, building=None, now=None):
+    """领取队列中优先级最高的报修，返回该报修；队列为空时返回 None。不提交事务"""
+    tried = set()
+    for _round in range(CLAIM_ROUNDS):
+        candidates = _ranked_ids(CLAIM_BATCH, building, now, exclude=tried)
+        if not candidates:
+            return None
+        for _score, repair_id in candidates:
+            tried.add(repair_id)
+            if _transition(repair_id, 'pending', 'processing'):
+                # 报修被完成后又改回待处理时，可能还留着上一次的领取记录
+                db.session.execute(delete(RepairClaim).where(RepairClaim.repair_id == repair_id))
+                db.session.add(RepairClaim(repair_id=repair_id, claimed_by=user_id))
+                db.session.flush()
+                return db.session.get(Repair, repair_id)
+    return None
+
+
+def _own_claim(repair_id, user_id, is_admin):
+    claim = db.session.get(RepairClaim, repair_id)
+    if claim is None or claim.completed_at is not None:
+        raise DispatchError('该报修不在处理中！')
+    if claim.claimed_by != user_id and not is_admin:
+        raise DispatchError('该报修由其他人领取，无权操作！')
+    return claim
+
+
+def complete_repair(repair_id, user_id, is_admin=False):
+    """完成自己领取的报修（管理员可完成任何人领取的）。不提交事务"""
+    claim = _own_claim(repair_id, user_id, is_admin)
+    if not _transition(repair_id, 'processing', 'completed'):
+        raise DispatchError('该报修状态已变化，请刷新后重试！')
+    claim.completed_at = datetime.utcnow()
+    return claim.repair
+
+
+def release_repair(repair_id, user_id, is_admin=False):
+    """退回领取的报修，重新进入队列。不提交事务"""
+    claim = _own_claim(repair_id, user_id, is_admin)
+    if not _transition(repair_id, 'processing', 'pending'):
+        raise DispatchError('该报修状态已变化，请刷新后重试！')
+    repair = claim.repair
+    db.session.delete(claim)
+    return repair
+
+
+def repair_dict(repair, score=None):
+    """接口返回的报修字段"""
+    data = {
+        'id': repair.id,
+        'title': repair.title,
+        'status': repair.status,
+        'urgent_level': repair.urgent_level,
+        'repair_type': repair.repair_type,
+        'location_detail': repair.location_detail,
+        'dorm_number': repair.dormitory.dorm_number if repair.dormitory else None,
+        'student_name': repair.student.name if repair.student else None,
+        'contact_phone': repair.contact_phone,
+        'created_at': repair.created_at.strftime('%Y-%m-%d %H:%M') if repair.created_at else None,
+    }
+    if score is not None:
+        data['priority'] = round(score, 1)
+    return data
@@ -0,0 +1,190 @@
+# 报修全文搜索（SQLite FTS5）
+# repairs_fts 是 FTS5 虚拟表，rowid 即报修ID，索引标题、内容和位置描述三列。
+# FTS5 自带的 unicode61 分词器把一串连续汉字当成一个词，trigram 分词器又搜不了两个字的词（如“漏水”），
+# 所以写入索引前先在 Python 中把连续汉字切成相邻两字（“空调漏水” → 空调 调漏 漏水 水），
+# 查询词按同样方式切开后作为短语匹配，任意长度的中文片段都能搜到；字母和数字仍按整词匹配。
+# - 报修的新建、修改和删除在 flush 时同步到索引（会话事件，与水电费汇总表相同）；
+#   直接用 SQL 批量写入报修后执行 flask --app run rebuild-repair-search 重建。
+# - 排序用 bm25 相关度（标题权重最高），楼栋、状态等筛选条件在同一条查询中关联报修表完成。
+#   FTS5 只能对全部匹配逐条算分再排序，“空调”这类常见词在百万条报修中有几万条匹配，
+#   所以只在最新的 RANK_CANDIDATES 条匹配中按相关度排序翻页；要浏览全部匹配可改为按时间排序。
+# - 非 SQLite 数据库或尚未建立索引时退化为 LIKE '%词%' 过滤，不支持按相关度排序。
+import re
+import weakref
+
+from sqlalchemy import and_, column, event, func, inspect, literal_column, or_, select, table, text
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import Repair
+from app.services.db_routing import read_connection
+
+FTS_TABLE = 'repairs_fts'
+FTS = table(FTS_TABLE, column('rowid'), column('title'), column('content'), column('location_detail'))
+INDEXED_FIELDS = ('title', 'content', 'location_detail')
+# bm25 中各列的权重，顺序同 INDEXED_FIELDS
+WEIGHTS = (5.0, 1.0, 2.0)
+# 按相关度排序时最多对多少条（最新的）匹配计算相关度
+RANK_CANDIDATES = 2000
+
+CREATE_SQL = f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({', '.join(INDEXED_FIELDS)})"
+
+# 汉字（含日文假名、韩文）按两字切分，其余字母数字按整词
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_PIECE = re.compile(f'([{_CJK}]+)|((?:(?![{_CJK}])[^\\W_])+)')
+
+# 引擎 -> 是否可以使用全文索引
+_ready = weakref.WeakKeyDictionary()
+
+
+def _grams(run, closed):
+    """连续汉字切成相邻两字；closed 时末尾再加上最后一个字。
+    索引中每段都加，这样每个字都是某个词的开头，单字可以用前缀查询搜到"""
+    grams = [run[i:i + 2] for i in range(len(run) - 1)]
+    if closed or len(run) == 1:
+        grams.append(run[-1])
+    return grams
+
+
+def index_text(value):
+    """写入索引的文本：汉字切成两字一词，用空格分隔"""
+    tokens = []
+    for cjk, word in _PIECE.findall(value or ''):
+        tokens.extend([word] if word else _grams(cjk, closed=True))
+    return ' '.join(tokens)
+
+
+def match_expression(search):
+    """用户输入的搜索词 -> FTS5 查询表达式；空格分隔的多个词须同时出现，没有可搜索的字符时返回 None"""
+    phrases = []
+    for term in search.split():
+        pieces = _PIECE.findall(term)
+        tokens, prefix = [], False
+        for i, (cjk, word) in enumerate(pieces):
+            last = i == len(pieces) - 1
+            if word:
+                tokens.append(word)
+            elif len(cjk) == 1:
+                # 单个汉字在词尾时，可能是索引中某个两字词的开头
+                tokens.append(cjk)
+                prefix = last
+            else:
+                # 汉字后面还有字母数字时，索引中这段汉字一定在此结束，带上末字
+                tokens.extend(_grams(cjk, closed=not last))
+        if tokens:
+            # 词中只有字母、数字和汉字，不会出现引号，无需转义
+            phrases.append(f'"{" ".join(tokens)}"' + (' *' if prefix else ''))
+    return ' AND '.join(phrases) or None
+
+
+def index_ready(connection=None):
+    """当前数据库是否为 SQLite 且已建立全文索引（按引擎缓存）"""
+    if connection is None:
+        connection = read_connection()
+    engine = connection.engine
+    if engine not in _ready:
+        _ready[engine] = connection.dialect.name == 'sqlite' and inspect(connection).has_table(FTS_TABLE)
+    return _ready[engine]
+
+
+def _match(expression):
+    return literal_column(FTS_TABLE).op('MATCH')(expression)
+
+
+def match_condition(search):
+    """报修查询的全文搜索条件；没有可搜索的字符时返回 None"""
+    if index_ready():
+        expression = match_expression(search)
+        if expression is None:
+            return None
+        return Repair.id.in_(select(FTS.c.rowid).where(_match(expression)))
+    terms = search.split()
+    if not terms:
+        return None
+    return and_(*[or_(*[getattr(Repair, field).contains(term, autoescape=True) for field in INDEXED_FIELDS])
+                  for term in terms])
+
+
+def ranked_query(search, conditions):
+    """按相关度排序的 (查询, 排序键)：查询返回报修ID和 bm25 分数（越小越相关），
+    conditions 为报修表上的其他筛选条件。不能使用全文索引时返回 None"""
+    expression = match_expression(search)
+    if expression is None or not index_ready():
+        return None
+    # 先按 rowid 倒序（即最新在前）取满足条件的前 RANK_CANDIDATES 条，FTS5 可以提前结束，
+    # 只对这些候选计算相关度；匹配数少于该值时就是全部匹配
+    score = func.bm25(literal_column(FTS_TABLE), *WEIGHTS).label('score')
+    candidates = select(Repair.id, score).select_from(FTS).join(Repair, Repair.id == FTS.c.rowid) \
+        .where(_match(expression), *conditions).order_by(FTS.c.rowid.desc()).limit(RANK_CANDIDATES).subquery()
+    query = db.session.query(candidates.c.id, candidates.c.score)
+    return query, [(candidates.c.score, False), (candidates.c.id, False)]
+
+
+def _index_rows(repairs):
+    return [{'rowid': repair.id, **{field: index_text(getattr(repair, field)) for field in INDEXED_FIELDS}}
+            for repair in repairs]
+
+
+def _after_flush(session, flush_context):
+    # flush 后 new/dirty 和属性的修改历史仍保留 flush 前的内容
+    new = [obj for obj in session.new if isinstance(obj, Repair)]
+    deleted_ids = {obj.id for obj in session.deleted if isinstance(obj, Repair)}
+    changed = [obj for obj in session.dirty
+               if isinstance(obj, Repair) and obj.id not in deleted_ids
+               and any(inspect(obj).attrs[field].history.has_changes() for field in INDEXED_FIELDS)]
+    if not (new or changed or deleted_ids):
+        return
+    connection = session.connection()
+    if not index_ready(connection):
+        return
+    stale_ids = deleted_ids | {obj.id for obj in changed}
+    if stale_ids:
+        connection.execute(FTS.delete().where(FTS.c.rowid.in_(stale_ids)))
+    if new or changed:
+        connection.execute(FTS.insert(), _index_rows(new + changed))
+
+
+def _create_with_repairs(target, connection, **kw):
+    # 新建数据库时随报修表一起建立（空的）全文索引
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(CREATE_SQL))
+        _ready.pop(connection.engine, None)
+
+
+def register_events():
+    """注册 flush 事件，使全文索引随报修变化自动维护"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Repair.__table__, 'after_create', _create_with_repairs)
+
+
+def rebuild_index(connection=None):
+    """重建全文索引，返回索引的报修数；非 SQLite 数据库返回 None"""
+    if connection is None:
+        connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return None
+    # 分词函数注册到当前连接上，整表在数据库内一条 INSERT ... SELECT 写入
+    connection.connection.driver_connection.create_function(
+        'repair_index_text', 1, index_text, deterministic=True)
+    repairs = Repair.__table__
+    connection.execute(text(f'DROP TABLE IF EXISTS {FTS_TABLE}'))
+    connection.execute(text(CREATE_SQL))
+    result = connection.execute(FTS.insert().from_select(
+        ['rowid'] + list(INDEXED_FIELDS),
+        select(repairs.c.id, *[func.repair_index_text(repairs.c[field]) for field in INDEXED_FIELDS])
+    ))
+    # 合并批量写入产生的多个 b 树段，查询更快
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')"))
+    _ready.pop(connection.engine, None)
+    return result.rowcount
+
+
+def ensure_index():
+    """旧库升级：SQLite 数据库中还没有全文索引时建立并填充，返回是否新建"""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite' or inspect(connection).has_table(FTS_TABLE):
+        return False
+    rebuild_index(connection)
+    db.session.commit()
+    return True
@@ -0,0 +1,114 @@
+# 慢查询记录
+# 引擎上执行超过阈值（SLOW_QUERY_MS 毫秒）的语句连同参数、发起的视图函数和
+# SQLite 的 EXPLAIN QUERY PLAN 一起写日志并放入环形缓冲区，管理员可在后台查看。
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS_MAX_LENGTH = 500
+# 只对这些语句取执行计划
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_threshold = None  # 秒；None 表示不记录
+_entries = deque(maxlen=100)
+_lock = threading.Lock()
+
+
+def _view_name():
+    """发起查询的端点和视图函数"""
+    if not has_request_context() or request.endpoint is None:
+        return None, None
+    view = current_app.view_functions.get(request.endpoint)
+    return request.endpoint, f'{view.__module__}.{view.__qualname__}' if view else None
+
+
+def _explain(conn, statement, parameters):
+    """用原始 DBAPI 游标取执行计划（不经过引擎事件），返回 (计划行, 是否有全表扫描)"""
+    if conn.dialect.name != 'sqlite' or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None, False
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+        rows = cursor.fetchall()
+    except Exception as exc:
+        return [f'（无法获取执行计划：{exc}）'], False
+    finally:
+        cursor.close()
+
+    # 行格式 (id, parent, notused, detail)，按 parent 缩进成树
+    depth = {0: 0}
+    plan = []
+    for node_id, parent, _notused, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        plan.append('  ' * (depth[node_id] - 1) + detail)
+    # "SCAN t"（包括 "SCAN t USING INDEX"）会读完整张表或整个索引；"SEARCH t USING INDEX" 才是按索引定位
+    full_scan = any(d.startswith('SCAN ') and d != 'SCAN CONSTANT ROW' for *_ids, d in rows)
+    return plan, full_scan
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _threshold is not None and context is not None:
+        context._slow_query_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_slow_query_started', None)
+    if started is None:
+        return
+    elapsed = perf_counter() - started
+    if elapsed < _threshold:
+        return
+
+    endpoint, view = _view_name()
+    # 批量执行的参数是多组，不取计划
+    plan, full_scan = (None, False) if executemany else _explain(conn, statement, parameters)
+    params = repr(parameters)
+    if len(params) > PARAMETERS_MAX_LENGTH:
+        params = params[:PARAMETERS_MAX_LENGTH] + '...'
+    entry = {
+        'time': datetime.now(),
+        'duration_ms': elapsed * 1000,
+        'statement': statement,
+        'parameters': params,
+        'endpoint': endpoint,
+        'view': view,
+        'plan': plan,
+        'full_scan': full_scan,
+    }
+    with _lock:
+        _entries.appendleft(entry)
+    logger.warning('慢查询 %.1fms [%s] %s | 参数 %s | 计划 %s', entry['duration_ms'], view or '-',
+                   statement, params, ' / '.join(plan) if plan else '-')
+
+
+def recent():
+    """最近的慢查询（新的在前）"""
+    with _lock:
+        return list(_entries)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def init_app(app):
+    """按配置设置阈值与缓冲区大小并注册引擎事件；SLOW_QUERY_MS 为空时不记录"""
+    global _threshold, _entries
+    threshold_ms = app.config.get('SLOW_QUERY_MS')
+    _threshold = threshold_ms / 1000 if threshold_ms is not None else None
+    size = app.config.get('SLOW_QUERY_LOG_SIZE', 100)
+    with _lock:
+        if _entries.maxlen != size:
+            _entries = deque(_entries, maxlen=size)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
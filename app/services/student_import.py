@@ -0,0 +1,261 @@
+# 学生批量导入（CSV / XLSX）
+# 文件逐行流式读取，每 CHUNK_SIZE 行为一批：校验字段、用一条查询找出已存在的学号、
+# 计算密码哈希，再用 executemany 批量插入用户和学生；宿舍人数最后统一累加。
+# 填了初始密码的行逐行加盐计算哈希；未填的行不计算，存入“尚未设置密码”标记，
+# 学生用默认密码首次登录后必须修改密码（见 app/services/passwords.py）。
+# 网页上传在请求线程内计算哈希：多线程 / 协程 worker 中 fork 子进程不安全（锁和数据库连接池会被复制）。
+# 命令行 import-students 可用进程池并行计算，只在一批中有多个密码要算时才创建。
+# 不合格的行跳过并记录行号和原因，其余行在同一个事务中提交。
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import select, union
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models.models import User, Student, Dormitory
+from app.services import dashboard_stats
+from app.services.allocation import apply_assignments
+from app.services.occupancy import OccupancyError
+from app.services.passwords import UNSET_PASSWORD
+
+CHUNK_SIZE = 1000
+GENDERS = ('男', '女')
+
+# 表头（中文或英文字段名均可）-> 字段
+COLUMNS = {
+    '学号': 'student_id',
+    '姓名': 'name',
+    '性别': 'gender',
+    '专业': 'major',
+    '年级': 'grade',
+    '电话': 'phone',
+    '宿舍号': 'dorm_number',
+    '初始密码': 'password',
+}
+FIELDS = tuple(COLUMNS.values())
+REQUIRED = ('student_id', 'name', 'gender', 'major', 'grade', 'phone')
+LABELS = {field: label for label, field in COLUMNS.items()}
+MAX_LENGTHS = {'student_id': 20, 'name': 50, 'gender': 10, 'major': 50, 'grade': 20, 'phone': 20}
+
+
+class StudentImportError(Exception):
+    """文件整体无法导入（格式不支持、缺少表头等）"""
+
+
+class ImportResult:
+    """导入结果：成功人数与逐行错误 [(行号, 原因)]"""
+
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+
+    @property
+    def total(self):
+        return self.imported + len(self.errors)
+
+
+def _cell(value):
+    """单元格转为字符串；Excel 中的学号、电话常被存成数字"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise StudentImportError(f'CSV 文件无法解析（需要 UTF-8 编码）：{exc}')
+    finally:
+        text.detach()
+
+
+def _xlsx_rows(stream):
+    try:
+        import openpyxl
+    except ImportError:
+        raise StudentImportError('导入 XLSX 需要安装 openpyxl，或将表格另存为 CSV 后导入')
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except Exception as exc:
+        raise StudentImportError(f'XLSX 文件无法解析：{exc}')
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(stream, filename):
+    """按扩展名流式读取，逐行产出 (行号, {字段: 值})"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(stream)
+    elif extension == '.xlsx':
+        rows = _xlsx_rows(stream)
+    else:
+        raise StudentImportError('只支持 .csv 和 .xlsx 文件')
+
+    header = next(rows, None)
+    if header is None:
+        raise StudentImportError('文件为空')
+    columns = [COLUMNS.get(name, name if name in FIELDS else None)
+               for name in (_cell(value) for value in header)]
+    missing = [LABELS[field] for field in REQUIRED if field not in columns]
+    if missing:
+        raise StudentImportError('缺少表头：' + '、'.join(missing))
+
+    for row_number, values in enumerate(rows, start=2):
+        record = {field: _cell(value) for field, value in zip(columns, values) if field}
+        if any(record.values()):  # 跳过空行
+            yield row_number, record
+
+
+def hash_passwords(passwords, pool=None):
+    """逐个计算明文密码的哈希（每个单独加盐，相同密码的哈希也不同），按原顺序返回列表；有进程池时并行计算"""
+    passwords = list(passwords)
+    if pool is None or len(passwords) < 2:
+        return [generate_password_hash(password) for password in passwords]
+    return list(pool.map(generate_password_hash, passwords, chunksize=16))
+
+
+def _validate(record, dorms):
+    """返回错误原因，合格时返回 None"""
+    for field in REQUIRED:
+        if not record.get(field):
+            return f'缺少{LABELS[field]}'
+    for field, limit in MAX_LENGTHS.items():
+        if len(record[field]) > limit:
+            return f'{LABELS[field]}超过 {limit} 个字符'
+    if record['gender'] not in GENDERS:
+        return '性别只能是“男”或“女”'
+    dorm_number = record.get('dorm_number')
+    if dorm_number:
+        dorm = dorms.get(dorm_number)
+        if dorm is None:
+            return f'宿舍 {dorm_number} 不存在'
+        if dorm['gender'] and dorm['gender'] != record['gender']:
+            return f'宿舍 {dorm_number} 为{dorm["gender"]}生宿舍'
+        if dorm['free'] <= 0:
+            return f'宿舍 {dorm_number} 已住满'
+    return None
+
+
+def _existing_ids(student_ids):
+    """一条查询找出已被用户名或学号占用的学号"""
+    return set(db.session.execute(union(
+        select(User.username).where(User.username.in_(student_ids)),
+        select(Student.student_id).where(Student.student_id.in_(student_ids)),
+    )).scalars())
+
+
+def _insert_ids(table, rows, key):
+    """executemany 插入 rows，返回 {key 列的值: 新行ID}。
+    数据库不支持 executemany + RETURNING（如 MySQL）时插入后按 key 列查回（导入前已确认 key 不重复）"""
+    if db.session.connection().dialect.insert_executemany_returning:
+        return {value: row_id for row_id, value in db.session.execute(
+            table.insert().returning(table.c.id, table.c[key]), rows)}
+    db.session.execute(table.insert(), rows)
+    return {value: row_id for row_id, value in db.session.execute(
+        select(table.c.id, table.c[key]).where(table.c[key].in_([row[key] for row in rows])))}
+
+
+def _import_chunk(chunk, dorms, get_pool, result):
+    """校验并插入一批行，返回 [(学生ID, 宿舍ID)] 待入住"""
+    existing = _existing_ids([record['student_id'] for _row, record in chunk if record.get('student_id')])
+    valid = []
+    for row_number, record in chunk:
+        error = _validate(record, dorms)
+        if error is None and record['student_id'] in existing:
+            error = f'学号 {record["student_id"]} 已存在'
+        if error:
+            result.errors.append((row_number, error))
+            continue
+        existing.add(record['student_id'])  # 同一文件内的重复学号
+        if record.get('dorm_number'):
+            dorms[record['dorm_number']]['free'] -= 1
+        valid.append(record)
+    if not valid:
+        return []
+
+    passwords = [record['password'] for record in valid if record.get('password')]
+    hashes = iter(hash_passwords(passwords, get_pool() if len(passwords) > 1 else None))
+
+    user_ids = _insert_ids(User.__table__, [
+        {'username': record['student_id'],
+         'password': next(hashes) if record.get('password') else UNSET_PASSWORD,
+         'role': 'student', 'is_deleted': False} for record in valid
+    ], 'username')
+
+    student_ids = _insert_ids(Student.__table__, [
+        {'user_id': user_ids[record['student_id']],
+         **{field: record[field] for field in REQUIRED},
+         'is_deleted': False} for record in valid
+    ], 'student_id')
+    result.imported += len(student_ids)
+
+    return [(student_ids[record['student_id']], dorms[record['dorm_number']]['id'])
+            for record in valid if record.get('dorm_number')]
+
+
+def import_students(rows, workers=1):
+    """导入 read_rows 产出的行并提交，返回 ImportResult
+
+    workers 为哈希进程数，默认 1（在当前进程计算，网页请求中必须如此）；
+    大于 1 时（仅限命令行）在需要时创建进程池。
+    """
+    dorms = {number: {'id': dorm_id, 'gender': gender, 'free': (capacity or 0) - (occupancy or 0)}
+             for dorm_id, number, gender, capacity, occupancy in db.session.execute(select(
+                 Dormitory.id, Dormitory.dorm_number, Dormitory.gender,
+                 Dormitory.capacity, Dormitory.current_occupancy))}
+    result = ImportResult()
+    assignments = []
+
+    pool = None
+
+    def get_pool():
+        nonlocal pool
+        if pool is None and workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                assignments += _import_chunk(chunk, dorms, get_pool, result)
+                chunk = []
+        if chunk:
+            assignments += _import_chunk(chunk, dorms, get_pool, result)
+        apply_assignments(assignments)
+        db.session.commit()
+    except OccupancyError:
+        db.session.rollback()
+        raise StudentImportError('导入期间部分宿舍已被其他操作住满，本次导入未生效，请重新导入')
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # 直接写表绕过了会话事件，手动使仪表板缓存失效
+    if result.imported:
+        dashboard_stats.invalidate()
+    return result
+
+
+def template_csv():
+    """导入模板（带 BOM，Excel 可直接打开）"""
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(list(COLUMNS))
+    writer.writerow(['2024000001', '张三', '男', '软件工程', '2024级', '13800000000', '', ''])
+    return buffer.getvalue()
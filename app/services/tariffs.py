@@ -0,0 +1,220 @@
+# 水电费价目表与计价
+# 价目表按楼栋和生效月份区间配置，每种能源一组阶梯价格；一次加载全部价目表后，
+# 对整批账单按 (楼栋, 月份, 能源) 找到适用版本，同一版本的账单用 NumPy 一次算完。
+# 调价后用 reprice_bills 按新价目批量重算一段时间内未缴费的账单。
+# NumPy 在计价时才导入，避免拖慢每个 worker 的启动。
+import re
+
+from sqlalchemy import bindparam, func, select
+
+from app import db
+from app.models.models import Dormitory, Tariff, TariffTier, UtilityBill
+from app.services.utility_rollups import rebuild_rollups
+
+UTILITIES = ('electricity', 'water')
+# 未配置价目表时沿用原来的统一单价：电费1元/度，水费2元/吨
+DEFAULT_TIERS = {'electricity': ((0.0, 1.0),), 'water': ((0.0, 2.0),)}
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+CHUNK_SIZE = 500
+
+
+class TariffError(Exception):
+    """价目表配置不合法或重算参数错误"""
+
+
+def tiered_cost(usage, tiers):
+    """按阶梯 [(起始用量, 单价)] 计算一组用量的费用（未取整）"""
+    import numpy as np
+    usage = np.asarray(usage, dtype=float)
+    lowers = np.array([lower for lower, _price in tiers], dtype=float)
+    prices = np.array([price for _lower, price in tiers], dtype=float)
+    widths = np.append(lowers[1:], np.inf) - lowers
+    # 每行在各档内的用量：超过起点的部分，最多为该档宽度
+    amounts = np.clip(usage[:, None] - lowers[None, :], 0, widths[None, :])
+    return amounts @ prices
+
+
+class TariffBook:
+    """已加载的全部价目表，按 (楼栋, 月份, 能源) 解析适用版本"""
+
+    def __init__(self, tariffs, tiers):
+        # tariffs: [(id, 楼栋, 起始月份, 截止月份)]；tiers: {价目表ID: {能源: [(起始用量, 单价)]}}
+        self.tariffs = tariffs
+        self.tiers = tiers
+        self._resolved = {}
+
+    @classmethod
+    def load(cls):
+        tariffs = db.session.execute(
+            select(Tariff.id, Tariff.building, Tariff.month_from, Tariff.month_to)
+        ).all()
+        tiers = {}
+        for tariff_id, utility, lower, price in db.session.execute(
+                select(TariffTier.tariff_id, TariffTier.utility, TariffTier.lower_bound, TariffTier.price)
+                .order_by(TariffTier.tariff_id, TariffTier.utility, TariffTier.lower_bound)):
+            tiers.setdefault(tariff_id, {}).setdefault(utility, []).append((lower, price))
+        return cls(tariffs, tiers)
+
+    def resolve(self, building, month, utility):
+        """某能源适用的价目表ID：本楼栋的优先于全校默认，同级取最新版本；
+        只配置了部分能源的价目表不影响其他能源。没有则为 None"""
+        key = (building, month, utility)
+        if key not in self._resolved:
+            candidates = [
+                (tariff_building is not None, tariff_id)
+                for tariff_id, tariff_building, month_from, month_to in self.tariffs
+                if tariff_building in (None, building) and month_from <= month
+                and (month_to is None or month <= month_to)
+                and self.tiers.get(tariff_id, {}).get(utility)
+            ]
+            self._resolved[key] = max(candidates)[1] if candidates else None
+        return self._resolved[key]
+
+    def tiers_for(self, tariff_id, utility):
+        if tariff_id is None:
+            return DEFAULT_TIERS[utility]
+        return self.tiers[tariff_id][utility]
+
+    def price(self, buildings, months, electricity, water):
+        """整批计价，返回 (电费, 水费, 总费用) 三个数组，均保留两位小数"""
+        import numpy as np
+        usage = {'electricity': np.asarray(electricity, dtype=float),
+                 'water': np.asarray(water, dtype=float)}
+        costs = {}
+        for utility in UTILITIES:
+            tariff_ids = np.array([self.resolve(b, m, utility) or 0 for b, m in zip(buildings, months)],
+                                  dtype=np.int64)
+            costs[utility] = np.zeros(len(tariff_ids))
+            # 同一价目表的账单一次算完
+            for tariff_id in np.unique(tariff_ids):
+                rows = tariff_ids == tariff_id
+                costs[utility][rows] = tiered_cost(usage[utility][rows], self.tiers_for(int(tariff_id) or None, utility))
+        electricity_cost = np.round(costs['electricity'], 2)
+        water_cost = np.round(costs['water'], 2)
+        return electricity_cost, water_cost, np.round(electricity_cost + water_cost, 2)
+
+
+def compute_costs(buildings, months, electricity, water, book=None):
+    """整批计价（见 TariffBook.price）"""
+    return (book or TariffBook.load()).price(buildings, months, electricity, water)
+
+
+def price_bill(dorm_id, month, electricity, water):
+    """单张账单计价，返回 (电费, 水费, 总费用)"""
+    building = db.session.execute(select(Dormitory.building).where(Dormitory.id == dorm_id)).scalar()
+    costs = compute_costs([building], [month], [electricity], [water])
+    return tuple(float(cost[0]) for cost in costs)
+
+
+def parse_tiers(text):
+    """解析阶梯输入，如 "0:0.6, 200:0.8, 400:1.2"（起始用量:单价）；只有一个数字表示统一单价"""
+    text = (text or '').strip()
+    if not text:
+        return []
+    tiers = []
+    for part in re.split(r'[,，;；\s]+', text):
+        lower, sep, price = part.partition(':') if ':' in part else part.partition('：')
+        if not sep:
+            lower, price = '0', lower
+        try:
+            tiers.append((float(lower), float(price)))
+        except ValueError:
+            raise TariffError(f'无法识别的阶梯：{part}')
+    lowers = [lower for lower, _price in tiers]
+    if lowers[0] != 0:
+        raise TariffError('第一档的起始用量必须为 0')
+    if any(b <= a for a, b in zip(lowers, lowers[1:])):
+        raise TariffError('各档起始用量必须递增')
+    if any(price < 0 for _lower, price in tiers):
+        raise TariffError('单价不能为负数')
+    return tiers
+
+
+def create_tariff(name, building, month_from, month_to, tiers):
+    """新增一个价目表版本（tiers: {能源: [(起始用量, 单价)]}），不提交事务"""
+    if not name:
+        raise TariffError('请填写名称')
+    if not MONTH_PATTERN.match(month_from or ''):
+        raise TariffError('生效起始月份格式应为 YYYY-MM')
+    if month_to and (not MONTH_PATTERN.match(month_to) or month_to < month_from):
+        raise TariffError('截止月份格式应为 YYYY-MM，且不早于起始月份')
+    if not any(tiers.values()):
+        raise TariffError('至少需要配置一种能源的价格')
+    tariff = Tariff(name=name, building=building or None, month_from=month_from, month_to=month_to or None)
+    for utility, utility_tiers in tiers.items():
+        for lower, price in utility_tiers:
+            tariff.tiers.append(TariffTier(utility=utility, lower_bound=lower, price=price))
+    db.session.add(tariff)
+    return tariff
+
+
+class RepriceResult:
+    """重算结果：更新的账单数、因已缴费未改动的账单数"""
+
+    def __init__(self, updated=0, skipped_paid=0):
+        self.updated = updated
+        self.skipped_paid = skipped_paid
+
+
+def reprice_bills(month_from, month_to, building=None, progress=None):
+    """按当前价目表重算 [month_from, month_to] 内未缴费的账单并提交
+
+    读取、计价、写回各是一次批量操作；已缴费的账单保持原金额。
+    progress(已写入, 总数) 在每写完一批后调用。
+    """
+    if not MONTH_PATTERN.match(month_from or '') or not MONTH_PATTERN.match(month_to or ''):
+        raise TariffError('月份格式应为 YYYY-MM')
+    if month_to < month_from:
+        raise TariffError('截止月份不能早于起始月份')
+
+    bills, dorms = UtilityBill.__table__, Dormitory.__table__
+    conditions = [bills.c.month >= month_from, bills.c.month <= month_to]
+    if building:
+        conditions.append(dorms.c.building == building)
+    source = bills.join(dorms, bills.c.dorm_id == dorms.c.id)
+    rows = db.session.execute(
+        select(bills.c.id, dorms.c.building, bills.c.month, bills.c.electricity, bills.c.water)
+        .select_from(source).where(*conditions, bills.c.status != 'paid')
+    ).all()
+    skipped_paid = db.session.execute(
+        select(func.count(bills.c.id)).select_from(source).where(*conditions, bills.c.status == 'paid')
+    ).scalar()
+    if not rows:
+        return RepriceResult(0, skipped_paid)
+
+    electricity_cost, water_cost, total_cost = compute_costs(
+        [row.building for row in rows], [row.month for row in rows],
+        [row.electricity or 0 for row in rows], [row.water or 0 for row in rows])
+    params = [{'b_id': row.id,
+               'b_electricity_cost': float(electricity_cost[i]),
+               'b_water_cost': float(water_cost[i]),
+               'b_total_cost': float(total_cost[i])} for i, row in enumerate(rows)]
+    update = bills.update().where(bills.c.id == bindparam('b_id')).values(
+        electricity_cost=bindparam('b_electricity_cost'),
+        water_cost=bindparam('b_water_cost'),
+        total_cost=bindparam('b_total_cost'),
+    )
+    try:
+        for start in range(0, len(params), CHUNK_SIZE):
+            db.session.execute(update, params[start:start + CHUNK_SIZE])
+            if progress:
+                progress(min(start + CHUNK_SIZE, len(params)), len(params))
+        # 批量更新绕过了会话事件，涉及楼栋的汇总表在同一事务内重算
+        rebuild_rollups(buildings={row.building for row in rows})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return RepriceResult(len(rows), skipped_paid)
+
+
+def describe_tiers(tiers):
+    """阶梯价格的文字说明，如 "0-200: 0.6，200以上: 0.8" """
+    if not tiers:
+        return '-'
+    parts = []
+    for i, (lower, price) in enumerate(tiers):
+        upper = tiers[i + 1][0] if i + 1 < len(tiers) else None
+        span = f'{lower:g}-{upper:g}' if upper is not None else f'{lower:g}以上'
+        parts.append(f'{span}: {price:g}')
+    return '，'.join(parts)
@@ -0,0 +1,182 @@
+# 水电费汇总表维护
+# 账单的增、改、删在 flush 时转换为 (楼栋, 月份) 上的增量，直接在数据库端累加；
+# 宿舍改了楼栋时，涉及的楼栋整体用 GROUP BY 重算。统计页面只读汇总表。
+# 单元格不存在时用数据库的 upsert（INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE）一条语句插入或累加，
+# 多个 worker 同时为同一个新单元格写入第一张账单时不会撞上唯一约束。
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import Dormitory, UtilityBill, UtilityRollup
+
+# 汇总的数值字段
+AMOUNT_FIELDS = ('electricity', 'water', 'electricity_cost', 'water_cost', 'total_cost')
+# 这些字段变化时才需要更新汇总
+TRACKED_FIELDS = ('dorm_id', 'month') + AMOUNT_FIELDS
+
+
+def _collect_deltas(session):
+    """把本次 flush 中账单的变化汇总为 {(dorm_id, month): [账单数, 数值...]}"""
+    new_bills = [obj for obj in session.new if isinstance(obj, UtilityBill)]
+    deleted_ids = {obj.id for obj in session.deleted if isinstance(obj, UtilityBill)}
+    changed = [obj for obj in session.dirty
+               if isinstance(obj, UtilityBill) and obj.id not in deleted_ids
+               and any(inspect(obj).attrs[f].history.has_changes() for f in TRACKED_FIELDS)]
+
+    changes = [(1, (bill.dorm_id, bill.month) + tuple(getattr(bill, f) or 0 for f in AMOUNT_FIELDS))
+               for bill in new_bills + changed]
+
+    # 修改前的值以数据库中（本事务内）当前的行为准，一条查询取回
+    old_ids = deleted_ids | {bill.id for bill in changed}
+    if old_ids:
+        bills = UtilityBill.__table__
+        rows = session.connection().execute(
+            select(bills.c.dorm_id, bills.c.month, *[bills.c[f] for f in AMOUNT_FIELDS])
+            .where(bills.c.id.in_(old_ids))
+        ).all()
+        changes.extend((-1, tuple(row[:2]) + tuple(v or 0 for v in row[2:])) for row in rows)
+
+    deltas = {}
+    for sign, values in changes:
+        dorm_id, month, amounts = values[0], values[1], values[2:]
+        delta = deltas.setdefault((int(dorm_id), month), [0] * (1 + len(AMOUNT_FIELDS)))
+        delta[0] += sign
+        for i, amount in enumerate(amounts, start=1):
+            delta[i] += sign * amount
+    return deltas
+
+
+def _upsert(connection, row, increments):
+    """按方言生成 upsert 语句，不支持的数据库返回 None"""
+    table = UtilityRollup.__table__
+    name = connection.dialect.name
+    if name in ('sqlite', 'postgresql'):
+        insert = (sqlite if name == 'sqlite' else postgresql).insert(table).values(**row)
+        return insert.on_conflict_do_update(index_elements=['building', 'month'], set_=increments)
+    if name in ('mysql', 'mariadb'):
+        return mysql.insert(table).values(**row).on_duplicate_key_update(**increments)
+    return None
+
+
+def apply_delta(connection, building, month, bill_count, amounts):
+    """在数据库端累加一个 (楼栋, 月份) 单元格，不存在则插入"""
+    table = UtilityRollup.__table__
+    row = {'building': building, 'month': month, 'bill_count': bill_count,
+           **{f: amounts[i] for i, f in enumerate(AMOUNT_FIELDS)}}
+    increments = {'bill_count': table.c.bill_count + bill_count,
+                  **{f: table.c[f] + amounts[i] for i, f in enumerate(AMOUNT_FIELDS)}}
+    cell = (table.c.building == building, table.c.month == month)
+
+    upsert = _upsert(connection, row, increments)
+    if upsert is not None:
+        connection.execute(upsert)
+    elif connection.execute(table.update().where(*cell).values(**increments)).rowcount == 0:
+        # 其他数据库：先更新，没有该单元格再插入；插入撞上并发插入的同一单元格时回到更新
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(**row))
+        except IntegrityError:
+            connection.execute(table.update().where(*cell).values(**increments))
+
+    if bill_count < 0:
+        # 最后一张账单被删除后移除该单元格
+        connection.execute(table.delete().where(*cell, table.c.bill_count <= 0))
+
+
+def rebuild_rollups(connection=None, buildings=None):
+    """用一条 GROUP BY 重算汇总表（可限定楼栋），返回写入的行数"""
+    if connection is None:
+        connection = db.session.connection()
+    rollups = UtilityRollup.__table__
+    bills = UtilityBill.__table__
+    dorms = Dormitory.__table__
+
+    delete = rollups.delete()
+    query = select(
+        dorms.c.building,
+        bills.c.month,
+        func.count(bills.c.id),
+        *[func.coalesce(func.sum(bills.c[f]), 0) for f in AMOUNT_FIELDS]
+    ).select_from(bills.join(dorms, bills.c.dorm_id == dorms.c.id))
+    if buildings is not None:
+        buildings = list(buildings)
+        delete = delete.where(rollups.c.building.in_(buildings))
+        query = query.where(dorms.c.building.in_(buildings))
+    query = query.group_by(dorms.c.building, bills.c.month)
+
+    connection.execute(delete)
+    result = connection.execute(rollups.insert().from_select(
+        ['building', 'month', 'bill_count'] + list(AMOUNT_FIELDS), query
+    ))
+    return result.rowcount
+
+
+def _before_flush(session, flush_context, instances):
+    # 宿舍楼栋变化：flush 之后整体重算新旧楼栋
+    for obj in session.dirty:
+        if isinstance(obj, Dormitory):
+            history = inspect(obj).attrs.building.history
+            if history.has_changes():
+                moved = session.info.setdefault('rollup_buildings', set())
+                moved.update(b for b in history.deleted + history.added if b)
+
+    deltas = _collect_deltas(session)
+    if not deltas:
+        return
+
+    connection = session.connection()
+    dorms = Dormitory.__table__
+    dorm_ids = {dorm_id for dorm_id, _month in deltas}
+    building_of = dict(connection.execute(
+        select(dorms.c.id, dorms.c.building).where(dorms.c.id.in_(dorm_ids))
+    ).all())
+
+    cells = {}
+    for (dorm_id, month), delta in deltas.items():
+        building = building_of.get(dorm_id)
+        if building is None:
+            continue
+        cell = cells.setdefault((building, month), [0] * len(delta))
+        for i, value in enumerate(delta):
+            cell[i] += value
+    for (building, month), cell in cells.items():
+        if any(cell):
+            apply_delta(connection, building, month, cell[0], cell[1:])
+
+
+def _after_flush(session, flush_context):
+    buildings = session.info.pop('rollup_buildings', None)
+    if buildings:
+        rebuild_rollups(session.connection(), buildings)
+
+
+def register_events():
+    """注册 flush 事件，使汇总表随账单变化自动维护"""
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush', _after_flush)
+
+
+def ensure_rollups():
+    """汇总表为空但已有账单时（如旧库升级）先重建一次"""
+    if db.session.query(UtilityRollup.id).first() is None and \
+            db.session.query(UtilityBill.id).first() is not None:
+        rebuild_rollups()
+        db.session.commit()
+
+
+def rollup_statistics():
+    """统计页面数据：全部从汇总表读取"""
+    ensure_rollups()
+    sums = [func.sum(getattr(UtilityRollup, f)) for f in AMOUNT_FIELDS]
+
+    def grouped(column):
+        rows = db.session.query(column, *sums).group_by(column).order_by(column).all()
+        return {row[0]: {f: row[i] or 0 for i, f in enumerate(AMOUNT_FIELDS, start=1)} for row in rows}
+
+    building_stats = grouped(UtilityRollup.building)
+    monthly_stats = grouped(UtilityRollup.month)
+    totals = {f: sum(stats[f] for stats in building_stats.values()) for f in AMOUNT_FIELDS}
+    return totals, building_stats, monthly_stats
@@ -0,0 +1,212 @@
+# 空床位索引
+# 学生申请调换宿舍、智能分配都要找同性别未住满的宿舍。这里把宿舍表读成一份快照缓存在进程内，
+# 未住满的宿舍按性别、(性别, 楼栋) 分组，查询直接返回对应分组，耗时只与结果数有关，不再扫描宿舍表。
+#
+# 多个进程（gunicorn worker）之间用数据库中的版本号同步：宿舍增删改（会话事件）和入住人数变化
+# （occupancy 中的原子更新）都在同一事务内把 cache_versions 表中 vacancy 一行加一，随事务提交或回滚；
+# 每次查询先按主键读一次版本号，与本进程快照的版本一致就直接使用。
+# 本进程提交的改动会记下 新版本号 -> 改动的宿舍ID，版本号的变化全部来自本进程时只重新读取这几间宿舍；
+# 中间夹有其他进程的提交（不知道改了哪些宿舍）时才整表重新加载。
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import CacheVersion, Dormitory
+
+VERSION_NAME = 'vacancy'
+# 本进程最近提交的改动最多记录多少个版本
+MAX_LOCAL_CHANGES = 1000
+
+_versions = CacheVersion.__table__
+_dorms = Dormitory.__table__
+_lock = threading.Lock()
+# 以下按数据库引擎区分（同一进程可能有多个应用指向不同的数据库）
+# 引擎 -> 当前快照
+_indexes = {}
+# 引擎 -> {新版本号: 该版本改动的宿舍ID}（仅本进程提交的事务）
+_local_changes = {}
+
+
+class Room(namedtuple('Room', 'id dorm_number building floor gender capacity current_occupancy')):
+    """宿舍快照中的一行（只读）"""
+    __slots__ = ()
+
+    @property
+    def free(self):
+        return (self.capacity or 0) - (self.current_occupancy or 0)
+
+
+class VacancyIndex:
+    """某一版本的宿舍快照及未住满宿舍的分组，创建后不再修改（可被多个线程同时读取）"""
+
+    def __init__(self, version, rooms):
+        self.version = version
+        # 宿舍ID -> Room，按ID排序
+        self.rooms = rooms
+        self.by_gender = {}
+        self.by_building = {}
+        for room in rooms.values():
+            if room.free > 0:
+                self.by_gender.setdefault(_gender_key(room), []).append(room)
+                self.by_building.setdefault(_building_key(room), []).append(room)
+
+    def available(self, gender, building=None, exclude=None):
+        """同性别（可限定楼栋）未住满的宿舍，按ID排序；exclude 为要排除的宿舍ID"""
+        if building is None:
+            rooms = self.by_gender.get(gender, ())
+        else:
+            rooms = self.by_building.get((gender, building), ())
+        return [room for room in rooms if room.id != exclude]
+
+    def patched(self, version, dorm_ids, rooms):
+        """返回更新了 dorm_ids 这几间宿舍的新快照，rooms 为它们的最新数据（已删除的不在其中）
+
+        只重建受影响的分组，其余分组与原快照共用。
+        """
+        index = VacancyIndex.__new__(VacancyIndex)
+        index.version = version
+        index.rooms = {dorm_id: room for dorm_id, room in self.rooms.items() if dorm_id not in dorm_ids}
+        index.rooms.update((room.id, room) for room in rooms)
+        if any(room.id not in self.rooms for room in rooms):
+            # 新增的宿舍，重新按ID排序
+            index.rooms = dict(sorted(index.rooms.items()))
+        index.by_gender = dict(self.by_gender)
+        index.by_building = dict(self.by_building)
+
+        affected = [self.rooms[dorm_id] for dorm_id in dorm_ids if dorm_id in self.rooms] + rooms
+        for groups, key_of in ((index.by_gender, _gender_key), (index.by_building, _building_key)):
+            for key in {key_of(room) for room in affected}:
+                group = [room for room in groups.get(key, ()) if room.id not in dorm_ids]
+                group += [room for room in rooms if room.free > 0 and key_of(room) == key]
+                if group:
+                    group.sort(key=_room_id)
+                    groups[key] = group
+                else:
+                    groups.pop(key, None)
+        return index
+
+
+def _gender_key(room):
+    return room.gender
+
+
+def _building_key(room):
+    return room.gender, room.building
+
+
+def _room_id(room):
+    return room.id
+
+
+def current_version(session=None):
+    session = session or db.session
+    return session.execute(
+        select(_versions.c.version).where(_versions.c.name == VERSION_NAME)
+    ).scalar() or 0
+
+
+def _select_rooms(session, dorm_ids=None):
+    query = select(_dorms.c.id, _dorms.c.dorm_number, _dorms.c.building, _dorms.c.floor,
+                   _dorms.c.gender, _dorms.c.capacity, _dorms.c.current_occupancy).order_by(_dorms.c.id)
+    if dorm_ids is not None:
+        query = query.where(_dorms.c.id.in_(dorm_ids))
+    return [Room(*row) for row in session.execute(query)]
+
+
+def _refresh(session, engine, index, version):
+    """把快照更新到 version：版本号之间的改动都是本进程提交的就只读改动过的宿舍，否则整表重新加载"""
+    if index is not None and index.version < version:
+        with _lock:
+            local = _local_changes.get(engine, {})
+            changes = [local.get(v) for v in range(index.version + 1, version + 1)]
+        if all(dorm_ids is not None for dorm_ids in changes):
+            dorm_ids = set().union(*changes)
+            return index.patched(version, dorm_ids, _select_rooms(session, dorm_ids))
+    return VacancyIndex(version, {room.id: room for room in _select_rooms(session)})
+
+
+def get_index(session=None):
+    """返回与数据库版本号一致的宿舍快照"""
+    session = session or db.session
+    # 先读版本号再读宿舍：两次读取之间有其他事务提交时，快照比版本号新，下次查询多更新一次而已
+    version = current_version(session)
+    if 'vacancy_version' in session.info:
+        # 本事务改过宿舍但尚未提交，读到的数据不能给其他请求用
+        return VacancyIndex(version, {room.id: room for room in _select_rooms(session)})
+    engine = db.engine
+    with _lock:
+        index = _indexes.get(engine)
+    if index is None or index.version != version:
+        index = _refresh(session, engine, index, version)
+        with _lock:
+            latest = _indexes.get(engine)
+            if latest is None or latest.version < index.version:
+                _indexes[engine] = index
+    return index
+
+
+def available_rooms(gender, building=None, exclude=None):
+    """同性别（可限定楼栋）未住满的宿舍列表"""
+    return get_index().available(gender, building, exclude)
+
+
+def bump_version(dorm_ids, session=None):
+    """在当前事务内记下改动的宿舍，并把版本号加一（行不存在则插入），随事务提交生效
+
+    同一事务内只更新一次版本号；更新后读出新版本号，提交后登记本进程的改动。
+    """
+    session = session or db.session
+    session.info.setdefault('vacancy_dorms', set()).update(dorm_ids)
+    if 'vacancy_version' in session.info:
+        return
+    connection = session.connection()
+    result = connection.execute(
+        _versions.update()
+        .where(_versions.c.name == VERSION_NAME)
+        .values(version=_versions.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(_versions.insert().values(name=VERSION_NAME, version=1))
+    session.info['vacancy_engine'] = connection.engine
+    # 版本号这一行已被本事务锁定，读到的就是提交后的版本号
+    session.info['vacancy_version'] = connection.execute(
+        select(_versions.c.version).where(_versions.c.name == VERSION_NAME)
+    ).scalar()
+
+
+def _after_flush(session, flush_context):
+    # 只看宿舍自身字段的变化，学生换宿舍引起的 students 集合变化不算（人数由 occupancy 维护）
+    dorm_ids = [obj.id for obj in list(session.new) + list(session.deleted) if isinstance(obj, Dormitory)]
+    dorm_ids += [obj.id for obj in session.dirty
+                 if isinstance(obj, Dormitory) and session.is_modified(obj, include_collections=False)]
+    if dorm_ids:
+        bump_version(dorm_ids, session)
+
+
+def _after_commit(session):
+    version = session.info.pop('vacancy_version', None)
+    dorm_ids = session.info.pop('vacancy_dorms', None)
+    engine = session.info.pop('vacancy_engine', None)
+    if version is not None:
+        with _lock:
+            local = _local_changes.setdefault(engine, {})
+            local[version] = frozenset(dorm_ids)
+            while len(local) > MAX_LOCAL_CHANGES:
+                del local[next(iter(local))]
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        for key in ('vacancy_version', 'vacancy_dorms', 'vacancy_engine'):
+            session.info.pop(key, None)
+
+
+def register_events():
+    """注册会话事件：通过 ORM 增删改宿舍时更新版本号，提交后登记本进程的改动"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_transaction_end', _after_transaction_end)
@@ -1,9 +1,25 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, abort, current_app, stream_with_context
 from flask_login import login_required, current_user
 from app import db
-from app.models.models import User, Student, Dormitory, Repair, Visitor, DormManager, DormChangeRequest, UtilityBill, Payment
+from app.models.models import User, Student, Dormitory, Repair, Visitor, DormManager, UtilityBill, Tariff
+from app.services.occupancy import move_student, reconcile_occupancy, OccupancyError
+from app.services.db_routing import use_primary
+from app.services.allocation import smart_allocate, preview_allocation, apply_plan, get_plan, export_plan_csv, AllocationPlanError, DEFAULT_STRATEGY
+from app.services.utility_rollups import rollup_statistics
+from app.services.dashboard_stats import get_dashboard_stats
+from app.services.metrics import registry as metrics_registry
+from app.services import slow_queries
+from app.services.student_import import read_rows, import_students, template_csv, StudentImportError
+from app.services.bill_runs import run_bill_batch, BillRunError, template_csv as meter_reading_template_csv
+from app.services.tariffs import price_bill, parse_tiers, create_tariff, reprice_bills, describe_tiers, TariffError, UTILITIES
+from app.services.exports import export_file, ExportError, EXPORTS, FORMATS as EXPORT_FORMATS
+from app.services.repair_dispatch import repair_dict
+from app.services.pagination import paginate
+from app.services.listing import resolve_sort, student_query, repair_page, visitor_query, payment_query, utility_bill_query, building_options
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+import hmac
+from sqlalchemy.orm import joinedload, selectinload
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -14,48 +30,15 @@ def dashboard():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    # 统计数据
-    total_students = Student.query.count()
-    total_dorms = Dormitory.query.count()
-    total_repairs = Repair.query.count()
-    pending_repairs = Repair.query.filter_by(status='pending').count()
-    
-    # 获取最新活动
-    latest_repairs = Repair.query.order_by(Repair.created_at.desc()).limit(5).all()
-    latest_visitors = Visitor.query.order_by(Visitor.visit_date.desc()).limit(5).all()
-    
-    # 准备活动数据
-    activities = []
-    
-    # 添加报修活动
-    for repair in latest_repairs:
-        activities.append({
-            'type': 'repair',
-            'title': f'新报修：{repair.title}',
-            'description': f'学生 {repair.student.name if repair.student else "未知"} 提交了报修申请',
-            'time': repair.created_at,
-            'status': repair.status
-        })
-    
-    # 添加访客活动
-    for visitor in latest_visitors:
-        activities.append({
-            'type': 'visitor',
-            'title': f'访客登记：{visitor.name}',
-            'description': f'访客 {visitor.name} 访问了宿舍 {visitor.dorm_number}',
-            'time': visitor.visit_date,
-            'status': visitor.status
-        })
-    
-    # 按时间排序
-    activities.sort(key=lambda x: x['time'], reverse=True)
+    # 计数器与最新活动各一条查询，结果短暂缓存
+    stats = get_dashboard_stats()
     
     return render_template('admin/dashboard.html', 
-                         total_students=total_students,
-                         total_dorms=total_dorms,
-                         total_repairs=total_repairs,
-                         pending_repairs=pending_repairs,
-                         activities=activities[:8])
+                         total_students=stats['total_students'],
+                         total_dorms=stats['total_dorms'],
+                         total_repairs=stats['total_repairs'],
+                         pending_repairs=stats['pending_repairs'],
+                         activities=stats['activities'])
 
 # 学生管理
 @admin_bp.route('/students')
@@ -65,8 +48,11 @@ def students():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    students = Student.query.filter_by(is_deleted=False).all()  # 只显示未删除的学生
-    return render_template('admin/students.html', students=students)
+    # 只显示未删除的学生，服务端筛选并分页
+    sort, order = resolve_sort('students', request.args)
+    page = paginate(student_query(request.args), order, sort)
+    return render_template('admin/students.html', students=page, page=page,
+                         filters=request.args, buildings=building_options())
 
 @admin_bp.route('/students/add', methods=['GET', 'POST'])
 @login_required
@@ -113,11 +99,20 @@ def add_student():
             gender=gender,
             major=major,
             grade=grade,
-            dorm_id=dorm_id if dorm_id else None,
             phone=phone
         )
         
         db.session.add(student)
+        db.session.flush()
+        
+        # 入住人数在数据库端带容量条件累加，宿舍已满时不创建学生
+        if dorm_id:
+            try:
+                move_student(student.id, None, int(dorm_id))
+            except OccupancyError as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+                return redirect(url_for('admin.add_student'))
         db.session.commit()
         
         flash('学生添加成功！', 'success')
@@ -125,16 +120,56 @@ def add_student():
     
     return render_template('admin/add_student.html', dormitories=dormitories)
 
+@admin_bp.route('/students/import', methods=['GET', 'POST'])
+@login_required
+def import_student_file():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    result = error = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            error = '请选择要导入的文件！'
+        else:
+            try:
+                result = import_students(read_rows(upload.stream, upload.filename))
+            except StudentImportError as e:
+                error = str(e)
+    
+    return render_template('admin/import_students.html', result=result, error=error)
+
+@admin_bp.route('/students/import/template.csv')
+@login_required
+def download_student_import_template():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    return Response(
+        template_csv(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=student_import_template.csv'}
+    )
+
 @admin_bp.route('/students/delete/<int:student_id>')
 @login_required
+@use_primary  # 用 GET 链接执行删除
 def delete_student(student_id):
     if current_user.role != 'admin':
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
     student = Student.query.get_or_404(student_id)
+    if student.is_deleted:
+        flash('该学生已被删除！', 'danger')
+        return redirect(url_for('admin.students'))
+    
     student.is_deleted = True  # 软删除
     student.user.is_deleted = True  # 同时软删除关联的用户
+    # 删除的学生不再占用床位
+    move_student(student.id, student.dorm_id, None)
     db.session.commit()
     
     flash('学生删除成功！', 'success')
@@ -155,9 +190,17 @@ def edit_student(student_id):
         student.gender = request.form['gender']
         student.major = request.form['major']
         student.grade = request.form['grade']
-        student.dorm_id = request.form['dorm_id'] if request.form['dorm_id'] else None
         student.phone = request.form['phone']
         
+        # 换宿舍时两边的人数在数据库端增减，目标宿舍已满时不保存
+        dorm_id = int(request.form['dorm_id']) if request.form['dorm_id'] else None
+        try:
+            move_student(student.id, student.dorm_id, dorm_id)
+        except OccupancyError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('admin.edit_student', student_id=student_id))
+        
         db.session.commit()
         
         flash('学生信息更新成功！', 'success')
@@ -173,7 +216,7 @@ def dorm_managers():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_managers = DormManager.query.filter_by(is_deleted=False).all()  # 只显示未删除的宿管
+    dorm_managers = DormManager.query.options(joinedload(DormManager.user)).filter_by(is_deleted=False).all()  # 只显示未删除的宿管
     return render_template('admin/dorm_managers.html', dorm_managers=dorm_managers)
 
 @admin_bp.route('/dorm_managers/add', methods=['GET', 'POST'])
@@ -241,6 +284,7 @@ def edit_dorm_manager(manager_id):
 
 @admin_bp.route('/dorm_managers/delete/<int:manager_id>')
 @login_required
+@use_primary  # 用 GET 链接执行删除
 def delete_dorm_manager(manager_id):
     if current_user.role != 'admin':
         flash('无权访问！', 'danger')
@@ -265,6 +309,18 @@ def dormitories():
     dormitories = Dormitory.query.all()
     return render_template('admin/dormitories.html', dormitories=dormitories)
 
+# 入住人数对账：GET 只核对不修改，POST 修正全部不符的宿舍
+@admin_bp.route('/dormitories/reconcile', methods=['GET', 'POST'])
+@login_required
+def reconcile_dormitory_occupancy():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    applied = request.method == 'POST'
+    result = reconcile_occupancy(apply=applied)
+    return render_template('admin/reconcile_occupancy.html', result=result, applied=applied)
+
 @admin_bp.route('/get_dorm_students/<int:dorm_id>')
 @login_required
 def get_dorm_students(dorm_id):
@@ -365,69 +421,70 @@ def smart_allocate_dorm():
         return redirect(url_for('main.login'))
     
     if request.method == 'POST':
-        # 获取需要分配宿舍的学生列表（未分配宿舍的学生）
-        unallocated_students = Student.query.filter_by(dorm_id=None).all()
-        
-        allocated_count = 0
-        
-        for student in unallocated_students:
-            # 查找合适的宿舍：同性别、未满员、优先同专业同年级、其次同专业、再次同年级
-            
-            # 1. 优先查找同专业同年级、同性别、未满员的宿舍
-            suitable_dorms = Dormitory.query.filter(
-                Dormitory.gender == student.gender,
-                Dormitory.current_occupancy < Dormitory.capacity
-            ).join(Student).filter(
-                Student.major == student.major,
-                Student.grade == student.grade
-            ).all()
-            
-            # 2. 如果没有同专业同年级的合适宿舍，查找同专业、同性别、未满员的宿舍
-            if not suitable_dorms:
-                suitable_dorms = Dormitory.query.filter(
-                    Dormitory.gender == student.gender,
-                    Dormitory.current_occupancy < Dormitory.capacity
-                ).join(Student).filter(
-                    Student.major == student.major
-                ).all()
-            
-            # 3. 如果没有同专业的合适宿舍，查找同年级、同性别、未满员的宿舍
-            if not suitable_dorms:
-                suitable_dorms = Dormitory.query.filter(
-                    Dormitory.gender == student.gender,
-                    Dormitory.current_occupancy < Dormitory.capacity
-                ).join(Student).filter(
-                    Student.grade == student.grade
-                ).all()
-            
-            # 4. 如果没有同年级的合适宿舍，查找同性别、未满员的宿舍
-            if not suitable_dorms:
-                suitable_dorms = Dormitory.query.filter(
-                    Dormitory.gender == student.gender,
-                    Dormitory.current_occupancy < Dormitory.capacity
-                ).all()
-            
-            # 如果找到合适的宿舍，进行分配
-            if suitable_dorms:
-                # 选择人数最多的宿舍（优先填满宿舍）
-                suitable_dorms.sort(key=lambda x: x.current_occupancy, reverse=True)
-                selected_dorm = suitable_dorms[0]
-                
-                # 分配宿舍
-                student.dorm_id = selected_dorm.id
-                selected_dorm.current_occupancy += 1
-                allocated_count += 1
-        
-        db.session.commit()
+        # 一次性加载数据、内存中分配、批量写回
+        try:
+            allocated_count = smart_allocate(request.form.get('strategy', DEFAULT_STRATEGY))
+        except AllocationPlanError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin.smart_allocate_dorm'))
         
         flash(f'已完成 {allocated_count} 名学生的宿舍分配！', 'success')
         return redirect(url_for('admin.students'))
     
     # 统计未分配宿舍的学生数量
-    unallocated_count = Student.query.filter_by(dorm_id=None).count()
+    unallocated_count = Student.query.filter_by(dorm_id=None, is_deleted=False).count()
     
     return render_template('admin/smart_allocate_dorm.html', unallocated_count=unallocated_count)
 
+@admin_bp.route('/smart_allocate_dorm/preview', methods=['POST'])
+@login_required
+def preview_allocate_dorm():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    # 只计算方案，不写数据库
+    plan = preview_allocation(request.form.get('strategy', DEFAULT_STRATEGY))
+    
+    return render_template('admin/smart_allocate_dorm.html',
+                         unallocated_count=plan.stats['total_students'],
+                         plan=plan)
+
+@admin_bp.route('/smart_allocate_dorm/apply/<plan_id>', methods=['POST'])
+@login_required
+def apply_allocate_plan(plan_id):
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    try:
+        allocated_count = apply_plan(plan_id)
+    except AllocationPlanError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.smart_allocate_dorm'))
+    
+    flash(f'已按预览方案完成 {allocated_count} 名学生的宿舍分配！', 'success')
+    return redirect(url_for('admin.students'))
+
+@admin_bp.route('/smart_allocate_dorm/plan/<plan_id>.csv')
+@login_required
+def download_allocate_plan(plan_id):
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    try:
+        plan = get_plan(plan_id)
+    except AllocationPlanError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.smart_allocate_dorm'))
+    
+    return Response(
+        export_plan_csv(plan),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=allocation_plan_{plan_id}.csv'}
+    )
+
 # 水电费管理
 @admin_bp.route('/utility_bills')
 @login_required
@@ -436,10 +493,12 @@ def utility_bills():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    # 获取所有水电费账单
-    bills = UtilityBill.query.order_by(UtilityBill.month.desc(), UtilityBill.dorm_id).all()
+    # 水电费账单，服务端筛选并分页
+    sort, order = resolve_sort('utility_bills', request.args)
+    page = paginate(utility_bill_query(request.args), order, sort)
     
-    return render_template('admin/utility_bills.html', bills=bills)
+    return render_template('admin/utility_bills.html', bills=page, page=page,
+                         filters=request.args, buildings=building_options())
 
 @admin_bp.route('/utility_bills/add', methods=['GET', 'POST'])
 @login_required
@@ -454,10 +513,8 @@ def add_utility_bill():
         electricity = float(request.form['electricity'])
         water = float(request.form['water'])
         
-        # 计算费用（这里假设电费1元/度，水费2元/吨，实际可根据学校规定调整）
-        electricity_cost = round(electricity * 1.0, 2)
-        water_cost = round(water * 2.0, 2)
-        total_cost = round(electricity_cost + water_cost, 2)
+        # 按该宿舍楼栋、该月份适用的价目表计算费用
+        electricity_cost, water_cost, total_cost = price_bill(dorm_id, month, electricity, water)
         
         # 检查是否已存在该宿舍该月份的账单
         existing_bill = UtilityBill.query.filter_by(dorm_id=dorm_id, month=month).first()
@@ -488,6 +545,101 @@ def add_utility_bill():
     
     return render_template('admin/add_utility_bill.html', dormitories=dormitories)
 
+@admin_bp.route('/utility_bills/batch', methods=['GET', 'POST'])
+@login_required
+def batch_utility_bills():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    result = error = None
+    month = request.form.get('month') or datetime.now().strftime('%Y-%m')
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            error = '请选择抄表文件！'
+        else:
+            try:
+                result = run_bill_batch(upload.stream, month)
+            except BillRunError as e:
+                error = str(e)
+    
+    return render_template('admin/batch_utility_bills.html', result=result, error=error, month=month)
+
+@admin_bp.route('/utility_bills/batch/template.csv')
+@login_required
+def download_meter_reading_template():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    return Response(
+        meter_reading_template_csv(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=meter_readings_template.csv'}
+    )
+
+@admin_bp.route('/utility_bills/tariffs', methods=['GET', 'POST'])
+@login_required
+def tariffs():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    if request.method == 'POST':
+        try:
+            create_tariff(
+                request.form.get('name', '').strip(),
+                request.form.get('building') or None,
+                request.form.get('month_from'),
+                request.form.get('month_to') or None,
+                {utility: parse_tiers(request.form.get(f'{utility}_tiers')) for utility in UTILITIES}
+            )
+            db.session.commit()
+            flash('价目表已添加，如需按新价格重算已出账单请使用下方的重算功能', 'success')
+        except TariffError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+        return redirect(url_for('admin.tariffs'))
+    
+    tariff_list = Tariff.query.options(selectinload(Tariff.tiers)).order_by(Tariff.id.desc()).all()
+    tier_texts = {
+        tariff.id: {utility: describe_tiers([(tier.lower_bound, tier.price) for tier in tariff.tiers if tier.utility == utility])
+                    for utility in UTILITIES}
+        for tariff in tariff_list
+    }
+    return render_template('admin/tariffs.html', tariffs=tariff_list, tier_texts=tier_texts,
+                         buildings=building_options())
+
+@admin_bp.route('/utility_bills/tariffs/delete/<int:tariff_id>', methods=['POST'])
+@login_required
+def delete_tariff(tariff_id):
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    tariff = Tariff.query.get_or_404(tariff_id)
+    db.session.delete(tariff)
+    db.session.commit()
+    
+    flash('价目表已删除！', 'success')
+    return redirect(url_for('admin.tariffs'))
+
+@admin_bp.route('/utility_bills/reprice', methods=['POST'])
+@login_required
+def reprice_utility_bills():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    try:
+        result = reprice_bills(request.form.get('month_from'), request.form.get('month_to'),
+                               building=request.form.get('building') or None)
+        flash(f'已按当前价目表重算 {result.updated} 张未缴费账单（{result.skipped_paid} 张已缴费账单保持不变）', 'success')
+    except TariffError as e:
+        flash(str(e), 'danger')
+    return redirect(url_for('admin.tariffs'))
+
 @admin_bp.route('/utility_bills/edit/<int:bill_id>', methods=['GET', 'POST'])
 @login_required
 def edit_utility_bill(bill_id):
@@ -498,15 +650,22 @@ def edit_utility_bill(bill_id):
     bill = UtilityBill.query.get_or_404(bill_id)
     
     if request.method == 'POST':
+        # 改到的宿舍、月份不能与其他账单重复（每间宿舍每月一张账单）
+        duplicate = UtilityBill.query.filter(UtilityBill.dorm_id == request.form['dorm_id'],
+                                             UtilityBill.month == request.form['month'],
+                                             UtilityBill.id != bill.id).first()
+        if duplicate:
+            flash(f'该宿舍{request.form["month"]}月份的账单已存在！', 'danger')
+            return redirect(url_for('admin.edit_utility_bill', bill_id=bill.id))
+
         bill.dorm_id = request.form['dorm_id']
         bill.month = request.form['month']
         bill.electricity = float(request.form['electricity'])
         bill.water = float(request.form['water'])
         
-        # 重新计算费用
-        bill.electricity_cost = round(bill.electricity * 1.0, 2)
-        bill.water_cost = round(bill.water * 2.0, 2)
-        bill.total_cost = round(bill.electricity_cost + bill.water_cost, 2)
+        # 按价目表重新计算费用
+        bill.electricity_cost, bill.water_cost, bill.total_cost = price_bill(
+            bill.dorm_id, bill.month, bill.electricity, bill.water)
         
         db.session.commit()
         
@@ -520,6 +679,7 @@ def edit_utility_bill(bill_id):
 
 @admin_bp.route('/utility_bills/delete/<int:bill_id>')
 @login_required
+@use_primary  # 用 GET 链接执行删除
 def delete_utility_bill(bill_id):
     if current_user.role != 'admin':
         flash('无权访问！', 'danger')
@@ -540,58 +700,15 @@ def utility_bills_statistics():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    # 统计数据
-    from collections import defaultdict
-    
-    # 获取所有账单
-    bills = UtilityBill.query.all()
-    
-    # 计算总费用
-    total_electricity = sum(bill.electricity for bill in bills)
-    total_water = sum(bill.water for bill in bills)
-    total_electricity_cost = sum(bill.electricity_cost for bill in bills)
-    total_water_cost = sum(bill.water_cost for bill in bills)
-    total_cost = sum(bill.total_cost for bill in bills)
-    
-    # 按楼栋统计
-    building_stats = defaultdict(lambda: {
-        'electricity': 0,
-        'water': 0,
-        'electricity_cost': 0,
-        'water_cost': 0,
-        'total_cost': 0
-    })
-    
-    for bill in bills:
-        building = bill.dormitory.building
-        building_stats[building]['electricity'] += bill.electricity
-        building_stats[building]['water'] += bill.water
-        building_stats[building]['electricity_cost'] += bill.electricity_cost
-        building_stats[building]['water_cost'] += bill.water_cost
-        building_stats[building]['total_cost'] += bill.total_cost
-    
-    # 按月份统计
-    monthly_stats = defaultdict(lambda: {
-        'electricity': 0,
-        'water': 0,
-        'electricity_cost': 0,
-        'water_cost': 0,
-        'total_cost': 0
-    })
-    
-    for bill in bills:
-        monthly_stats[bill.month]['electricity'] += bill.electricity
-        monthly_stats[bill.month]['water'] += bill.water
-        monthly_stats[bill.month]['electricity_cost'] += bill.electricity_cost
-        monthly_stats[bill.month]['water_cost'] += bill.water_cost
-        monthly_stats[bill.month]['total_cost'] += bill.total_cost
+    # 统计数据全部来自按楼栋、月份维护的汇总表
+    totals, building_stats, monthly_stats = rollup_statistics()
     
     return render_template('admin/utility_bills_statistics.html',
-                         total_electricity=total_electricity,
-                         total_water=total_water,
-                         total_electricity_cost=total_electricity_cost,
-                         total_water_cost=total_water_cost,
-                         total_cost=total_cost,
+                         total_electricity=totals['electricity'],
+                         total_water=totals['water'],
+                         total_electricity_cost=totals['electricity_cost'],
+                         total_water_cost=totals['water_cost'],
+                         total_cost=totals['total_cost'],
                          building_stats=building_stats,
                          monthly_stats=monthly_stats)
 
@@ -602,10 +719,32 @@ def payments():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    # 获取所有缴费记录
-    payments = Payment.query.order_by(Payment.payment_date.desc()).all()
+    # 缴费记录，服务端筛选并分页
+    sort, order = resolve_sort('payments', request.args)
+    page = paginate(payment_query(request.args), order, sort)
     
-    return render_template('admin/payments.html', payments=payments)
+    return render_template('admin/payments.html', payments=page, page=page,
+                         filters=request.args, buildings=building_options())
+
+# 列表导出：与列表页相同的筛选和排序，不分页，边查边发送
+@admin_bp.route('/export/<name>.<fmt>')
+@login_required
+def export_list(name, fmt):
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    if name not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    try:
+        filename, mimetype, chunks = export_file(name, fmt, request.args, compress=request.args.get('gzip') == '1')
+    except ExportError as exc:
+        return Response(str(exc), status=501, mimetype='text/plain; charset=utf-8')
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 # 报修管理
 @admin_bp.route('/repairs')
@@ -615,8 +754,25 @@ def repairs():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    repairs = Repair.query.filter_by(is_deleted=False).all()  # 只显示未删除的报修
-    return render_template('admin/repairs.html', repairs=repairs)
+    # 只显示未删除的报修，服务端筛选并分页；全文搜索时按相关度排序
+    page = repair_page(request.args)
+    return render_template('admin/repairs.html', repairs=page, page=page,
+                         filters=request.args, buildings=building_options())
+
+# 报修全文搜索接口：参数同报修列表（text、building、status、sort、after/before、per_page）
+@admin_bp.route('/repairs/search')
+@login_required
+def search_repairs():
+    if current_user.role != 'admin':
+        return {'success': False, 'message': '无权访问！'}, 403
+    
+    page = repair_page(request.args)
+    return {
+        'success': True,
+        'repairs': [repair_dict(repair) for repair in page],
+        'next': page.next_url,
+        'prev': page.prev_url,
+    }
 
 @admin_bp.route('/get_repair_details/<int:repair_id>')
 @login_required
@@ -711,8 +867,11 @@ def visitors():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    visitors = Visitor.query.filter_by(is_deleted=False).all()  # 只显示未删除的访客
-    return render_template('admin/visitors.html', visitors=visitors)
+    # 只显示未删除的访客，服务端筛选并分页
+    sort, order = resolve_sort('visitors', request.args)
+    page = paginate(visitor_query(request.args), order, sort)
+    return render_template('admin/visitors.html', visitors=page, page=page,
+                         filters=request.args, buildings=building_options())
 
 @admin_bp.route('/get_visitor_details/<int:visitor_id>')
 @login_required
@@ -760,4 +919,60 @@ def mark_visitor_leave(visitor_id):
     visitor.leave_date = datetime.utcnow()
     db.session.commit()
     
-    return {'success': True, 'message': '标记成功！'}
\ No newline at end of file
+    return {'success': True, 'message': '标记成功！'}
+
+# 性能指标
+@admin_bp.route('/metrics')
+@login_required
+def metrics():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    return render_template('admin/metrics.html', rows=metrics_registry.snapshot(),
+                         enabled=current_app.config.get('METRICS_ENABLED', True),
+                         merged=bool(metrics_registry.directory))
+
+@admin_bp.route('/metrics/reset', methods=['POST'])
+@login_required
+def reset_metrics():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    metrics_registry.clear()
+    flash('性能指标已清零！', 'success')
+    return redirect(url_for('admin.metrics'))
+
+@admin_bp.route('/slow_queries')
+@login_required
+def slow_query_log():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    return render_template('admin/slow_queries.html', entries=slow_queries.recent(),
+                         threshold=current_app.config.get('SLOW_QUERY_MS'))
+
+@admin_bp.route('/slow_queries/clear', methods=['POST'])
+@login_required
+def clear_slow_queries():
+    if current_user.role != 'admin':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    slow_queries.clear()
+    flash('慢查询记录已清空！', 'success')
+    return redirect(url_for('admin.slow_query_log'))
+
+@admin_bp.route('/metrics/prometheus')
+def metrics_prometheus():
+    # 监控系统抓取时使用 Bearer 令牌，已登录的管理员也可以直接查看
+    token = current_app.config.get('METRICS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    # 按字节比较：compare_digest 遇到非 ASCII 字符串会抛 TypeError
+    authorized = bool(token) and hmac.compare_digest(auth.encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+    if not authorized and not (current_user.is_authenticated and current_user.role == 'admin'):
+        abort(403)
+    
+    return Response(metrics_registry.prometheus(), mimetype='text/plain; version=0.0.4')
@@ -1,9 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response
 from flask_login import login_required, current_user
 from app import db
-from app.models.models import User, DormManager, Student, Dormitory, Repair, Visitor, DormChangeRequest
-from werkzeug.security import generate_password_hash
+from app.models.models import Student, Dormitory, Repair, Visitor, DormChangeRequest
 from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.services.pagination import paginate
+from app.services.listing import resolve_sort, student_query, repair_page, visitor_query, dorm_change_request_query
+from app.services.occupancy import move_student, OccupancyError
+from app.services.identity import current_dorm_manager
+from app.services import dashboard_stats, live_feed
 
 dorm_manager_bp = Blueprint('dorm_manager', __name__)
 
@@ -14,7 +21,9 @@ def dashboard():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
+    # 先记下最新的推送事件，页面加载后从这里开始接收，查询期间提交的写入不会漏掉；未开启实时推送时为 None
+    feed_since = live_feed.bus.last_event_id() if live_feed.enabled() else None
     
     # 统计数据
     # 本楼栋学生数量
@@ -31,36 +40,64 @@ def dashboard():
         Repair.status == 'pending'
     ).count()
     
-    # 本楼栋在访访客数量
-    current_visitors = Visitor.query.filter_by(
-        dorm_number=Dormitory.dorm_number,
-        status='in'
-    ).join(Dormitory).filter(
+    # 本楼栋在访访客数量（访客表只记录宿舍号，按宿舍号关联楼栋）
+    building_dorm_numbers = select(Dormitory.dorm_number).where(
         Dormitory.building == dorm_manager.responsible_building
+    )
+    current_visitors = Visitor.query.filter(
+        Visitor.dorm_number.in_(building_dorm_numbers),
+        Visitor.status == 'in'
     ).count()
     
     # 获取最新活动
-    latest_repairs = Repair.query.join(Dormitory).filter(
+    latest_repairs = Repair.query.options(joinedload(Repair.student)).join(Dormitory).filter(
         Dormitory.building == dorm_manager.responsible_building
     ).order_by(Repair.created_at.desc()).limit(5).all()
     
-    latest_visitors = Visitor.query.join(Dormitory).filter(
-        Dormitory.building == dorm_manager.responsible_building
+    latest_visitors = Visitor.query.filter(
+        Visitor.dorm_number.in_(building_dorm_numbers)
     ).order_by(Visitor.visit_date.desc()).limit(5).all()
     
-    latest_dorm_changes = DormChangeRequest.query.join(Student).join(Dormitory).filter(
+    latest_dorm_changes = DormChangeRequest.query.options(joinedload(DormChangeRequest.student)).join(Student).join(Dormitory).filter(
         Dormitory.building == dorm_manager.responsible_building
     ).order_by(DormChangeRequest.created_at.desc()).limit(5).all()
     
+    # 合并为最新活动，按时间倒序取前8条（访客按来访时间）
+    activities = [{'type': 'repair', 'item': repair, 'time': repair.created_at} for repair in latest_repairs]
+    activities += [{'type': 'visitor', 'item': visitor, 'time': visitor.visit_date} for visitor in latest_visitors]
+    activities += [{'type': 'dorm_change', 'item': change, 'time': change.created_at} for change in latest_dorm_changes]
+    activities.sort(key=lambda activity: activity['time'] or datetime.min, reverse=True)
+    
     return render_template('dorm_manager/dashboard.html', 
                          dorm_manager=dorm_manager,
                          total_students=total_students,
                          total_dorms=total_dorms,
                          pending_repairs=pending_repairs,
                          current_visitors=current_visitors,
-                         latest_repairs=latest_repairs,
-                         latest_visitors=latest_visitors,
-                         latest_dorm_changes=latest_dorm_changes)
+                         activities=activities[:8],
+                         feed_since=feed_since)
+
+# 仪表板实时推送：本楼栋新的报修、访客、宿舍调换申请（Server-Sent Events）
+@dorm_manager_bp.route('/dashboard/events')
+@login_required
+def dashboard_events():
+    if current_user.role != 'dorm_manager':
+        # EventSource 收到非 200 响应后不再重连
+        return Response('无权访问！', status=403, mimetype='text/plain; charset=utf-8')
+    
+    dorm_manager = current_dorm_manager()
+    # 重连时浏览器带上收到的最后一个事件ID；首次连接用页面渲染时记下的位置
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    events = live_feed.stream(dorm_manager.responsible_building, last_event_id)
+    if events is None:
+        # 未开启实时推送或推送连接已满：204 使浏览器停止重连，页面退回手动刷新
+        return Response(status=204)
+    # 不使用 stream_with_context：推送期间不占用请求上下文和数据库连接
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # 学生管理
 @dorm_manager_bp.route('/students')
@@ -70,15 +107,14 @@ def students():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
     
-    # 获取本楼栋的所有学生
-    students = Student.query.join(Dormitory).filter(
-        Dormitory.building == dorm_manager.responsible_building,
-        Student.is_deleted == False
-    ).all()
+    # 本楼栋的学生，服务端筛选并分页
+    sort, order = resolve_sort('students', request.args)
+    page = paginate(student_query(request.args, building=dorm_manager.responsible_building), order, sort)
     
-    return render_template('dorm_manager/students.html', students=students, dorm_manager=dorm_manager)
+    return render_template('dorm_manager/students.html', students=page, page=page,
+                         filters=request.args, dorm_manager=dorm_manager)
 
 # 宿舍管理
 @dorm_manager_bp.route('/dormitories')
@@ -88,7 +124,7 @@ def dormitories():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
     
     # 获取本楼栋的所有宿舍
     dormitories = Dormitory.query.filter_by(building=dorm_manager.responsible_building).all()
@@ -101,7 +137,7 @@ def get_dorm_students(dorm_id):
     if current_user.role != 'dorm_manager':
         return {'success': False, 'message': '无权访问！'}
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
     dormitory = Dormitory.query.get(dorm_id)
     
     # 检查宿舍是否属于当前宿管负责的楼栋
@@ -137,15 +173,13 @@ def repairs():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
     
-    # 获取本楼栋的所有报修
-    repairs = Repair.query.join(Dormitory).filter(
-        Dormitory.building == dorm_manager.responsible_building,
-        Repair.is_deleted == False
-    ).all()
+    # 本楼栋的报修，服务端筛选并分页；全文搜索时按相关度排序
+    page = repair_page(request.args, building=dorm_manager.responsible_building)
     
-    return render_template('dorm_manager/repairs.html', repairs=repairs, dorm_manager=dorm_manager)
+    return render_template('dorm_manager/repairs.html', repairs=page, page=page,
+                         filters=request.args, dorm_manager=dorm_manager)
 
 @dorm_manager_bp.route('/process_repair', methods=['POST'])
 @login_required
@@ -177,15 +211,14 @@ def visitors():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
     
-    # 获取本楼栋的所有访客
-    visitors = Visitor.query.join(Dormitory).filter(
-        Dormitory.building == dorm_manager.responsible_building,
-        Visitor.is_deleted == False
-    ).all()
+    # 本楼栋的访客（按宿舍号关联楼栋），服务端筛选并分页
+    sort, order = resolve_sort('visitors', request.args)
+    page = paginate(visitor_query(request.args, building=dorm_manager.responsible_building), order, sort)
     
-    return render_template('dorm_manager/visitors.html', visitors=visitors, dorm_manager=dorm_manager)
+    return render_template('dorm_manager/visitors.html', visitors=page, page=page,
+                         filters=request.args, dorm_manager=dorm_manager)
 
 @dorm_manager_bp.route('/mark_visitor_leave/<int:visitor_id>', methods=['POST'])
 @login_required
@@ -212,14 +245,30 @@ def dorm_change_requests():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    dorm_manager = DormManager.query.filter_by(user_id=current_user.id).first()
+    dorm_manager = current_dorm_manager()
     
-    # 获取本楼栋的所有宿舍调换申请
-    requests = DormChangeRequest.query.join(Student).join(Dormitory).filter(
-        Dormitory.building == dorm_manager.responsible_building
-    ).all()
+    # 本楼栋的宿舍调换申请，服务端筛选并分页
+    sort, order = resolve_sort('dorm_change_requests', request.args)
+    page = paginate(dorm_change_request_query(request.args, building=dorm_manager.responsible_building), order, sort)
     
-    return render_template('dorm_manager/dorm_change_requests.html', requests=requests, dorm_manager=dorm_manager)
+    return render_template('dorm_manager/dorm_change_requests.html', requests=page, page=page,
+                         filters=request.args, dorm_manager=dorm_manager)
+
+def _decide_dorm_change(dorm_change_request, status):
+    """把待审批的申请改为 status（approved / rejected），申请已被处理时返回 False；不提交事务"""
+    result = db.session.execute(
+        update(DormChangeRequest)
+        .where(DormChangeRequest.id == dorm_change_request.id, DormChangeRequest.status == 'pending')
+        .values(status=status, approved_by=current_user.id, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    # UPDATE 语句不经过 flush：本地对象直接记为新状态（不再写库），提交后照常推送并使仪表板缓存失效
+    set_committed_value(dorm_change_request, 'status', status)
+    live_feed.record_status_change(dorm_change_request, 'pending')
+    dashboard_stats.mark_dirty()
+    return True
 
 @dorm_manager_bp.route('/approve_dorm_change/<int:request_id>', methods=['POST'])
 @login_required
@@ -233,22 +282,21 @@ def approve_dorm_change(request_id):
         flash('申请不存在！', 'danger')
         return redirect(url_for('dorm_manager.dorm_change_requests'))
     
-    # 更新申请状态
-    dorm_change_request.status = 'approved'
-    dorm_change_request.approved_by = current_user.id
-    dorm_change_request.updated_at = datetime.utcnow()
-    
-    # 执行宿舍调换
-    student = dorm_change_request.student
-    old_dorm = dorm_change_request.current_dorm
-    new_dorm = dorm_change_request.target_dorm
-    
-    if old_dorm:
-        old_dorm.current_occupancy -= 1
+    # 只有待审批的申请才能处理：以状态为条件更新，并发重复提交时只有一次生效
+    if not _decide_dorm_change(dorm_change_request, 'approved'):
+        flash('该申请已被处理！', 'danger')
+        return redirect(url_for('dorm_manager.dorm_change_requests'))
     
-    if new_dorm:
-        new_dorm.current_occupancy += 1
-        student.dorm_id = new_dorm.id
+    # 执行宿舍调换：人数在数据库端带容量条件增减，目标宿舍已满时整个审批回滚
+    target_dorm_id = dorm_change_request.target_dorm_id
+    if target_dorm_id:
+        student = dorm_change_request.student
+        try:
+            move_student(student.id, student.dorm_id, target_dorm_id)
+        except OccupancyError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('dorm_manager.dorm_change_requests'))
     
     db.session.commit()
     
@@ -267,10 +315,9 @@ def reject_dorm_change(request_id):
         flash('申请不存在！', 'danger')
         return redirect(url_for('dorm_manager.dorm_change_requests'))
     
-    # 更新申请状态
-    dorm_change_request.status = 'rejected'
-    dorm_change_request.approved_by = current_user.id
-    dorm_change_request.updated_at = datetime.utcnow()
+    if not _decide_dorm_change(dorm_change_request, 'rejected'):
+        flash('该申请已被处理！', 'danger')
+        return redirect(url_for('dorm_manager.dorm_change_requests'))
     
     db.session.commit()
     
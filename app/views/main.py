@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models.models import User
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
+from app.services.passwords import check_password, must_change_password
 import random
 import string
 
@@ -21,10 +22,13 @@ def login():
         
         user = User.query.filter_by(username=username, role=user_type).first()
         
-        if user and check_password_hash(user.password, password):
+        if user and check_password(user, password):
             login_user(user)
             flash('登录成功！', 'success')
             
+            # 批量导入、尚未设置密码的学生先修改密码
+            if must_change_password(user):
+                return redirect(url_for('student.change_password'))
             if user.role == 'admin':
                 return redirect(url_for('admin.dashboard'))
             elif user.role == 'dorm_manager':
@@ -0,0 +1,108 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask_login import login_required, current_user
+from app import db
+from app.services.identity import current_dorm_manager
+from app.services.listing import building_options
+from app.services.repair_dispatch import (dispatch_queue, claimed_repairs, claim_next, complete_repair,
+                                          release_repair, repair_dict, DispatchError, QUEUE_LIMIT)
+
+# 报修派单队列：管理员看全部楼栋（可按楼栋筛选），宿管只看本楼栋。
+# 页面和 /api/ 下的 JSON 接口（端点名加 api_ 前缀）共用同一组视图，api 参数区分返回页面还是 JSON。
+repair_queue_bp = Blueprint('repair_queue', __name__)
+
+ROLES = ('admin', 'dorm_manager')
+
+
+def _scope():
+    """(所属楼栋, 宿管档案)：管理员不限楼栋，可用 ?building= 筛选"""
+    if current_user.role == 'dorm_manager':
+        dorm_manager = current_dorm_manager()
+        return dorm_manager.responsible_building, dorm_manager
+    return request.values.get('building') or None, None
+
+
+def _forbidden(api):
+    if api:
+        return {'success': False, 'message': '无权访问！'}, 403
+    flash('无权访问！', 'danger')
+    return redirect(url_for('main.login'))
+
+
+def _reply(api, success, message, repair=None):
+    if api:
+        body = {'success': success, 'message': message}
+        if repair is not None:
+            body['repair'] = repair_dict(repair)
+        return body, 200 if success else 409
+    flash(message, 'success' if success else 'danger')
+    return redirect(url_for('repair_queue.queue', building=request.values.get('building') or None))
+
+
+@repair_queue_bp.route('/', defaults={'api': False})
+@repair_queue_bp.route('/api', endpoint='api_queue', defaults={'api': True})
+@login_required
+def queue(api):
+    if current_user.role not in ROLES:
+        return _forbidden(api)
+
+    building, dorm_manager = _scope()
+    # 两端都要限制：SQLite 把负数 LIMIT 当作不限，会对全部待处理报修算分
+    limit = max(1, min(request.args.get('limit', QUEUE_LIMIT, type=int) or QUEUE_LIMIT, 200))
+    entries = dispatch_queue(limit, building=building)
+    mine = claimed_repairs(current_user.id)
+
+    if api:
+        return {
+            'queue': [repair_dict(repair, score) for score, repair in entries],
+            'claimed': [repair_dict(repair) for repair in mine],
+        }
+    base_template = 'dorm_manager/base.html' if dorm_manager else 'admin/base.html'
+    return render_template('repair_queue.html', base_template=base_template, entries=entries, mine=mine,
+                         building=building, dorm_manager=dorm_manager,
+                         buildings=None if dorm_manager else building_options())
+
+# 领取下一条：多人同时领取时每条报修只会被一人领到
+@repair_queue_bp.route('/claim', methods=['POST'], defaults={'api': False})
+@repair_queue_bp.route('/api/claim', methods=['POST'], endpoint='api_claim', defaults={'api': True})
+@login_required
+def claim(api):
+    if current_user.role not in ROLES:
+        return _forbidden(api)
+
+    building, _dorm_manager = _scope()
+    repair = claim_next(current_user.id, building=building)
+    if repair is None:
+        db.session.rollback()
+        return _reply(api, False, '队列中没有待处理的报修！')
+    db.session.commit()
+    return _reply(api, True, f'已领取报修：{repair.title}', repair)
+
+@repair_queue_bp.route('/<int:repair_id>/complete', methods=['POST'], defaults={'api': False})
+@repair_queue_bp.route('/api/<int:repair_id>/complete', methods=['POST'], endpoint='api_complete', defaults={'api': True})
+@login_required
+def complete(repair_id, api):
+    if current_user.role not in ROLES:
+        return _forbidden(api)
+
+    try:
+        repair = complete_repair(repair_id, current_user.id, is_admin=current_user.role == 'admin')
+    except DispatchError as e:
+        db.session.rollback()
+        return _reply(api, False, str(e))
+    db.session.commit()
+    return _reply(api, True, f'报修已完成：{repair.title}', repair)
+
+@repair_queue_bp.route('/<int:repair_id>/release', methods=['POST'], defaults={'api': False})
+@repair_queue_bp.route('/api/<int:repair_id>/release', methods=['POST'], endpoint='api_release', defaults={'api': True})
+@login_required
+def release(repair_id, api):
+    if current_user.role not in ROLES:
+        return _forbidden(api)
+
+    try:
+        repair = release_repair(repair_id, current_user.id, is_admin=current_user.role == 'admin')
+    except DispatchError as e:
+        db.session.rollback()
+        return _reply(api, False, str(e))
+    db.session.commit()
+    return _reply(api, True, f'报修已退回队列：{repair.title}', repair)
@@ -1,13 +1,46 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models.models import Student, Repair, Dormitory, Visitor, DormChangeRequest, UtilityBill, Payment
+from app.models.models import User, Student, Repair, Dormitory, Visitor, DormChangeRequest, UtilityBill, Payment
+from app.services.identity import current_student
+from app.services.passwords import must_change_password, validate_new_password
+from app.services.vacancy import available_rooms
+from sqlalchemy.orm import contains_eager, joinedload
 import os
-import qrcode
+from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 
 student_bp = Blueprint('student', __name__)
 
+@student_bp.before_request
+def require_password_change():
+    # 批量导入、尚未设置密码的学生修改密码前不能使用其他功能
+    if (current_user.is_authenticated and must_change_password(current_user)
+            and request.endpoint != 'student.change_password'):
+        flash('请先修改初始密码！', 'danger')
+        return redirect(url_for('student.change_password'))
+
+@student_bp.route('/change_password', methods=['GET', 'POST'])
+@login_required
+def change_password():
+    if current_user.role != 'student':
+        flash('无权访问！', 'danger')
+        return redirect(url_for('main.login'))
+    
+    if request.method == 'POST':
+        password = request.form.get('password', '')
+        error = validate_new_password(password, request.form.get('confirm_password', ''))
+        if error:
+            flash(error + '！', 'danger')
+        else:
+            user = db.session.get(User, current_user.id)
+            user.password = generate_password_hash(password)
+            db.session.commit()
+            flash('密码修改成功！', 'success')
+            return redirect(url_for('student.dashboard'))
+    
+    return render_template('student/change_password.html', must_change=must_change_password(current_user))
+
 @student_bp.route('/dashboard')
 @login_required
 def dashboard():
@@ -15,7 +48,7 @@ def dashboard():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     return render_template('student/dashboard.html', student=student)
 
 @student_bp.route('/my_info', methods=['GET', 'POST'])
@@ -25,7 +58,7 @@ def my_info():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     
     if request.method == 'POST':
         # 处理照片上传
@@ -57,7 +90,7 @@ def my_dorm():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     dorm = Dormitory.query.get(student.dorm_id) if student.dorm_id else None
     return render_template('student/my_dorm.html', student=student, dorm=dorm)
 
@@ -68,7 +101,7 @@ def submit_repair():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     
     if request.method == 'POST':
         title = request.form['title']
@@ -106,7 +139,7 @@ def my_repairs():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     repairs = Repair.query.filter_by(student_id=student.id, is_deleted=False).all()
     
     return render_template('student/my_repairs.html', repairs=repairs)
@@ -118,7 +151,7 @@ def visitor_register():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     
     if request.method == 'POST':
         name = request.form['name']
@@ -141,7 +174,8 @@ def visitor_register():
         db.session.add(visitor)
         db.session.flush()  # 获取visitor.id
         
-        # 生成QR码
+        # 生成QR码（qrcode 依赖 Pillow，导入较慢，用到时才导入）
+        import qrcode
         qr_data = f"visitor_id={visitor.id}&name={name}&id_card={id_card}&visit_date={visitor.visit_date.strftime('%Y-%m-%d %H:%M:%S')}"
         qr = qrcode.QRCode(
             version=1,
@@ -178,7 +212,7 @@ def my_visitors():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     visitors = Visitor.query.filter_by(student_id=student.id, is_deleted=False).all()
     
     return render_template('student/my_visitors.html', visitors=visitors)
@@ -190,7 +224,7 @@ def submit_dorm_change():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     
     if request.method == 'POST':
         target_dorm_id = request.form.get('target_dorm_id')
@@ -210,12 +244,8 @@ def submit_dorm_change():
         flash('宿舍调换申请已提交！', 'success')
         return redirect(url_for('student.my_dorm'))
     
-    # 获取可选的宿舍列表（同性别、未满员的宿舍）
-    available_dorms = Dormitory.query.filter(
-        Dormitory.gender == student.gender,
-        Dormitory.current_occupancy < Dormitory.capacity,
-        Dormitory.id != student.dorm_id
-    ).all()
+    # 获取可选的宿舍列表（同性别、未满员的宿舍），取自进程内的空床位索引
+    available_dorms = available_rooms(student.gender, exclude=student.dorm_id)
     
     return render_template('student/submit_dorm_change.html', student=student, available_dorms=available_dorms)
 
@@ -226,8 +256,10 @@ def my_dorm_change_requests():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
-    requests = DormChangeRequest.query.filter_by(student_id=student.id).order_by(DormChangeRequest.created_at.desc()).all()
+    student = current_student()
+    requests = DormChangeRequest.query.options(
+        joinedload(DormChangeRequest.current_dorm), joinedload(DormChangeRequest.target_dorm)
+    ).filter_by(student_id=student.id).order_by(DormChangeRequest.created_at.desc()).all()
     
     return render_template('student/my_dorm_change_requests.html', requests=requests)
 
@@ -238,10 +270,10 @@ def my_utility_bills():
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     
     # 获取学生宿舍的水电费账单
-    bills = UtilityBill.query.join(Dormitory, UtilityBill.dorm_id == Dormitory.id).join(Student, Dormitory.id == Student.dorm_id).filter(Student.id == student.id).all()
+    bills = UtilityBill.query.join(Dormitory, UtilityBill.dorm_id == Dormitory.id).join(Student, Dormitory.id == Student.dorm_id).options(contains_eager(UtilityBill.dormitory)).filter(Student.id == student.id).all()
     
     return render_template('student/my_utility_bills.html', bills=bills, student=student)
 
@@ -252,7 +284,7 @@ def pay_utility_bill(bill_id):
         flash('无权访问！', 'danger')
         return redirect(url_for('main.login'))
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     bill = UtilityBill.query.get_or_404(bill_id)
     
     # 检查账单是否属于该学生
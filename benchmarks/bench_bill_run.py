@@ -0,0 +1,44 @@
+# 批量出账基准：N 间宿舍整月抄表，先全部新建，再用新读数全部更新；
+# 然后出一学期（6个月）账单，配置阶梯价目表后整学期重算
+# 用法：python -m benchmarks.bench_bill_run [宿舍数]
+import io
+import random
+import sys
+
+from benchmarks.common import make_app, seed_dormitories, timer
+
+
+def make_csv(dorm_numbers, seed):
+    rnd = random.Random(seed)
+    lines = ['宿舍号,用电量,用水量']
+    lines += [f'{number},{rnd.uniform(50, 400):.1f},{rnd.uniform(2, 20):.1f}' for number in dorm_numbers]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def run(count):
+    app = make_app()
+    from app import db
+    from app.models.models import Dormitory
+    from app.services.bill_runs import run_bill_batch
+    from app.services.tariffs import create_tariff, reprice_bills
+
+    with app.app_context():
+        seed_dormitories(count)
+        numbers = [number for (number,) in db.session.query(Dormitory.dorm_number)]
+        for label, seed in (('新建', 1), ('更新', 2)):
+            with timer(f'{count} 间宿舍出账（{label}）'):
+                result = run_bill_batch(io.BytesIO(make_csv(numbers, seed)), '2025-06')
+            print(f'新建 {result.inserted}，更新 {result.updated}，错误 {len(result.errors)}')
+
+        for month in range(1, 6):
+            run_bill_batch(io.BytesIO(make_csv(numbers, month)), f'2025-{month:02d}')
+        create_tariff('阶梯电价', None, '2025-01', None,
+                      {'electricity': [(0, 0.6), (150, 0.8), (300, 1.2)], 'water': [(0, 2.5)]})
+        db.session.commit()
+        with timer(f'整学期重算 {count * 6} 张账单'):
+            result = reprice_bills('2025-01', '2025-06')
+        print(f'更新 {result.updated}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,91 @@
+# 冷启动基准：worker 从启动到能处理请求要多久
+# 1. 新解释器中导入 run（即 gunicorn 不预加载时每个 worker 做的事），对比原先导入时额外执行的工作
+#    （建表检查、查询默认管理员，以及启动时就导入 qrcode / Pillow、NumPy）；
+# 2. 用 gunicorn.conf.py 启动单个 worker（不预加载），计时到第一个请求返回。
+# 数据库已建好表并有管理员，与服务重启时的情况一致。
+# 用法：python -m benchmarks.bench_cold_start [重复次数]
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_app
+
+PORT = 18766
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CURRENT = 'import run'
+LEGACY = '''
+import run, qrcode, numpy
+from app import db
+from app.models.models import User
+with run.app.app_context():
+    db.create_all()
+    User.query.filter_by(username='123').first()
+'''
+
+
+def wall_time(args, env, cwd):
+    started = time.perf_counter()
+    subprocess.run(args, env=env, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def gunicorn_ready(env, cwd):
+    """启动 gunicorn，返回第一个请求成功返回所用的时间"""
+    env = dict(env, GUNICORN_PROFILE='sync', WEB_CONCURRENCY='1', GUNICORN_PRELOAD='0', PORT=str(PORT))
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'run:app'],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < 60:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=5)
+            try:
+                # 首页只做重定向，收到响应即说明 worker 已能处理请求
+                connection.request('GET', '/')
+                connection.getresponse().read()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+            finally:
+                connection.close()
+        raise RuntimeError('gunicorn 启动超时')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(label, times):
+    print(f'  {label}：中位数 {statistics.median(times) * 1000:.0f}ms，'
+          f'最快 {min(times) * 1000:.0f}ms，最慢 {max(times) * 1000:.0f}ms')
+
+
+def main(repeat=5):
+    fd, path = tempfile.mkstemp(prefix='dorm_cold_', suffix='.db')
+    os.close(fd)
+    database_url = 'sqlite:///' + path
+    app = make_app(database_url)
+    from app.services.bootstrap import create_admin
+    with app.app_context():
+        create_admin()
+
+    env = dict(os.environ, DATABASE_URL=database_url, SLOW_QUERY_MS='', PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as workdir:
+        # 预热文件系统缓存
+        wall_time([sys.executable, '-c', LEGACY], env, workdir)
+        print(f'--- 新解释器导入应用，{repeat} 次 ---')
+        report('原先（导入时建表、查管理员、导入 qrcode/NumPy）',
+               [wall_time([sys.executable, '-c', LEGACY], env, workdir) for _ in range(repeat)])
+        report('现在（import run）',
+               [wall_time([sys.executable, '-c', CURRENT], env, workdir) for _ in range(repeat)])
+        print(f'--- gunicorn 单 worker 启动到第一个请求返回，{repeat} 次 ---')
+        report('现在', [gunicorn_ready(env, workdir) for _ in range(repeat)])
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
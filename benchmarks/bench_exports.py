@@ -0,0 +1,68 @@
+# 导出内存基准：分别导出 N 和 10N 张水电费账单，比较流式导出的内存峰值；
+# 对照组为一次性 .all() 取回全部对象再写 CSV（即逐页抓取后拼接的做法）
+# 用法：python -m benchmarks.bench_exports [账单数]
+import csv
+import io
+import sys
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.common import make_app, seed_dormitories, timer
+
+
+def seed_bills(count):
+    from app import db
+    from app.models.models import Dormitory, UtilityBill
+    dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id)]
+    rows = []
+    for i in range(count):
+        month = f'{2000 + i // (len(dorm_ids) * 12)}-{i // len(dorm_ids) % 12 + 1:02d}'
+        rows.append({'dorm_id': dorm_ids[i % len(dorm_ids)], 'month': month,
+                     'electricity': 100.0, 'water': 5.0, 'electricity_cost': 100.0, 'water_cost': 10.0,
+                     'total_cost': 110.0, 'status': 'unpaid', 'due_date': datetime(2025, 1, 28)})
+    db.session.execute(UtilityBill.__table__.insert(), rows)
+    db.session.commit()
+
+
+def measure(label, produce):
+    """运行 produce() 并打印输出字节数与内存峰值"""
+    from app import db
+    db.session.expunge_all()
+    tracemalloc.start()
+    with timer(label):
+        size = produce()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'  输出 {size / 1024 / 1024:.1f} MB，内存峰值 {peak / 1024 / 1024:.1f} MB')
+
+
+def run(count):
+    app = make_app()
+    from app.services.exports import export_file, EXPORTS
+    from app.services.listing import utility_bill_query
+
+    def streamed(compress=False):
+        _filename, _mimetype, chunks = export_file('utility_bills', 'csv', {}, compress=compress)
+        return sum(len(chunk) for chunk in chunks)
+
+    def load_all():
+        columns = EXPORTS['utility_bills'][1]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for bill in utility_bill_query({}).all():
+            writer.writerow([getter(bill) for _header, getter in columns])
+        return len(buffer.getvalue().encode('utf-8'))
+
+    with app.app_context():
+        seed_dormitories(500)
+        total = 0
+        for target in (count, count * 10):
+            seed_bills(target - total)
+            total = target
+            measure(f'{total} 张账单 流式导出', streamed)
+            measure(f'{total} 张账单 流式导出（gzip）', lambda: streamed(compress=True))
+            measure(f'{total} 张账单 一次性取回', load_all)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,157 @@
+# 索引基准：在大数据量上先删掉模型声明的全部索引（相当于旧库），逐个列表页计时；
+# 再用 upgrade_indexes 补建索引后重新计时，对比每个页面的耗时
+# 用法：python -m benchmarks.bench_indexes [报修/访客记录数]
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import BUILDINGS, make_app, seed_dormitories, seed_students
+
+# 慢查询记录会对每条慢语句执行 EXPLAIN，计时时关闭
+os.environ['SLOW_QUERY_MS'] = ''
+
+DORMS = 2000
+STUDENTS = 8000
+MONTHS = 24
+REPEAT = 5
+
+# (角色, 页面, 查询参数)
+VIEWS = [
+    ('admin', '/admin/students', {'building': 'C栋'}),
+    ('admin', '/admin/repairs', {}),
+    ('admin', '/admin/repairs', {'status': 'pending'}),
+    ('admin', '/admin/repairs', {'building': 'C栋'}),
+    ('admin', '/admin/visitors', {}),
+    ('admin', '/admin/visitors', {'status': 'in'}),
+    ('admin', '/admin/utility_bills', {}),
+    ('admin', '/admin/utility_bills', {'month': '2024-06'}),
+    ('admin', '/admin/utility_bills', {'status': 'unpaid', 'building': 'C栋'}),
+    ('admin', '/admin/payments', {}),
+    ('admin', '/admin/payments', {'month': '2024-06'}),
+    ('dorm_manager', '/dorm_manager/students', {}),
+    ('dorm_manager', '/dorm_manager/repairs', {}),
+    ('dorm_manager', '/dorm_manager/visitors', {}),
+    ('dorm_manager', '/dorm_manager/dorm_change_requests', {}),
+    ('student', '/student/dashboard', {}),
+    ('student', '/student/my_repairs', {}),
+    ('student', '/student/my_visitors', {}),
+    ('student', '/student/my_utility_bills', {}),
+]
+
+
+def seed(records):
+    """宿舍、学生、报修、访客、账单、缴费与调换申请，返回各角色的用户ID"""
+    from app import db
+    from app.models.models import (User, Student, Dormitory, DormManager, Repair, Visitor,
+                                   UtilityBill, Payment, DormChangeRequest)
+    rnd = random.Random(7)
+    seed_dormitories(DORMS)
+    seed_students(STUDENTS)
+    dorms = db.session.query(Dormitory.id, Dormitory.dorm_number).order_by(Dormitory.id).all()
+    students = db.session.query(Student.id, Student.name, Student.user_id).order_by(Student.id).all()
+    db.session.execute(Student.__table__.update().where(Student.id == db.bindparam('b_id')).values(
+        dorm_id=db.bindparam('b_dorm_id')),
+        [{'b_id': student_id, 'b_dorm_id': dorms[i % len(dorms)][0]} for i, (student_id, _n, _u) in enumerate(students)])
+
+    base = datetime(2023, 1, 1)
+    repairs, visitors = [], []
+    for i in range(records):
+        student_id, name, _user_id = students[rnd.randrange(len(students))]
+        dorm_id, dorm_number = dorms[rnd.randrange(len(dorms))]
+        created = base + timedelta(minutes=rnd.randrange(60 * 24 * 700))
+        repairs.append({'dorm_id': dorm_id, 'student_id': student_id, 'title': f'报修{i}', 'content': '检查',
+                        'location_type': 'dorm', 'repair_type': 'other', 'location_detail': dorm_number,
+                        'contact_phone': '13800000000', 'status': rnd.choice(['pending', 'processing', 'completed',
+                                                                               'completed', 'completed']),
+                        'urgent_level': 'normal', 'created_at': created, 'updated_at': created,
+                        'is_deleted': rnd.random() < 0.05})
+        visitors.append({'name': f'访客{i}', 'id_card': '1', 'phone': '1', 'purpose': '探访',
+                         'dorm_number': dorm_number, 'student_name': name, 'student_id': student_id,
+                         'status': 'in' if rnd.random() < 0.02 else 'out', 'visit_date': created,
+                         'is_deleted': rnd.random() < 0.05})
+    db.session.execute(Repair.__table__.insert(), repairs)
+    db.session.execute(Visitor.__table__.insert(), visitors)
+
+    bills = [{'dorm_id': dorm_id, 'month': f'{2023 + m // 12}-{m % 12 + 1:02d}', 'electricity': 10, 'water': 2,
+              'electricity_cost': 10, 'water_cost': 4, 'total_cost': 14, 'due_date': base,
+              'status': 'paid' if m < MONTHS - 2 else 'unpaid'}
+             for m in range(MONTHS) for dorm_id, _number in dorms]
+    db.session.execute(UtilityBill.__table__.insert(), bills)
+    student_of_dorm = {}
+    for student_id, _name, _user_id in students:
+        student_of_dorm.setdefault(dorms[(student_id - students[0][0]) % len(dorms)][0], student_id)
+    db.session.execute(Payment.__table__.insert(), [
+        {'bill_id': bill_id, 'student_id': student_of_dorm[dorm_id], 'amount': 14, 'payment_method': 'wechat',
+         'payment_date': base + timedelta(minutes=rnd.randrange(60 * 24 * 700)), 'payment_status': 'completed'}
+        for bill_id, dorm_id in db.session.query(UtilityBill.id, UtilityBill.dorm_id).filter(UtilityBill.status == 'paid')])
+    db.session.execute(DormChangeRequest.__table__.insert(), [
+        {'student_id': student_id, 'current_dorm_id': dorms[i % len(dorms)][0],
+         'target_dorm_id': dorms[(i + 1) % len(dorms)][0], 'reason': '调换', 'status': 'pending',
+         'created_at': base + timedelta(minutes=i)}
+        for i, (student_id, _name, _user_id) in enumerate(students)])
+
+    admin = User(username='admin', password='x', role='admin')
+    manager = User(username='manager', password='x', role='dorm_manager')
+    db.session.add_all([admin, manager])
+    db.session.flush()
+    db.session.add(DormManager(user_id=manager.id, name='宿管', phone='1', responsible_building=BUILDINGS[2]))
+    db.session.commit()
+    return {'admin': admin.id, 'dorm_manager': manager.id, 'student': students[-1][2]}
+
+
+def time_views(app, users):
+    """每个页面请求 REPEAT 次，返回耗时中位数（毫秒）"""
+    clients = {}
+    for role, user_id in users.items():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        clients[role] = client
+    result = []
+    for role, path, args in VIEWS:
+        samples = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            response = clients[role].get(path, query_string=args)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, f'{path} 返回 {response.status_code}'
+        result.append(statistics.median(samples))
+    return result
+
+
+def run(records):
+    from flask_login import LoginManager
+    from app import db
+    from app.models.models import User
+    from app.services.index_migration import declared_indexes, upgrade_indexes
+
+    app = make_app()
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    with app.app_context():
+        users = seed(records)
+        # 模拟旧库：删除模型声明的全部索引
+        with db.engine.begin() as connection:
+            for index in declared_indexes():
+                index.drop(connection)
+            connection.exec_driver_sql('ANALYZE')
+
+    before = time_views(app, users)
+    with app.app_context():
+        start = time.perf_counter()
+        result = upgrade_indexes()
+        print(f'补建 {len(result.created)} 个索引: {time.perf_counter() - start:.2f}s')
+    after = time_views(app, users)
+
+    print(f'{"页面":<56}{"无索引(ms)":>12}{"有索引(ms)":>12}{"加速":>8}')
+    for (role, path, args), old, new in zip(VIEWS, before, after):
+        label = path + ('?' + '&'.join(f'{k}={v}' for k, v in args.items()) if args else '')
+        print(f'{label:<56}{old:>12.1f}{new:>12.1f}{old / new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,62 @@
+# 指标采集开销：同一列表页在开启/关闭 METRICS_ENABLED 的两个应用上交替请求，比较耗时中位数
+# 用法：python -m benchmarks.bench_metrics_overhead [轮数]
+# 注：SQL计时监听器挂在全局 Engine 上，关闭指标的应用也会执行它；两个应用本身的耗时差异约 ±150µs，
+# 结果需多跑几次看趋势
+import statistics
+import sys
+import time
+
+from benchmarks.common import make_app, seed_dormitories, seed_students
+
+BATCH = 50
+
+
+def build(enabled):
+    """创建应用并返回已登录管理员的测试客户端"""
+    from config.config import Config
+    Config.METRICS_ENABLED = enabled
+    app = make_app()
+    from flask_login import LoginManager
+    from app import db
+    from app.models.models import User
+
+    with app.app_context():
+        seed_dormitories(100)
+        seed_students(200)
+        admin = User(username='admin', password='x', role='admin')
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    client.get('/admin/students')  # 预热模板缓存
+    return client
+
+
+def batch(client):
+    start = time.perf_counter()
+    for _ in range(BATCH):
+        client.get('/admin/students')
+    return (time.perf_counter() - start) / BATCH
+
+
+def main(rounds=20):
+    off, on = build(False), build(True)
+    timings = {'off': [], 'on': []}
+    for _ in range(rounds):
+        timings['off'].append(batch(off))
+        timings['on'].append(batch(on))
+    off_median = statistics.median(timings['off'])
+    on_median = statistics.median(timings['on'])
+    print(f'关闭指标: {off_median * 1000:.2f}ms/请求')
+    print(f'开启指标: {on_median * 1000:.2f}ms/请求'
+          f'（开销 {(on_median - off_median) * 1e6:+.0f}µs，{(on_median / off_median - 1) * 100:+.1f}%）')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,51 @@
+# 入住人数对账基准：N 间宿舍住满学生后，随机制造人数偏差（改动记录人数、软删除学生），
+# 计时只核对与核对并修正，修正后再核对一次应无不符
+# 用法：python -m benchmarks.bench_reconcile [宿舍数]
+import random
+import sys
+
+from benchmarks.common import make_app, seed_dormitories, seed_students, timer
+
+
+def run(count):
+    app = make_app()
+    from app import db
+    from app.models.models import Student, Dormitory
+    from app.services.occupancy import reconcile_occupancy
+
+    rnd = random.Random(5)
+    with app.app_context():
+        seed_dormitories(count)
+        seed_students(count * 4)
+        dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id).order_by(Dormitory.id)]
+        student_ids = [student_id for (student_id,) in db.session.query(Student.id).order_by(Student.id)]
+        students = Student.__table__
+        dorms = Dormitory.__table__
+        db.session.execute(
+            students.update().where(students.c.id == db.bindparam('b_id')).values(dorm_id=db.bindparam('b_dorm_id')),
+            [{'b_id': student_id, 'b_dorm_id': dorm_ids[i // 4]} for i, student_id in enumerate(student_ids)])
+        db.session.execute(dorms.update().values(current_occupancy=4))
+        # 约 10% 的宿舍记录人数偏差，约 2% 的学生被软删除
+        db.session.execute(
+            dorms.update().where(dorms.c.id == db.bindparam('b_id')).values(current_occupancy=db.bindparam('b_occ')),
+            [{'b_id': dorm_id, 'b_occ': rnd.randint(0, 4)} for dorm_id in rnd.sample(dorm_ids, count // 10)])
+        db.session.execute(
+            students.update().where(students.c.id == db.bindparam('b_id')).values(is_deleted=True),
+            [{'b_id': student_id} for student_id in rnd.sample(student_ids, len(student_ids) // 50)])
+        db.session.commit()
+
+        with timer(f'{count} 间宿舍 只核对'):
+            result = reconcile_occupancy(apply=False)
+        print(f'  不符 {len(result.mismatches)} 间，累计偏差 {result.drift} 人')
+        with timer(f'{count} 间宿舍 核对并修正'):
+            result = reconcile_occupancy()
+        print(f'  修正 {result.fixed} 间，跳过 {result.skipped} 间')
+        with timer(f'{count} 间宿舍 修正后再核对'):
+            result = reconcile_occupancy(apply=False)
+        print(f'  不符 {len(result.mismatches)} 间')
+        if result.mismatches:
+            sys.exit('修正后仍有不符的宿舍')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 12000)
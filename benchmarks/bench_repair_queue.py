@@ -0,0 +1,127 @@
+# 报修派单队列基准
+# 1. 队列前 50 条：按紧急程度分别走索引取最早的报修再合并，对比读出全部待处理报修在内存中算分排序，
+#    以及在 SQL 中按算出的分数 ORDER BY（无法使用索引）；三者结果必须一致
+# 2. 并发领取：多个线程同时反复“领取下一条”直到队列为空，每条报修只能被领取一次，且不遗漏
+# 用法：python -m benchmarks.bench_repair_queue [报修数] [领取线程数]
+import os
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, seed_dormitories, seed_students, timer
+from benchmarks.stress_occupancy import run_threads
+
+os.environ['SLOW_QUERY_MS'] = ''
+
+LIMIT = 50
+CLAIM_REPAIRS = 300
+LEVELS = ('normal', 'normal', 'normal', 'urgent', 'very_urgent')
+
+
+def seed_repairs(count, now, pending_share=0.3, seed=7):
+    from app import db
+    from app.models.models import Repair, Student
+    rnd = random.Random(seed)
+    students = [row for row in db.session.query(Student.id, Student.dorm_id)]
+    rows = []
+    for i in range(count):
+        student_id, dorm_id = rnd.choice(students)
+        rows.append({'dorm_id': dorm_id, 'student_id': student_id, 'title': f'报修{i}', 'content': '检查',
+                     'location_type': 'dorm', 'repair_type': 'other', 'location_detail': '-',
+                     'contact_phone': '13800000000', 'urgent_level': rnd.choice(LEVELS),
+                     'status': 'pending' if rnd.random() < pending_share else 'completed',
+                     'created_at': now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30)), 'is_deleted': False})
+    db.session.execute(Repair.__table__.insert(), rows)
+    db.session.commit()
+
+
+def prepare(app, repairs, now):
+    from app import db
+    from app.models.models import Student, Dormitory
+    with app.app_context():
+        seed_dormitories(200)
+        seed_students(400)
+        dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id)]
+        for i, (student_id,) in enumerate(db.session.query(Student.id).order_by(Student.id)):
+            db.session.execute(Student.__table__.update().where(Student.id == student_id)
+                               .values(dorm_id=dorm_ids[i % len(dorm_ids)]))
+        seed_repairs(repairs, now)
+
+
+def bench_queue(app, now):
+    from sqlalchemy import case, func, select
+    from app import db
+    from app.models.models import Repair
+    from app.services.repair_dispatch import URGENCY_HOURS, _ranked_ids, priority_score
+
+    with app.app_context():
+        with timer(f'索引合并取前 {LIMIT} 条'):
+            indexed = [repair_id for _score, repair_id in _ranked_ids(LIMIT, now=now)]
+        with timer('读出全部待处理报修后在内存中排序'):
+            rows = db.session.execute(select(Repair.id, Repair.urgent_level, Repair.created_at).where(
+                Repair.status == 'pending', Repair.is_deleted == False)).all()
+            in_memory = [row.id for row in sorted(
+                rows, key=lambda row: (-priority_score(row.urgent_level, row.created_at, now), row.created_at, row.id)
+            )[:LIMIT]]
+        with timer('SQL 中按分数 ORDER BY'):
+            weight = case(*[(Repair.urgent_level == level, hours) for level, hours in URGENCY_HOURS.items()], else_=0)
+            # 分数 = 权重 + (now - created_at) 小时；now 相同，按 created_at 小时数 - 权重 升序即可
+            key = func.julianday(Repair.created_at) * 24 - weight
+            in_sql = list(db.session.scalars(select(Repair.id).where(
+                Repair.status == 'pending', Repair.is_deleted == False
+            ).order_by(key, Repair.created_at, Repair.id).limit(LIMIT)))
+        print(f'待处理 {len(rows)} 条；三种结果一致：{indexed == in_memory == in_sql}')
+
+
+def stress_claims(app, threads):
+    from sqlalchemy import update
+    from app import db
+    from app.models.models import Repair, RepairClaim, User
+    from app.services.repair_dispatch import claim_next
+
+    with app.app_context():
+        # 只留 CLAIM_REPAIRS 条待处理
+        pending = [repair_id for (repair_id,) in db.session.query(Repair.id).filter(
+            Repair.status == 'pending').order_by(Repair.id)]
+        db.session.execute(update(Repair).where(Repair.id.in_(pending[CLAIM_REPAIRS:])).values(status='completed'))
+        users = [User(username=f'T{i:04d}', password='x', role='dorm_manager') for i in range(threads)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        expected = min(len(pending), CLAIM_REPAIRS)
+
+    def work(index):
+        claimed = []
+        with app.app_context():
+            while True:
+                repair = claim_next(user_ids[index])
+                if repair is None:
+                    db.session.rollback()
+                    return claimed
+                claimed.append(repair.id)
+                db.session.commit()
+
+    with timer(f'{threads} 个线程并发领取 {expected} 条报修'):
+        results = run_threads(threads, work)
+    counts = Counter(repair_id for claimed in results for repair_id in claimed)
+    with app.app_context():
+        claims = dict(db.session.query(RepairClaim.repair_id, RepairClaim.claimed_by))
+        processing = db.session.query(Repair).filter(Repair.status == 'processing').count()
+    duplicated = [repair_id for repair_id, count in counts.items() if count > 1]
+    print(f'各线程领取数：{[len(claimed) for claimed in results]}')
+    print(f'领取 {sum(counts.values())} 次，重复领取 {len(duplicated)} 条，领取记录 {len(claims)} 条，'
+          f'处理中 {processing} 条，期望 {expected} 条')
+    ok = not duplicated and len(counts) == len(claims) == processing == expected
+    print('通过' if ok else '失败')
+    return ok
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    repairs, threads = (args + [100000, 8][len(args):])[:2]
+    now = datetime.utcnow()
+    app = make_app()
+    prepare(app, repairs, now)
+    bench_queue(app, now)
+    sys.exit(0 if stress_claims(app, threads) else 1)
@@ -0,0 +1,163 @@
+# 报修全文搜索基准
+# 生成大量报修后重建全文索引，比较几种搜索方式取第一页（及按相关度翻到第 10 页）的耗时：
+# - FTS5 按 bm25 相关度排序（列表页默认方式）
+# - FTS5 匹配后按最早在前排序（选择其他排序时）
+# - 原有方式 LIKE '%词%' 扫描标题/内容/位置三列
+# 搜索词覆盖少见（几十条）、中等（约 1%）和常见（约 8%）三种匹配规模，以及楼栋 + 状态筛选。
+# 用法：python -m benchmarks.bench_repair_search [报修数]
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import BUILDINGS, make_app, seed_dormitories, seed_students, timer
+
+os.environ['SLOW_QUERY_MS'] = ''
+
+ITEMS = ['空调', '水龙头', '台灯', '顶灯', '门锁', '窗户', '插座', '热水器', '马桶', '网络',
+         '床板', '衣柜', '风扇', '洗衣机', '饮水机', '淋浴', '下水道', '阳台门']
+FAULTS = ['漏水', '不亮', '坏了', '不制冷', '关不紧', '堵塞', '松动', '有异响', '无法使用', '跳闸',
+          '打不开', '没反应']
+EXTRAS = ['麻烦尽快处理', '已经好几天了', '影响休息', '白天都有人在', '晚上九点后方便', '请提前电话联系']
+BATCH = 20000
+PAGES = 10
+SEARCHES = [
+    ('少见', '阳台门没反应 晚上九点'),
+    ('中等', '空调漏水'),
+    ('常见', '空调'),
+    ('单字', '锁'),
+]
+
+
+def seed_repairs(count, seed=11):
+    from app import db
+    from app.models.models import Repair, Student
+    rnd = random.Random(seed)
+    students = [row for row in db.session.query(Student.id, Student.dorm_id)]
+    start = datetime(2023, 9, 1)
+    for offset in range(0, count, BATCH):
+        rows = []
+        for _i in range(min(BATCH, count - offset)):
+            student_id, dorm_id = rnd.choice(students)
+            item, fault = rnd.choice(ITEMS), rnd.choice(FAULTS)
+            room = f'{rnd.choice(BUILDINGS)}{rnd.randint(1, 6)}{rnd.randint(1, 30):02d}'
+            rows.append({'dorm_id': dorm_id, 'student_id': student_id, 'title': f'{item}{fault}',
+                         'content': f'{room}宿舍的{item}{fault}，{rnd.choice(EXTRAS)}',
+                         'location_type': 'dorm', 'repair_type': 'other', 'location_detail': f'{room}室',
+                         'contact_phone': '13800000000', 'urgent_level': 'normal',
+                         'status': rnd.choice(('pending', 'processing', 'completed', 'completed')),
+                         'created_at': start + timedelta(seconds=rnd.randint(0, 86400 * 730)),
+                         'is_deleted': False})
+        db.session.execute(Repair.__table__.insert(), rows)
+    db.session.commit()
+
+
+def prepare(app, repairs):
+    from app import db
+    from app.models.models import Dormitory, Student
+    from app.services.repair_search import rebuild_index
+    with app.app_context():
+        seed_dormitories(400)
+        seed_students(1600)
+        dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id)]
+        for i, (student_id,) in enumerate(db.session.query(Student.id).order_by(Student.id)):
+            db.session.execute(Student.__table__.update().where(Student.id == student_id)
+                               .values(dorm_id=dorm_ids[i % len(dorm_ids)]))
+        with timer(f'写入 {repairs} 条报修'):
+            seed_repairs(repairs)
+        with timer('重建全文索引'):
+            rebuild_index()
+            db.session.commit()
+
+
+def _timed(fn, repeat=5):
+    """取多次执行的最短耗时（毫秒）和结果"""
+    best, result = None, None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _page(app, query_string):
+    from app.services.listing import repair_page
+    with app.test_request_context(f'/admin/repairs?{query_string}'):
+        from flask import request
+        return repair_page(request.args)
+
+
+def _like_page(app, search, extra=None):
+    # 改造前的搜索方式：LIKE '%词%'，最新在前
+    from sqlalchemy import and_, or_
+    from app.models.models import Repair
+    from app.services.listing import eager_options
+    with app.app_context():
+        query = Repair.query.options(*eager_options('repairs')).filter(Repair.is_deleted == False, and_(*[
+            or_(Repair.title.contains(term), Repair.content.contains(term), Repair.location_detail.contains(term))
+            for term in search.split()]))
+        if extra:
+            query = query.filter(*extra)
+        return query.order_by(Repair.created_at.desc(), Repair.id.desc()).limit(50).all()
+
+
+def _deep_page(app, query_string, pages):
+    """按翻页链接连续翻 pages 页，返回最后一页"""
+    from urllib.parse import urlsplit
+    page = _page(app, query_string)
+    for _i in range(pages - 1):
+        if not page.next_url:
+            break
+        page = _page(app, urlsplit(page.next_url).query)
+    return page
+
+
+def bench(app):
+    from urllib.parse import urlencode
+    from sqlalchemy import func, literal_column, or_, select
+    from app import db
+    from app.models.models import Dormitory, Repair
+    from app.services.listing import repair_query
+    from app.services.repair_search import FTS, FTS_TABLE, INDEXED_FIELDS, match_expression
+
+    building = BUILDINGS[0]
+    with app.app_context():
+        dorm_ids = select(Dormitory.id).where(Dormitory.building == building)
+    print(f'{"搜索词":<18}{"匹配数":>8}{"相关度":>10}{"第10页":>10}{"最早在前":>10}{"LIKE":>10}'
+          f'{"相关度+楼栋状态":>16}{"LIKE+楼栋状态":>14}')
+    ok = True
+    for label, search in SEARCHES:
+        with app.app_context():
+            matches = db.session.execute(select(func.count()).select_from(FTS).where(
+                literal_column(FTS_TABLE).op('MATCH')(match_expression(search)))).scalar()
+        ranked_ms, ranked = _timed(lambda: _page(app, urlencode({'text': search})))
+        deep_ms, _deep = _timed(lambda: _deep_page(app, urlencode({'text': search}), PAGES), repeat=1)
+        oldest_ms, oldest = _timed(lambda: _page(app, urlencode({'text': search, 'sort': 'oldest'})))
+        like_ms, like = _timed(lambda: _like_page(app, search))
+        filters = {'text': search, 'building': building, 'status': 'pending'}
+        filtered_ms, filtered = _timed(lambda: _page(app, urlencode(filters)))
+        like_filtered_ms, like_filtered = _timed(lambda: _like_page(
+            app, search, [Repair.dorm_id.in_(dorm_ids), Repair.status == 'pending']))
+        # 全文索引与 LIKE 匹配到的报修须完全一致（楼栋 + 状态筛选后比较全部ID）
+        with app.app_context():
+            fts_ids = {repair_id for (repair_id,) in repair_query(filters).with_entities(Repair.id)}
+            like_ids = {repair_id for (repair_id,) in db.session.query(Repair.id).filter(
+                Repair.is_deleted == False, Repair.dorm_id.in_(dorm_ids), Repair.status == 'pending',
+                *[or_(*[getattr(Repair, field).contains(term) for field in INDEXED_FIELDS])
+                  for term in search.split()])}
+        same = fts_ids == like_ids and len(ranked) == len(oldest) == len(like) and len(filtered) == len(like_filtered)
+        ok = ok and same
+        print(f'{label + "：" + search:<18}{matches:>8}{ranked_ms:>9.1f}ms{deep_ms / PAGES:>8.1f}ms'
+              f'{oldest_ms:>8.1f}ms{like_ms:>8.1f}ms{filtered_ms:>14.1f}ms{like_filtered_ms:>12.1f}ms'
+              f'{"" if same else "  结果不一致"}')
+    print('通过' if ok else '失败')
+    return ok
+
+
+if __name__ == '__main__':
+    repairs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    app = make_app()
+    prepare(app, repairs)
+    sys.exit(0 if bench(app) else 1)
@@ -0,0 +1,106 @@
+# SQLite 连接配置基准：多个进程（相当于多个 gunicorn worker）同时读写同一个数据库文件，
+# 对比 default 与 production（WAL、synchronous=NORMAL、busy_timeout 等）两种 DATABASE_PROFILE
+# 写进程反复入住/退宿并逐次提交，读进程反复查询未住满的宿舍；统计吞吐、最慢一次操作和 database is locked 错误数
+# 用法：python -m benchmarks.bench_sqlite_profile [写进程数] [读进程数] [每种配置秒数]
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_app, seed_dormitories
+
+os.environ['SLOW_QUERY_MS'] = ''
+
+DORMS = 5000
+
+
+def _create_app(database_url, profile):
+    from config.config import Config
+    Config.DATABASE_PROFILE = profile
+    return make_app(database_url)
+
+
+def worker(kind, database_url, profile, ready, start, duration, index, results):
+    from sqlalchemy.exc import OperationalError
+    from app import db
+    from app.models.models import Dormitory
+    from app.services.occupancy import check_in, check_out
+
+    app = _create_app(database_url, profile)
+    rnd = random.Random(index)
+    ops = locked = 0
+    slowest = 0.0
+    with app.app_context():
+        dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id)]
+        db.session.rollback()
+        ready.put(index)
+        start.wait()
+        end = time.time() + duration
+        while time.time() < end:
+            started = time.perf_counter()
+            try:
+                if kind == 'write':
+                    dorm_id = rnd.choice(dorm_ids)
+                    if rnd.random() < 0.5:
+                        check_in(dorm_id)
+                    else:
+                        check_out(dorm_id)
+                    db.session.commit()
+                else:
+                    Dormitory.query.filter(Dormitory.gender == '男',
+                                           Dormitory.current_occupancy < Dormitory.capacity).all()
+                    db.session.rollback()
+                ops += 1
+            except OperationalError as exc:
+                db.session.rollback()
+                if 'locked' not in str(exc):
+                    raise
+                locked += 1
+            slowest = max(slowest, time.perf_counter() - started)
+    results.put((kind, ops, locked, slowest))
+
+
+def run(profile, writers, readers, duration):
+    fd, path = tempfile.mkstemp(prefix='dorm_profile_', suffix='.db')
+    os.close(fd)
+    database_url = 'sqlite:///' + path
+    app = _create_app(database_url, profile)
+    from app import db
+    with app.app_context():
+        seed_dormitories(DORMS, capacity=1000)
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    ready, start, results = context.Queue(), context.Event(), context.Queue()
+    kinds = ['write'] * writers + ['read'] * readers
+    processes = [context.Process(target=worker, args=(kind, database_url, profile, ready, start, duration, i, results))
+                 for i, kind in enumerate(kinds)]
+    for process in processes:
+        process.start()
+    # 各进程创建好应用后同时开始
+    for _ in processes:
+        ready.get()
+    start.set()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    os.remove(path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    print(f'--- {profile}：{writers} 个写进程、{readers} 个读进程，{duration}s ---')
+    for kind, label in (('write', '写（入住/退宿并提交）'), ('read', '读（查询未住满宿舍）')):
+        ops = sum(row[1] for row in rows if row[0] == kind)
+        locked = sum(row[2] for row in rows if row[0] == kind)
+        slowest = max((row[3] for row in rows if row[0] == kind), default=0)
+        print(f'  {label}：{ops / duration:.0f} 次/秒，最慢 {slowest * 1000:.0f}ms，database is locked {locked} 次')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    writers, readers, duration = (args + [4, 4, 5][len(args):])[:3]
+    for profile in ('default', 'production'):
+        run(profile, writers, readers, duration)
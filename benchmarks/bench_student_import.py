@@ -0,0 +1,46 @@
+# 学生批量导入基准：生成 N 行CSV（部分行带宿舍号、少量错误行）并导入
+# 用法：python -m benchmarks.bench_student_import [行数] [带初始密码的行数]
+import io
+import os
+import random
+import sys
+
+from benchmarks.common import make_app, seed_dormitories, timer, MAJORS, GRADES, GENDERS, BUILDINGS
+
+
+def make_csv(count, with_password=0, seed=42):
+    """含约1%错误行（性别非法、重复学号），约一半学生指定宿舍"""
+    rnd = random.Random(seed)
+    lines = ['学号,姓名,性别,专业,年级,电话,宿舍号,初始密码']
+    for i in range(count):
+        gender = rnd.choice(GENDERS)
+        student_id = f'2025{i:06d}'
+        if i % 200 == 1:
+            student_id = f'2025{i - 1:06d}'  # 重复学号
+        if i % 200 == 2:
+            gender = '未知'
+        dorm = ''
+        if i % 2 == 0:
+            index = rnd.randrange(count // 4) * 2 + (0 if gender == '男' else 1)
+            dorm = f'{BUILDINGS[index % len(BUILDINGS)]}-{index:06d}'
+        password = f'pw{i}' if i < with_password else ''
+        lines.append(f'{student_id},学生{i},{gender},{rnd.choice(MAJORS)},{rnd.choice(GRADES)},'
+                     f'138{i:08d},{dorm},{password}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def run(count, with_password):
+    app = make_app()
+    from app.services.student_import import read_rows, import_students
+
+    data = make_csv(count, with_password)
+    with app.app_context():
+        seed_dormitories(count // 2)
+        with timer(f'导入 {count} 行（{with_password} 行带初始密码）'):
+            result = import_students(read_rows(io.BytesIO(data), 'students.csv'), workers=os.cpu_count())
+        print(f'成功 {result.imported} 人，失败 {len(result.errors)} 行')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(args[0] if args else 20000, args[1] if len(args) > 1 else 0)
@@ -0,0 +1,88 @@
+# 空床位索引基准：大部分宿舍已住满时，对比每次查询同性别未满宿舍（原做法）与查空床位索引的耗时，
+# 再模拟读写混合（每 10 次查询有一次入住并提交）；最后由另一个数据库连接修改人数并更新版本号
+# （相当于另一个 worker），检查索引能及时重新加载、结果与直接查询一致
+# 用法：python -m benchmarks.bench_vacancy [宿舍数]
+import os
+import random
+import sys
+
+from benchmarks.common import BUILDINGS, make_app, seed_dormitories, timer
+
+os.environ['SLOW_QUERY_MS'] = ''
+
+LOOKUPS = 500
+
+
+def query_available(gender, exclude=None):
+    from app.models.models import Dormitory
+    return [dorm.id for dorm in Dormitory.query.filter(
+        Dormitory.gender == gender,
+        Dormitory.current_occupancy < Dormitory.capacity,
+        Dormitory.id != exclude
+    ).order_by(Dormitory.id)]
+
+
+def run(count):
+    app = make_app()
+    from app import db
+    from app.models.models import Dormitory, CacheVersion
+    from app.services.occupancy import check_in
+    from app.services.vacancy import available_rooms
+
+    rnd = random.Random(7)
+    with app.app_context():
+        seed_dormitories(count)
+        dorms = Dormitory.__table__
+        # 约 95% 的宿舍住满
+        db.session.execute(dorms.update().values(current_occupancy=dorms.c.capacity))
+        dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id)]
+        db.session.execute(
+            dorms.update().where(dorms.c.id == db.bindparam('b_id')).values(current_occupancy=db.bindparam('b_occ')),
+            [{'b_id': dorm_id, 'b_occ': rnd.randint(0, 3)} for dorm_id in rnd.sample(dorm_ids, count // 20)])
+        db.session.commit()
+        genders = [('男', '女')[i % 2] for i in range(LOOKUPS)]
+
+        with timer(f'{LOOKUPS} 次查询 每次扫描宿舍表'):
+            for gender in genders:
+                query_available(gender)
+                db.session.rollback()
+        with timer(f'{LOOKUPS} 次查询 空床位索引'):
+            for gender in genders:
+                available_rooms(gender)
+                db.session.rollback()
+        with timer(f'{LOOKUPS} 次查询 空床位索引，每 10 次有一次入住'):
+            for i, gender in enumerate(genders):
+                if i % 10 == 0:
+                    rooms = available_rooms(gender)
+                    check_in(rnd.choice(rooms).id)
+                    db.session.commit()
+                available_rooms(gender)
+                db.session.rollback()
+
+        building = BUILDINGS[0]
+        mismatched = [gender for gender in ('男', '女')
+                      if [room.id for room in available_rooms(gender)] != query_available(gender)]
+        by_building = [room.building for room in available_rooms('男', building)]
+        db.session.rollback()
+
+        # 另一个连接直接住满一间宿舍并更新版本号，不经过本进程的会话
+        target = available_rooms('女')[0]
+        db.session.rollback()
+        versions = CacheVersion.__table__
+        with db.engine.begin() as connection:
+            connection.execute(dorms.update().where(dorms.c.id == target.id)
+                               .values(current_occupancy=dorms.c.capacity))
+            connection.execute(versions.update().where(versions.c.name == 'vacancy')
+                               .values(version=versions.c.version + 1))
+        stale = target.id in [room.id for room in available_rooms('女')]
+        db.session.rollback()
+
+    print(f'  索引与直接查询不一致的性别：{mismatched or "无"}')
+    print(f'  {building} 男生宿舍 {len(by_building)} 间有空床位')
+    print(f'  其他连接住满宿舍后索引{"仍列出该宿舍" if stale else "已重新加载"}')
+    if mismatched or set(by_building) - {building} or stale:
+        sys.exit('空床位索引结果不正确')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
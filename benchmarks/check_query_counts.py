@@ -0,0 +1,135 @@
+# 列表页SQL语句数检查：少量数据与大量数据下每个列表页执行的语句数必须相同
+# （语句数随行数增长说明模板里有逐行懒加载，即 N+1 查询）
+# 用法：python -m benchmarks.check_query_counts [少量行数 大量行数]
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, seed_dormitories, seed_students
+
+# (角色, 列表页)；每页取 200 行，使大量数据时整页都是数据
+VIEWS = [
+    ('admin', '/admin/students'),
+    ('admin', '/admin/dorm_managers'),
+    ('admin', '/admin/dormitories'),
+    ('admin', '/admin/utility_bills'),
+    ('admin', '/admin/payments'),
+    ('admin', '/admin/repairs'),
+    ('admin', '/admin/visitors'),
+    ('dorm_manager', '/dorm_manager/students'),
+    ('dorm_manager', '/dorm_manager/dormitories'),
+    ('dorm_manager', '/dorm_manager/repairs'),
+    ('dorm_manager', '/dorm_manager/visitors'),
+    ('dorm_manager', '/dorm_manager/dorm_change_requests'),
+    ('student', '/student/my_repairs'),
+    ('student', '/student/my_dorm_change_requests'),
+    ('student', '/student/my_utility_bills'),
+]
+PER_PAGE = 200
+
+
+def seed_rows(count):
+    """每个学生住不同宿舍，各类记录每行关联不同的学生/宿舍，返回各角色的用户ID"""
+    from app import db
+    from app.models.models import (User, Student, Dormitory, DormManager, Repair, Visitor,
+                                   UtilityBill, Payment, DormChangeRequest)
+    seed_dormitories(count)
+    seed_students(count)
+    dorms = db.session.query(Dormitory.id, Dormitory.dorm_number).order_by(Dormitory.id).all()
+    students = db.session.query(Student.id, Student.name, Student.user_id).order_by(Student.id).all()
+    for (student_id, _name, _user_id), (dorm_id, _number) in zip(students, dorms):
+        db.session.execute(Student.__table__.update().where(Student.id == student_id).values(dorm_id=dorm_id))
+
+    base = datetime(2024, 1, 1)
+    repairs, visitors, bills, requests = [], [], [], []
+    for i, ((student_id, name, _user_id), (dorm_id, dorm_number)) in enumerate(zip(students, dorms)):
+        repairs.append({'dorm_id': dorm_id, 'student_id': student_id, 'title': f'报修{i}', 'content': '检查',
+                        'location_type': 'dorm', 'repair_type': 'other', 'location_detail': dorm_number,
+                        'contact_phone': '13800000000', 'status': 'pending', 'urgent_level': 'normal',
+                        'created_at': base + timedelta(minutes=i), 'is_deleted': False})
+        visitors.append({'name': f'访客{i}', 'id_card': '1', 'phone': '1', 'purpose': '探访',
+                         'dorm_number': dorm_number, 'student_name': name, 'student_id': student_id,
+                         'status': 'in', 'visit_date': base + timedelta(minutes=i), 'is_deleted': False})
+        bills.append({'dorm_id': dorm_id, 'month': '2024-01', 'electricity': 10, 'water': 2,
+                      'electricity_cost': 10, 'water_cost': 4, 'total_cost': 14,
+                      'due_date': base + timedelta(days=30), 'status': 'unpaid'})
+        # 每个学生一条申请，另外第一个学生对每个宿舍各有一条申请（学生端列表）
+        target_id = dorms[(i + 1) % len(dorms)][0]
+        for applicant in {student_id, students[0][0]}:
+            requests.append({'student_id': applicant, 'current_dorm_id': dorm_id, 'target_dorm_id': target_id,
+                             'reason': '调换', 'status': 'pending', 'created_at': base + timedelta(minutes=i)})
+    first_dorm = dorms[0][0]
+    for i in range(1, count):
+        # 第一个学生宿舍的历月账单（学生端列表）
+        bills.append({'dorm_id': first_dorm, 'month': f'{2000 + i // 12:04d}-{i % 12 + 1:02d}',
+                      'electricity': 10, 'water': 2, 'electricity_cost': 10, 'water_cost': 4,
+                      'total_cost': 14, 'due_date': base, 'status': 'unpaid'})
+    db.session.execute(Repair.__table__.insert(), repairs)
+    db.session.execute(Visitor.__table__.insert(), visitors)
+    db.session.execute(UtilityBill.__table__.insert(), bills)
+    db.session.execute(DormChangeRequest.__table__.insert(), requests)
+
+    student_of_dorm = {dorm_id: student_id for (student_id, _n, _u), (dorm_id, _d) in zip(students, dorms)}
+    payments = [{'bill_id': bill_id, 'student_id': student_of_dorm[dorm_id], 'amount': 14,
+                 'payment_method': 'wechat', 'payment_date': base, 'payment_status': 'success'}
+                for bill_id, dorm_id in db.session.query(UtilityBill.id, UtilityBill.dorm_id)]
+    db.session.execute(Payment.__table__.insert(), payments)
+
+    admin = User(username='admin', password='x', role='admin')
+    db.session.add(admin)
+    db.session.flush()
+    for i in range(count):
+        user = User(username=f'M{i:08d}', password='x', role='dorm_manager')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(DormManager(user_id=user.id, name=f'宿管{i}', phone='1', responsible_building='A栋'))
+    db.session.commit()
+    return {'admin': admin.id, 'dorm_manager': user.id, 'student': students[0][2]}
+
+
+def measure(count):
+    """返回 {列表页: SQL语句数}"""
+    from flask_login import LoginManager
+    from app.services import identity
+    from app.services.query_budget import statement_count
+
+    app = make_app()
+    app.config['TESTING'] = True
+    login_manager = LoginManager(app)
+    login_manager.user_loader(identity.load_user)
+    counts = []
+
+    @app.after_request
+    def record(response):
+        counts.append(statement_count())
+        return response
+
+    with app.app_context():
+        users = seed_rows(count)
+
+    result = {}
+    for role, path in VIEWS:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(users[role])
+            session['_fresh'] = True
+        response = client.get(path, query_string={'per_page': PER_PAGE})
+        assert response.status_code == 200, f'{path} 返回 {response.status_code}'
+        result[path] = counts[-1]
+    return result
+
+
+def main(small=5, large=PER_PAGE):
+    few, many = measure(small), measure(large)
+    failed = False
+    print(f'{"列表页":<40}{small:>8}{large:>8}')
+    for path in few:
+        mark = '' if few[path] == many[path] else '  <- 随行数增长'
+        failed = failed or bool(mark)
+        print(f'{path:<40}{few[path]:>8}{many[path]:>8}{mark}')
+    if failed:
+        sys.exit('存在语句数随行数增长的列表页')
+    print('所有列表页的SQL语句数与行数无关')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,170 @@
+# Gunicorn 工作模式压测：用 gunicorn.conf.py 依次以各个 GUNICORN_PROFILE 启动服务，
+# 多个客户端线程并发访问现有的列表页、仪表板，同时有一个线程不停地导出全部缴费记录（慢请求），
+# 统计普通页面的吞吐和延迟。sync-1 为原 Procfile 的默认配置（单个同步 worker）；未安装 gevent 时跳过 gevent。
+# 用法：python -m benchmarks.load_gunicorn [客户端线程数] [每种配置秒数]
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+from benchmarks.common import make_app
+
+# seed_rows 的学生历月账单超过 288 个月会与首月账单重复，这里取较小的行数，另外补充缴费记录让导出足够慢
+ROWS = 250
+EXTRA_PAYMENTS = 30000
+PORT = 18765
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (角色, 页面)
+PAGES = [
+    ('admin', '/admin/dashboard'),
+    ('admin', '/admin/students'),
+    ('admin', '/admin/repairs'),
+    ('admin', '/admin/utility_bills'),
+    ('admin', '/admin/utility_bills/statistics'),
+    ('dorm_manager', '/dorm_manager/repairs'),
+    ('dorm_manager', '/dorm_manager/visitors'),
+    ('student', '/student/my_repairs'),
+    ('student', '/student/my_utility_bills'),
+]
+SLOW_PAGE = ('admin', '/admin/export/payments.csv')
+
+# (名称, 环境变量)
+PROFILES = [
+    ('sync-1', {'GUNICORN_PROFILE': 'sync', 'WEB_CONCURRENCY': '1'}),
+    ('sync', {'GUNICORN_PROFILE': 'sync'}),
+    ('gthread', {'GUNICORN_PROFILE': 'gthread'}),
+    ('gevent', {'GUNICORN_PROFILE': 'gevent'}),
+]
+
+
+def prepare(database_url):
+    """生成测试数据，返回各角色的会话 Cookie"""
+    from benchmarks.check_query_counts import seed_rows
+    app = make_app(database_url)
+    from app import db
+    from app.models.models import Payment
+    with app.app_context():
+        users = seed_rows(ROWS)
+        payments = db.session.query(Payment.bill_id, Payment.student_id).all()
+        db.session.execute(Payment.__table__.insert(), [
+            {'bill_id': bill_id, 'student_id': student_id, 'amount': 1, 'payment_method': 'cash',
+             'payment_date': datetime(2024, 1, 1), 'payment_status': 'success'}
+            for bill_id, student_id in (payments[i % len(payments)] for i in range(EXTRA_PAYMENTS))])
+        db.session.commit()
+    serializer = app.session_interface.get_signing_serializer(app)
+    name = app.config['SESSION_COOKIE_NAME']
+    return {role: f'{name}={serializer.dumps({"_user_id": str(user_id), "_fresh": True})}'
+            for role, user_id in users.items()}
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def fetch(cookie, path):
+    request = urllib.request.Request(f'http://127.0.0.1:{PORT}{path}', headers={'Cookie': cookie})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.read()
+        return response.status
+
+
+def load(cookies, clients, duration):
+    """返回 (普通页面延迟列表, 慢请求次数, 错误数)"""
+    latencies, errors = [], []
+    slow_done = [0]
+    stop = time.time() + duration
+    lock = threading.Lock()
+
+    def client(index):
+        i = index
+        while time.time() < stop:
+            role, path = PAGES[i % len(PAGES)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                fetch(cookies[role], path)
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    def slow_client():
+        role, path = SLOW_PAGE
+        while time.time() < stop:
+            try:
+                fetch(cookies[role], path)
+                slow_done[0] += 1
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=slow_client))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, slow_done[0], errors
+
+
+def run_profile(name, env, database_url, cookies, clients, duration, workdir):
+    if env['GUNICORN_PROFILE'] == 'gevent' and importlib.util.find_spec('gevent') is None:
+        print(f'--- {name}：未安装 gevent，跳过 ---')
+        return
+    server_env = dict(os.environ, DATABASE_URL=database_url, SLOW_QUERY_MS='', PORT=str(PORT),
+                      PYTHONPATH=ROOT, GUNICORN_ACCESS_LOG='', **env)
+    # 在临时目录中启动（run.py 会在当前目录创建 instance 目录）
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'run:app'],
+        cwd=workdir, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        if not wait_for_port(PORT):
+            print(f'--- {name}：启动失败 ---')
+            print(server.stderr.read().decode(errors='replace')[-2000:])
+            return
+        # 预热：每个页面访问一次
+        for role, path in PAGES + [SLOW_PAGE]:
+            fetch(cookies[role], path)
+        latencies, slow_done, errors = load(cookies, clients, duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    print(f'--- {name}：{clients} 个客户端 + 1 个导出，{duration}s ---')
+    print(f'  普通页面 {len(latencies) / duration:.1f} 次/秒，中位数 {statistics.median(latencies or [0]) * 1000:.0f}ms，'
+          f'P95 {p95 * 1000:.0f}ms，最慢 {(latencies[-1] if latencies else 0) * 1000:.0f}ms')
+    print(f'  导出完成 {slow_done} 次，错误 {len(errors)} 次')
+
+
+def main(clients=8, duration=10):
+    fd, path = tempfile.mkstemp(prefix='dorm_load_', suffix='.db')
+    os.close(fd)
+    database_url = 'sqlite:///' + path
+    cookies = prepare(database_url)
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, env in PROFILES:
+            run_profile(name, env, database_url, cookies, clients, duration, workdir)
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,187 @@
+# 宿舍人数并发压力测试（多线程，每个线程独立的数据库连接）
+# 1. 计数：多个线程反复对同一批宿舍入住/退宿并逐次提交，最终人数必须等于成功次数之差（无丢失更新）；
+#    加 --legacy 时改用原来在 Python 中读出、加减再写回的做法作对照
+# 2. 超员：多个线程同时批准调入同一间宿舍的申请（走宿管审批接口），批准数不得超过空位，
+#    宿舍人数必须与实际住户数一致
+# 用法：python -m benchmarks.stress_occupancy [线程数] [每线程操作数] [--legacy]
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import make_app, seed_dormitories, seed_students
+
+DORMS = 4
+CAPACITY = 4
+
+
+def run_threads(count, target):
+    """启动 count 个线程执行 target(线程序号)，全部就绪后同时开始，返回各线程的返回值"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = []
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target(index)
+        except Exception as exc:  # 记录后在主线程报告
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def stress_counter(app, threads, operations, legacy):
+    """返回 (宿舍ID -> 期望人数, 宿舍ID -> 实际人数)"""
+    from app import db
+    from app.models.models import Dormitory
+    from app.services.occupancy import check_in, check_out
+
+    with app.app_context():
+        dorm_ids = [dorm_id for (dorm_id,) in db.session.query(Dormitory.id).order_by(Dormitory.id).limit(DORMS)]
+        # 容量足够大，只检验计数是否丢失
+        db.session.query(Dormitory).filter(Dormitory.id.in_(dorm_ids)).update(
+            {'capacity': threads * operations, 'current_occupancy': 0}, synchronize_session=False)
+        db.session.commit()
+
+    def work(index):
+        rnd = random.Random(index)
+        delta = dict.fromkeys(dorm_ids, 0)
+        with app.app_context():
+            for _ in range(operations):
+                dorm_id = rnd.choice(dorm_ids)
+                step = 1 if rnd.random() < 0.7 else -1
+                if legacy:
+                    dorm = db.session.get(Dormitory, dorm_id)
+                    if step < 0 and dorm.current_occupancy <= 0:
+                        db.session.rollback()
+                        continue
+                    dorm.current_occupancy += step
+                elif step > 0:
+                    check_in(dorm_id)
+                elif not check_out(dorm_id):
+                    # 人数已为 0，未减
+                    db.session.rollback()
+                    continue
+                db.session.commit()
+                delta[dorm_id] += step
+        return delta
+
+    deltas = run_threads(threads, work)
+    expected = {dorm_id: sum(delta[dorm_id] for delta in deltas) for dorm_id in dorm_ids}
+    with app.app_context():
+        actual = dict(db.session.query(Dormitory.id, Dormitory.current_occupancy).filter(Dormitory.id.in_(dorm_ids)))
+    return expected, actual
+
+
+def stress_approvals(app, threads, applicants, exclude):
+    """applicants 个学生同时申请调入同一间空宿舍，threads 个宿管线程并发批准；返回检查结果
+
+    exclude 为计数测试用过的宿舍（人数与住户无关），不参与本项测试。
+    """
+    from app import db
+    from app.models.models import User, Student, Dormitory, DormManager, DormChangeRequest
+
+    with app.app_context():
+        dorms = Dormitory.query.filter(Dormitory.gender == '男', ~Dormitory.id.in_(exclude))
+        target = dorms.order_by(Dormitory.id.desc()).first()
+        target.capacity, target.current_occupancy = CAPACITY, 0
+        students = (Student.query.filter(Student.gender == '男', Student.dorm_id.is_(None))
+                    .order_by(Student.id).limit(applicants).all())
+        sources = dorms.filter(Dormitory.id != target.id).all()
+        for i, student in enumerate(students):
+            source = sources[i % len(sources)]
+            source.capacity = applicants
+            source.current_occupancy = (source.current_occupancy or 0) + 1
+            student.dorm_id = source.id
+        db.session.flush()
+        request_ids = []
+        for student in students:
+            change = DormChangeRequest(student_id=student.id, current_dorm_id=student.dorm_id,
+                                       target_dorm_id=target.id, reason='压力测试', status='pending')
+            db.session.add(change)
+            db.session.flush()
+            request_ids.append(change.id)
+        manager_users = []
+        for i in range(threads):
+            user = User(username=f'stress_manager_{i}', password='x', role='dorm_manager')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(DormManager(user_id=user.id, name=f'宿管{i}', phone='1', responsible_building=target.building))
+            manager_users.append(user.id)
+        db.session.commit()
+        target_id = target.id
+        involved = [target_id] + [source.id for source in sources]
+
+    def work(index):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(manager_users[index])
+            session['_fresh'] = True
+        # 每个线程都尝试批准全部申请（顺序不同），模拟多名宿管同时处理
+        order = request_ids[:]
+        random.Random(index).shuffle(order)
+        for request_id in order:
+            response = client.post(f'/dorm_manager/approve_dorm_change/{request_id}')
+            assert response.status_code == 302, f'审批返回 {response.status_code}'
+
+    run_threads(threads, work)
+    with app.app_context():
+        approved = DormChangeRequest.query.filter(DormChangeRequest.id.in_(request_ids),
+                                                  DormChangeRequest.status == 'approved').count()
+        occupancy = db.session.get(Dormitory, target_id).current_occupancy
+        residents = Student.query.filter_by(dorm_id=target_id).count()
+        # 调出、调入的宿舍：人数字段与实际住户数一致
+        mismatched = [dorm.id for dorm in Dormitory.query.filter(Dormitory.id.in_(involved))
+                      if (dorm.current_occupancy or 0) != Student.query.filter_by(dorm_id=dorm.id).count()]
+    return approved, occupancy, residents, mismatched
+
+
+def main(threads=8, operations=200, legacy=False):
+    from flask_login import LoginManager
+    from app import db
+    from app.models.models import User
+
+    app = make_app()
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    with app.app_context():
+        seed_dormitories(40)
+        seed_students(200)
+
+    failed = False
+    start = time.perf_counter()
+    expected, actual = stress_counter(app, threads, operations, legacy)
+    lost = {dorm_id: expected[dorm_id] - actual[dorm_id] for dorm_id in expected if expected[dorm_id] != actual[dorm_id]}
+    print(f'计数：{threads} 线程 x {operations} 次入住/退宿（{"原读改写" if legacy else "原子更新"}），'
+          f'{time.perf_counter() - start:.2f}s')
+    print(f'  期望人数 {expected}')
+    print(f'  实际人数 {actual}')
+    if lost:
+        failed = True
+        print(f'  丢失更新：{lost}')
+
+    if not legacy:
+        start = time.perf_counter()
+        approved, occupancy, residents, mismatched = stress_approvals(app, threads, CAPACITY * 5, exclude=list(expected))
+        print(f'超员：{CAPACITY * 5} 个申请调入容量 {CAPACITY} 的宿舍，{threads} 个宿管并发批准，'
+              f'{time.perf_counter() - start:.2f}s')
+        print(f'  批准 {approved}，宿舍人数 {occupancy}，实际住户 {residents}，人数不一致的宿舍 {len(mismatched)} 间')
+        if not (approved == occupancy == residents <= CAPACITY) or mismatched:
+            failed = True
+
+    if failed:
+        sys.exit('并发测试失败')
+    print('并发测试通过：无丢失更新、无超员')
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    main(*[int(arg) for arg in args[:2]], legacy='--legacy' in sys.argv)
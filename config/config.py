@@ -7,6 +7,42 @@ class Config:
     # 使用SQLite数据库，适合云部署
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), '../instance/database.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 数据库连接配置：default 为默认设置；production 在 SQLite 上启用 WAL、busy_timeout 等 PRAGMA
+    # 并设置连接池参数（见 app/services/database_profile.py），多 worker 部署时使用
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'default')
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', '10'))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', '20'))
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', '30'))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', '1800'))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '15000'))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '65536'))
+    # 读写分离：开启后 GET/HEAD 请求的查询走只读引擎（见 app/services/db_routing.py）；
+    # READ_DATABASE_URL 为只读副本地址，不设置且主库为 SQLite 文件时以只读方式打开同一文件
+    DATABASE_READ_ROUTING = os.environ.get('DATABASE_READ_ROUTING', '0') == '1'
+    SQLALCHEMY_READ_DATABASE_URI = os.environ.get('READ_DATABASE_URL')
+    # 写入后多少秒内同一用户的请求仍走主库，保证读到自己刚写入的数据
+    READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+    # 单个请求允许执行的SQL语句数上限，超出时请求报错（测试时用于发现 N+1 查询，默认不检查）
+    SQL_STATEMENT_BUDGET = int(os.environ['SQL_STATEMENT_BUDGET']) if os.environ.get('SQL_STATEMENT_BUDGET') else None
+    # 请求性能指标采集（/admin/metrics）；METRICS_TOKEN 供 Prometheus 抓取时以 Bearer 令牌访问
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # 多 worker 汇总指标用的目录（见 app/services/metrics.py），gunicorn 启动时自动创建；不设置时只统计当前进程
+    METRICS_DIR = os.environ.get('METRICS_DIR') or None
+    # 慢查询阈值（毫秒，设为空字符串关闭）与后台保留的最近慢查询条数
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200')) if os.environ.get('SLOW_QUERY_MS', '200') != '' else None
+    SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '100'))
+    # 宿管仪表板实时推送（见 app/services/live_feed.py）：事件总线在进程内，且每条连接长期占用一个 worker 连接，
+    # 只在单个 gevent worker 时开启（GUNICORN_PROFILE=gevent 且 WEB_CONCURRENCY=1），LIVE_FEED=0 可关闭；
+    # 未开启时推送接口返回 204，仪表板需手动刷新
+    LIVE_FEED_ENABLED = (os.environ.get('LIVE_FEED', '1') != '0' and os.environ.get('GUNICORN_PROFILE') == 'gevent'
+                         and os.environ.get('WEB_CONCURRENCY') == '1')
+    # 每个 worker 同时保持的推送连接数上限，超出的页面同样退回手动刷新
+    LIVE_FEED_MAX_STREAMS = int(os.environ.get('LIVE_FEED_MAX_STREAMS', '500'))
+    # 每条连接最长保持的秒数（须低于 gunicorn 超时，之后浏览器自动重连）与心跳间隔
+    LIVE_FEED_STREAM_SECONDS = float(os.environ.get('LIVE_FEED_STREAM_SECONDS', '50'))
+    LIVE_FEED_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_FEED_HEARTBEAT_SECONDS', '15'))
     
     # 模板和静态文件配置
     TEMPLATES_AUTO_RELOAD = True
@@ -0,0 +1,127 @@
+# Gunicorn 生产配置（gunicorn 启动时自动读取当前目录下的 gunicorn.conf.py）
+# 用法：gunicorn run:app，按 GUNICORN_PROFILE 选择工作模式：
+# - gthread（默认）：每个 worker 多个线程，一个慢页面只占用一个线程，不会挡住其他用户；
+#   数据库操作会释放 GIL，适合本项目这种以数据库查询为主的请求。
+# - gevent：协程 worker，适合大量长连接/慢客户端；需要另外安装 gevent（pip install gevent）。
+#   注意 SQLite 查询在 C 扩展中执行，期间不会切换协程，慢查询仍会阻塞同一 worker 的其他请求。
+#   宿管仪表板的实时推送（SSE）每个打开的页面占一个连接：gthread 下占一个线程，gevent 下只占一个协程；
+#   推送总线在进程内，所以只在 GUNICORN_PROFILE=gevent 且 WEB_CONCURRENCY=1 时开启（见 app/services/live_feed.py）。
+# - sync：gunicorn 默认的单线程 worker，仅用于对比。
+# worker 数、线程数默认按 CPU 核数计算，均可用环境变量覆盖（WEB_CONCURRENCY、GUNICORN_THREADS 等）。
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROFILES = ('gthread', 'gevent', 'sync')
+profile = os.environ.get('GUNICORN_PROFILE', 'gthread')
+if profile not in PROFILES:
+    raise RuntimeError(f'未知的 GUNICORN_PROFILE={profile}，可选：{"、".join(PROFILES)}')
+
+if profile == 'gevent':
+    try:
+        from gevent import monkey
+    except ImportError:
+        raise RuntimeError('GUNICORN_PROFILE=gevent 需要先安装 gevent：pip install gevent')
+    # 预加载应用时，必须在导入应用（以及其中的 threading、socket）之前打补丁
+    monkey.patch_all()
+
+cpu_count = multiprocessing.cpu_count()
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+bind = os.environ.get('GUNICORN_BIND') or f'0.0.0.0:{os.environ.get("PORT", "8000")}'
+
+if profile == 'gthread':
+    worker_class = 'gthread'
+    workers = _env_int('WEB_CONCURRENCY', cpu_count + 1)
+    threads = _env_int('GUNICORN_THREADS', 4)
+elif profile == 'gevent':
+    worker_class = 'gevent'
+    workers = _env_int('WEB_CONCURRENCY', cpu_count + 1)
+    worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+else:
+    worker_class = 'sync'
+    workers = _env_int('WEB_CONCURRENCY', cpu_count * 2 + 1)
+
+# 在主进程中导入应用一次（fork 出的 worker 共享已导入的代码页，启动更快）。
+# 预加载时 HUP 只会从主进程中已导入的应用重新 fork worker，不会加载修改后的代码，
+# 更新代码须完整重启 gunicorn；依赖 HUP 平滑重载的部署请设置 GUNICORN_PRELOAD=0
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+timeout = _env_int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = 30
+keepalive = 5
+# 每个 worker 处理一定数量的请求后重启，避免内存缓慢增长；加随机抖动避免所有 worker 同时重启
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = max_requests // 10
+
+# 心跳文件放在内存文件系统中，磁盘繁忙时 worker 不会被误判为超时
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# 请求指标各 worker 写到同一目录、抓取时合并（见 app/services/metrics.py）。
+# 在导入应用之前设置环境变量，HUP 重新读取本文件时沿用同一目录，计数不会清零
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(
+        prefix='dorm-metrics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.environ['_METRICS_DIR_CREATED'] = '1'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def _engines(app):
+    from app import db
+    with app.app_context():
+        engines = list(db.engines.values())
+    read_engine = app.extensions.get('db_read_engine')
+    if read_engine is not None:
+        engines.append(read_engine)
+    return engines
+
+
+def on_starting(server):
+    """主进程启动时（每台主机一次）确认数据库已建表：SQLite 文件在本机，部署平台的 release 阶段建不到这里。
+    已有库时只补建后来新增的表；没有管理员且未设置 ADMIN_PASSWORD 时拒绝启动。GUNICORN_INIT_DB=0 关闭。
+    在子进程中执行 flask ensure-db：主进程不导入应用，GUNICORN_PRELOAD=0 时 HUP 仍能加载新代码"""
+    if os.environ.get('GUNICORN_INIT_DB', '1') == '0':
+        return
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'ensure-db'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        _remove_metrics_dir()
+        raise RuntimeError(f'flask --app run ensure-db 失败（退出码 {result.returncode}），gunicorn 未启动')
+
+
+def worker_exit(server, worker):
+    """worker 退出前写出最后一批请求指标"""
+    from app.services.metrics import registry
+    registry.dump()
+
+
+def _remove_metrics_dir():
+    if os.environ.get('_METRICS_DIR_CREATED'):
+        shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def on_exit(server):
+    _remove_metrics_dir()
+
+
+def post_fork(server, worker):
+    """预加载时主进程里已经建立的数据库连接被 fork 复制给了每个 worker，
+    同一个连接被多个进程同时使用会损坏数据，worker 启动时丢弃继承来的连接池（不关闭，主进程仍持有）"""
+    if not preload_app:
+        return
+    from run import app
+    for engine in _engines(app):
+        engine.dispose(close=False)
+    server.log.info('worker %s 已重置数据库连接池（%s）', worker.pid, profile)
@@ -1,7 +1,6 @@
-from app import create_app, db
+from app import create_app
 from flask_login import LoginManager
-from app.models.models import User
-import os
+from app.services import identity
 
 app = create_app()
 
@@ -12,28 +11,21 @@ login_manager.login_view = 'main.login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # 用户和角色档案一次查询并在进程内缓存（见 app/services/identity.py）
+    return identity.load_user(user_id)
 
-# 确保instance目录存在
-if not os.path.exists('instance'):
-    os.makedirs('instance')
-
-# 创建数据库表
-with app.app_context():
-    db.create_all()
-    # 检查并创建默认超级管理员
-    from app.models.models import User
-    from werkzeug.security import generate_password_hash
-    admin = User.query.filter_by(username='123').first()
-    if not admin:
-        admin = User(
-            username='123',
-            password=generate_password_hash('123'),
-            role='admin'
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print('默认超级管理员创建成功：账号123，密码123')
+# 建表和创建默认管理员不在导入时执行（每个 worker 启动都会重复）：
+# - gunicorn 启动时主进程检查一次（flask --app run ensure-db），还没有表时自动建表；
+#   设置环境变量 ADMIN_PASSWORD 时同时创建管理员，没有管理员又未设置时拒绝启动
+# - 也可以在运行 web 进程的主机上手动执行（SQLite 文件必须在这台主机上）：
+#     flask --app run init-db
+#     flask --app run create-admin
 
 if __name__ == '__main__':
+    # 本地开发直接运行时自动建表并创建默认超级管理员
+    from app.services.bootstrap import init_database, create_admin, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD
+    with app.app_context():
+        init_database()
+        if create_admin():
+            print(f'默认超级管理员创建成功：账号{DEFAULT_ADMIN_USERNAME}，密码{DEFAULT_ADMIN_PASSWORD}')
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file